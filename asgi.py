@@ -0,0 +1,20 @@
+"""ASGI entry point, e.g. `ASYNC_VIEWS=true uvicorn asgi:app --workers 4`."""
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from webapp import create_app
+
+
+class ThreadPoolWsgiToAsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs every request on one shared thread by default, which serializes the app and
+    # deadlocks when an async view calls back into the event loop; requests get a thread each here
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__["run_wsgi_app"].func, thread_sensitive=False)
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolWsgiToAsgiInstance(self.wsgi_application)(scope, receive, send)
+
+
+flask_app = create_app()
+app = ThreadPoolWsgiToAsgi(flask_app)
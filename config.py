@@ -16,18 +16,92 @@ class Config(object):
     else:
         SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(BASEDIR, "instance/app.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool, sized per worker: every gunicorn thread can hold one connection, plus a few
+    # overflow connections for bursts. DB_MAX_CONNECTIONS caps the total across all workers.
+    WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", default=1))
+    GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", default=1))
+    DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", default=0))
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", default=GUNICORN_THREADS))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", default=max(2, GUNICORN_THREADS)))
+    DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", default=10))
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", default=1800))
+    DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", default="false").lower() in ("1", "true", "yes")
+    # SQLite pragmas applied to every new connection
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", default="WAL")
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", default="NORMAL")
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", default=5000))
+    # Watchlist pagination
+    MOVIES_PER_PAGE = int(os.environ.get("MOVIES_PER_PAGE", default=50))
+    MAX_MOVIES_PER_PAGE = int(os.environ.get("MAX_MOVIES_PER_PAGE", default=200))
+    # Watchlist facets: values listed for the tag, cast and director facets, and how long the counts are cached
+    FACET_VALUES_LIMIT = int(os.environ.get("FACET_VALUES_LIMIT", default=10))
+    FACET_CACHE_SIZE = int(os.environ.get("FACET_CACHE_SIZE", default=1024))
+    FACET_CACHE_TTL = float(os.environ.get("FACET_CACHE_TTL", default=300))
+    # Directors, tags and actors listed on the statistics page
+    STATS_TOP_VALUES = int(os.environ.get("STATS_TOP_VALUES", default=10))
+    # Similar movies kept per movie and listed on its page
+    SIMILAR_MOVIES = int(os.environ.get("SIMILAR_MOVIES", default=5))
+    # Response cache: "lru" (per worker), "sqlite" (shared by the workers of a host) or "none"
+    RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", default="lru")
+    RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", default=1024))
+    RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", default=os.path.join(BASEDIR, "instance/cache.db"))
+    # Users loaded by Flask-Login are cached per worker for USER_CACHE_TTL seconds (0 disables the cache)
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", default=4096))
+    USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", default=30))
+    # Check for the tables before the first request instead of in `create_app`, so that workers start faster
+    DEFER_SCHEMA_CHECK = os.environ.get("DEFER_SCHEMA_CHECK", default="false").lower() in ("1", "true", "yes")
+    # Seconds the status page reuses the result of its table checks
+    SCHEMA_CHECK_TTL = float(os.environ.get("SCHEMA_CHECK_TTL", default=10))
+    # Password hashing: "pbkdf2" or "scrypt"; hashes made with another scheme or cost are upgraded at login
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", default="pbkdf2")
+    PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get("PASSWORD_PBKDF2_ITERATIONS", default=260000))
+    PASSWORD_SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", default=2**15))
+    PASSWORD_SCRYPT_R = int(os.environ.get("PASSWORD_SCRYPT_R", default=8))
+    PASSWORD_SCRYPT_P = int(os.environ.get("PASSWORD_SCRYPT_P", default=1))
+    # Hash passwords in PASSWORD_HASH_WORKERS processes (0 hashes in the request thread); when the
+    # workers and PASSWORD_HASH_QUEUE_SIZE waiting slots are all taken, logins get a 503
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", default=0))
+    PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get("PASSWORD_HASH_QUEUE_SIZE", default=8))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT", default=10))
+    PASSWORD_HASH_RETRY_AFTER = int(os.environ.get("PASSWORD_HASH_RETRY_AFTER", default=1))
+    # Serve the watchlist, movie and status pages with their async variants (see asgi.py)
+    ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", default="false").lower() in ("1", "true", "yes")
+    # Largest number of items accepted by the batch endpoints of the JSON API
+    API_MAX_BATCH_SIZE = int(os.environ.get("API_MAX_BATCH_SIZE", default=500))
+    # Per-endpoint latency and SQL histograms at /metrics, optionally also sent as a Server-Timing header
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", default="true").lower() in ("1", "true", "yes")
+    SERVER_TIMING_HEADER = os.environ.get("SERVER_TIMING_HEADER", default="false").lower() in ("1", "true", "yes")
+    # Warn when one statement runs more than this many times in a request (0 switches the check off)
+    QUERY_REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", default=0))
+    # Watchlist export
+    EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", default=1000))
     # OAuth
     OAUTHLIB_INSECURE_TRANSPORT = True
     # Logging
     LOG_WITH_GUNICORN = os.environ.get("LOG_WITH_GUNICORN", default=False)
+    LOG_FILE_MAX_BYTES = int(os.environ.get("LOG_FILE_MAX_BYTES", default=10 * 1024 * 1024))
+    LOG_FILE_BACKUP_COUNT = int(os.environ.get("LOG_FILE_BACKUP_COUNT", default=5))
+    # Async mode: requests only queue JSON records, a listener thread writes them. Records up to
+    # LOG_SAMPLE_MAX_LEVEL are sampled, keeping one in LOG_SAMPLE_EVERY from each call site.
+    LOG_ASYNC = os.environ.get("LOG_ASYNC", default="false").lower() in ("1", "true", "yes")
+    LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", default=10000))
+    LOG_SAMPLE_EVERY = int(os.environ.get("LOG_SAMPLE_EVERY", default=1))
+    LOG_SAMPLE_MAX_LEVEL = os.environ.get("LOG_SAMPLE_MAX_LEVEL", default="INFO")
 
 
 class ProductionConfig(Config):
     FLASK_ENV = "production"
+    # Connections to a networked database can be dropped by the server or a proxy while idle
+    DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", default="true").lower() in ("1", "true", "yes")
+    LOG_ASYNC = os.environ.get("LOG_ASYNC", default="true").lower() in ("1", "true", "yes")
+    LOG_SAMPLE_EVERY = int(os.environ.get("LOG_SAMPLE_EVERY", default=10))
+    DEFER_SCHEMA_CHECK = os.environ.get("DEFER_SCHEMA_CHECK", default="true").lower() in ("1", "true", "yes")
 
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    SERVER_TIMING_HEADER = True
+    QUERY_REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", default=5))
 
 
 class TestingConfig(Config):
@@ -36,3 +110,9 @@ class TestingConfig(Config):
         "TEST_DATABASE_URI", default="sqlite:///" + os.path.join(BASEDIR, "instance/test.db")
     )
     WTF_CSRF_ENABLED = False
+    # Tests change the database behind the routes' back, so caching is switched on per test
+    RESPONSE_CACHE_BACKEND = "none"
+    FACET_CACHE_TTL = 0
+    # Cheap hashes keep the tests fast; the schemes are exercised all the same
+    PASSWORD_PBKDF2_ITERATIONS = 1000
+    PASSWORD_SCRYPT_N = 2**10
@@ -0,0 +1,77 @@
+"""baseline schema
+
+Revision ID: 3f1a2c9d4b10
+Revises: 
+Create Date: 2026-10-18 13:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3f1a2c9d4b10"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("email", sa.String(length=100), nullable=False),
+        sa.Column("password_hashed", sa.String(length=300), nullable=False),
+        sa.Column("registered_on", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_user_email", "user", ["email"], unique=True)
+    op.create_table(
+        "movie",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("title", sa.String(length=100), nullable=False),
+        sa.Column("director", sa.String(length=100), nullable=False),
+        sa.Column("year", sa.Integer(), nullable=False),
+        sa.Column("last_seen", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("rating", sa.Integer(), nullable=False),
+        sa.Column("description", sa.String(length=300), nullable=True),
+        sa.Column("video_link", sa.String(length=300), nullable=True),
+        sa.Column("userId", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["userId"], ["user.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_movie_title", "movie", ["title"], unique=False)
+    op.create_table(
+        "tag",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("tag", sa.String(length=100), nullable=True),
+        sa.Column("movieId", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["movieId"], ["movie.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "cast",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("actor", sa.String(length=100), nullable=True),
+        sa.Column("movieId", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["movieId"], ["movie.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "series",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("series", sa.String(length=100), nullable=True),
+        sa.Column("movieId", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["movieId"], ["movie.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade():
+    op.drop_table("series")
+    op.drop_table("cast")
+    op.drop_table("tag")
+    op.drop_index("ix_movie_title", table_name="movie")
+    op.drop_table("movie")
+    op.drop_index("ix_user_email", table_name="user")
+    op.drop_table("user")
@@ -0,0 +1,28 @@
+"""user watchlist version
+
+Revision ID: 5b9d3e6f0c21
+Revises: c2d5f8e1a7b4
+Create Date: 2026-10-18 14:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5b9d3e6f0c21"
+down_revision = "c2d5f8e1a7b4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("user") as batch_op:
+        batch_op.add_column(sa.Column("watchlist_version", sa.Integer(), nullable=False, server_default="0"))
+        batch_op.add_column(sa.Column("watchlist_modified", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("user") as batch_op:
+        batch_op.drop_column("watchlist_modified")
+        batch_op.drop_column("watchlist_version")
@@ -0,0 +1,31 @@
+"""per-user movie indexes
+
+Revision ID: 8c4e7b21a9f3
+Revises: 3f1a2c9d4b10
+Create Date: 2026-10-18 13:25:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "8c4e7b21a9f3"
+down_revision = "3f1a2c9d4b10"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_movie_userId_id", "movie", ["userId", "id"], unique=False)
+    op.create_index("ix_movie_userId_title", "movie", ["userId", "title"], unique=False)
+    op.create_index("ix_tag_movieId", "tag", ["movieId"], unique=False)
+    op.create_index("ix_cast_movieId", "cast", ["movieId"], unique=False)
+    op.create_index("ix_series_movieId", "series", ["movieId"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_series_movieId", table_name="series")
+    op.drop_index("ix_cast_movieId", table_name="cast")
+    op.drop_index("ix_tag_movieId", table_name="tag")
+    op.drop_index("ix_movie_userId_title", table_name="movie")
+    op.drop_index("ix_movie_userId_id", table_name="movie")
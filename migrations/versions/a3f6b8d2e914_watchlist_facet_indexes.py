@@ -0,0 +1,29 @@
+"""watchlist facet indexes
+
+Revision ID: a3f6b8d2e914
+Revises: e7a4c1d9b352
+Create Date: 2026-10-18 15:40:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "a3f6b8d2e914"
+down_revision = "e7a4c1d9b352"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_movie_userId_director", "movie", ["userId", "director"], unique=False)
+    op.create_index("ix_movie_userId_year", "movie", ["userId", "year"], unique=False)
+    op.create_index("ix_movie_userId_rating", "movie", ["userId", "rating"], unique=False)
+    op.create_index("ix_movie_userId_last_seen", "movie", ["userId", "last_seen"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_movie_userId_last_seen", table_name="movie")
+    op.drop_index("ix_movie_userId_rating", table_name="movie")
+    op.drop_index("ix_movie_userId_year", table_name="movie")
+    op.drop_index("ix_movie_userId_director", table_name="movie")
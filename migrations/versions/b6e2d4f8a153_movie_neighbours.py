@@ -0,0 +1,38 @@
+"""similar movies neighbour index
+
+Revision ID: b6e2d4f8a153
+Revises: f1c7a9e3b582
+Create Date: 2026-10-18 19:40:00.000000
+
+The index starts empty; run `flask rebuild-neighbours` once after upgrading to fill it from the
+existing movies.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b6e2d4f8a153"
+down_revision = "f1c7a9e3b582"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "movie_neighbour",
+        sa.Column("movieId", sa.Integer(), nullable=False),
+        sa.Column("rank", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("neighbourId", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["movieId"], ["movie.id"]),
+        sa.ForeignKeyConstraint(["neighbourId"], ["movie.id"]),
+        sa.PrimaryKeyConstraint("movieId", "rank"),
+    )
+    op.create_index("ix_movie_neighbour_neighbourId", "movie_neighbour", ["neighbourId"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_movie_neighbour_neighbourId", table_name="movie_neighbour")
+    op.drop_table("movie_neighbour")
@@ -0,0 +1,42 @@
+"""movie full-text search index
+
+Revision ID: c2d5f8e1a7b4
+Revises: 8c4e7b21a9f3
+Create Date: 2026-10-18 14:05:00.000000
+
+Run `flask reindex-search` after upgrading to index the existing movies.
+
+"""
+from alembic import op
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS movie_search USING fts5(
+        title, director, description, actors, tags, "userId" UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+]
+POSTGRES_DDL = [
+    """CREATE TABLE IF NOT EXISTS movie_search (
+        "movieId" INTEGER PRIMARY KEY REFERENCES movie (id) ON DELETE CASCADE,
+        "userId" INTEGER NOT NULL,
+        document TSVECTOR NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_movie_search_document ON movie_search USING GIN (document)",
+    'CREATE INDEX IF NOT EXISTS ix_movie_search_userId ON movie_search ("userId")',
+]
+
+
+# revision identifiers, used by Alembic.
+revision = "c2d5f8e1a7b4"
+down_revision = "8c4e7b21a9f3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    statements = POSTGRES_DDL if op.get_bind().dialect.name == "postgresql" else SQLITE_DDL
+    for statement in statements:
+        op.execute(statement)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS movie_search")
@@ -0,0 +1,32 @@
+"""watchlist sort indexes
+
+Revision ID: d8b2e5a1c376
+Revises: a3f6b8d2e914
+Create Date: 2026-10-18 16:20:00.000000
+
+The per-user title, year, rating and last_seen indexes gain the id column, the tiebreaker of
+every sort order, so that a sorted page is read in index order without sorting.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "d8b2e5a1c376"
+down_revision = "a3f6b8d2e914"
+branch_labels = None
+depends_on = None
+
+SORT_COLUMNS = ["title", "year", "rating", "last_seen"]
+
+
+def upgrade():
+    for column in SORT_COLUMNS:
+        op.create_index(f"ix_movie_userId_{column}_id", "movie", ["userId", column, "id"], unique=False)
+        op.drop_index(f"ix_movie_userId_{column}", table_name="movie")
+
+
+def downgrade():
+    for column in reversed(SORT_COLUMNS):
+        op.create_index(f"ix_movie_userId_{column}", "movie", ["userId", column], unique=False)
+        op.drop_index(f"ix_movie_userId_{column}_id", table_name="movie")
@@ -0,0 +1,97 @@
+"""interned tag, person and series vocabularies
+
+Revision ID: e7a4c1d9b352
+Revises: 5b9d3e6f0c21
+Create Date: 2026-10-18 15:10:00.000000
+
+The tag, cast and series rows, which each held their name, become rows of the movie_tag,
+movie_cast and movie_series join tables pointing at the tag, person and series vocabularies.
+The rows keep their ids, and the search documents hold the same names, so the search index does
+not need rebuilding.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e7a4c1d9b352"
+down_revision = "5b9d3e6f0c21"
+branch_labels = None
+depends_on = None
+
+# (table of the old layout, its name column, vocabulary table, join table, join table id column)
+CHILD_TABLES = [
+    ("tag", "tag", "tag", "movie_tag", "tagId"),
+    ("cast", "actor", "person", "movie_cast", "personId"),
+    ("series", "series", "series", "movie_series", "seriesId"),
+]
+
+
+def reset_sequence(table):
+    # Rows copied with their ids leave the Postgres sequence behind
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}")
+
+
+def upgrade():
+    for old_table, _, _, _, _ in CHILD_TABLES:
+        op.rename_table(old_table, f"_{old_table}_old")
+
+    for old_table, old_column, vocabulary, join_table, id_column in CHILD_TABLES:
+        op.create_table(
+            vocabulary,
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("name", sa.String(length=100), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("name"),
+        )
+        op.create_table(
+            join_table,
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("movieId", sa.Integer(), nullable=True),
+            sa.Column(id_column, sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(["movieId"], ["movie.id"]),
+            sa.ForeignKeyConstraint([id_column], [f"{vocabulary}.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(f"ix_{join_table}_movieId", join_table, ["movieId"], unique=False)
+        op.create_index(f"ix_{join_table}_{id_column}_movieId", join_table, [id_column, "movieId"], unique=False)
+
+        op.execute(
+            f'INSERT INTO {vocabulary} (name) SELECT DISTINCT "{old_column}" FROM "_{old_table}_old"'
+            f' WHERE "{old_column}" IS NOT NULL'
+        )
+        op.execute(
+            f'INSERT INTO {join_table} (id, "movieId", "{id_column}")'
+            f' SELECT old.id, old."movieId", {vocabulary}.id FROM "_{old_table}_old" AS old'
+            f' JOIN {vocabulary} ON {vocabulary}.name = old."{old_column}"'
+        )
+        reset_sequence(join_table)
+        op.drop_table(f"_{old_table}_old")
+
+
+def downgrade():
+    for _, _, vocabulary, _, _ in CHILD_TABLES:
+        op.rename_table(vocabulary, f"_{vocabulary}_names")
+
+    for old_table, old_column, vocabulary, join_table, id_column in CHILD_TABLES:
+        op.create_table(
+            old_table,
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column(old_column, sa.String(length=100), nullable=True),
+            sa.Column("movieId", sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(["movieId"], ["movie.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(f"ix_{old_table}_movieId", old_table, ["movieId"], unique=False)
+        op.execute(
+            f'INSERT INTO "{old_table}" (id, "{old_column}", "movieId")'
+            f' SELECT joined.id, names.name, joined."movieId" FROM {join_table} AS joined'
+            f' JOIN "_{vocabulary}_names" AS names ON names.id = joined."{id_column}"'
+        )
+        reset_sequence(f'"{old_table}"')
+        op.drop_table(join_table)
+
+    for _, _, vocabulary, _, _ in CHILD_TABLES:
+        op.drop_table(f"_{vocabulary}_names")
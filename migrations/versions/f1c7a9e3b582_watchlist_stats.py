@@ -0,0 +1,37 @@
+"""watchlist statistics counters
+
+Revision ID: f1c7a9e3b582
+Revises: d8b2e5a1c376
+Create Date: 2026-10-18 17:05:00.000000
+
+The counters start empty; run `flask rebuild-stats` once after upgrading to fill them from the
+existing movies.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f1c7a9e3b582"
+down_revision = "d8b2e5a1c376"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "watchlist_stat",
+        sa.Column("userId", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("key", sa.String(length=100), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["userId"], ["user.id"]),
+        sa.PrimaryKeyConstraint("userId", "kind", "key"),
+    )
+    op.create_index("ix_watchlist_stat_userId_kind_count", "watchlist_stat", ["userId", "kind", "count"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_watchlist_stat_userId_kind_count", table_name="watchlist_stat")
+    op.drop_table("watchlist_stat")
@@ -1,7 +1,9 @@
 import os
 import pytest
-from webapp import create_app, db
+from webapp import create_app, db, response_cache
+from webapp.cache import LRUBackend, NullBackend
 from webapp.models import User, Movie, Tag, Cast, Series
+from webapp.query_budget import QueryBudget
 import multiprocessing
 
 # --------
@@ -84,6 +86,33 @@ def init_database(test_client):
     db.drop_all()
 
 
+@pytest.fixture(scope="function")
+def response_cache_enabled(test_client):
+    response_cache.backend = LRUBackend(maxsize=32)
+    # this is where the testing happens!
+    yield response_cache
+    response_cache.backend = NullBackend()
+
+
+@pytest.fixture(scope="module")
+def async_test_client(test_client):
+    from webapp.async_views import ASYNC_VIEWS, register_async_views
+
+    app = test_client.application
+    sync_views = {endpoint: app.view_functions[endpoint] for endpoint in ASYNC_VIEWS}
+    register_async_views(app)
+
+    yield test_client
+
+    app.view_functions.update(sync_views)
+
+
+@pytest.fixture(scope="function")
+def query_budget():
+    """Usage: `with query_budget(3): test_client.get(...)` fails the test beyond 3 SQL statements."""
+    return QueryBudget
+
+
 @pytest.fixture(scope="function")
 def log_in_default_user(test_client, init_database):
     test_client.post("/auth/login", data={"email": "test@test.com", "password": "testpassword"})
@@ -112,6 +141,19 @@ def cli_test_client():
     yield runner
 
 
+@pytest.fixture(scope="function")
+def cli_database(cli_test_client):
+    with cli_test_client.app.app_context():
+        db.create_all()
+        db.session.add(User(email="cli@test.com", password_plaintext="testpassword"))
+        db.session.commit()
+
+        yield
+
+        db.session.remove()
+        db.drop_all()
+
+
 @pytest.fixture
 def app():
     multiprocessing.set_start_method("fork")
@@ -0,0 +1,104 @@
+"""
+This file (test_api.py) contains the functional tests for the JSON API blueprint.
+"""
+from webapp.models import Movie, Tag
+
+
+def test_api_requires_login(test_client, init_database):
+    response = test_client.get("/api/v1/movies")
+
+    assert response.status_code == 401
+    assert response.json["error"] == "Unauthorized"
+
+
+def test_api_list_movies(test_client, init_database, log_in_default_user):
+    response = test_client.get("/api/v1/movies?per_page=1")
+
+    assert response.status_code == 200
+    assert response.json["movies"][0] == {"id": 1, "title": "Fast Furious 9", "director": "Justin Lin", "year": 2020}
+
+
+def test_api_get_movie(test_client, init_database, log_in_default_user):
+    response = test_client.get("/api/v1/movies/1")
+
+    assert response.status_code == 200
+    assert response.json["title"] == "Fast Furious 9"
+    assert response.json["tags"] == []
+
+
+def test_api_get_movie_of_another_user(test_client, init_database, log_in_second_user):
+    response = test_client.get("/api/v1/movies/1")
+
+    assert response.status_code == 404
+
+
+def test_api_create_movie(test_client, init_database, log_in_default_user):
+    response = test_client.post(
+        "/api/v1/movies",
+        json={"title": "Heat", "director": "Michael Mann", "year": 1995, "cast": ["Al Pacino"], "tags": ["crime"]},
+    )
+
+    assert response.status_code == 201
+    assert response.json["cast"][0]["actor"] == "Al Pacino"
+    assert response.json["tags"][0]["tag"] == "crime"
+    assert Movie.query.get(response.json["id"]).userId == 1
+
+
+def test_api_create_movie_invalid(test_client, init_database, log_in_default_user):
+    response = test_client.post("/api/v1/movies", json={"title": "Heat", "year": "nineteen"})
+
+    assert response.status_code == 422
+    assert {error["loc"][0] for error in response.json["details"]} == {"director", "year"}
+
+
+def test_api_update_movie(test_client, init_database, log_in_default_user):
+    response = test_client.patch("/api/v1/movies/1", json={"description": "Family first", "rating": 4})
+
+    assert response.status_code == 200
+    assert response.json["description"] == "Family first"
+    assert response.json["rating"] == 4
+
+
+def test_api_add_and_delete_cast(test_client, init_database, log_in_default_user):
+    response = test_client.post("/api/v1/movies/1/cast", json={"values": ["Vin Diesel", "Vin Diesel", "John Cena"]})
+    assert response.status_code == 201
+    assert [member["actor"] for member in response.json] == ["Vin Diesel", "John Cena"]
+
+    response = test_client.delete(f"/api/v1/movies/1/cast/{response.json[0]['id']}")
+    assert response.status_code == 204
+    assert [member["actor"] for member in test_client.get("/api/v1/movies/1/cast").json] == ["John Cena"]
+
+
+def test_api_batch_create_tag_and_rate(test_client, init_database, log_in_default_user):
+    response = test_client.post(
+        "/api/v1/movies/batch",
+        json={
+            "movies": [
+                {"title": "Alien", "director": "Ridley Scott", "year": 1979},
+                {"title": "Aliens", "director": "James Cameron", "year": 1986, "series": ["Alien"]},
+            ]
+        },
+    )
+    assert response.status_code == 201
+    ids = [movie["id"] for movie in response.json["movies"]]
+
+    response = test_client.post(
+        "/api/v1/tags/batch",
+        json={"items": [{"movie_id": ids[0], "tags": ["horror"]}, {"movie_id": ids[1], "tags": ["action"]}]},
+    )
+    assert response.status_code == 201
+    assert {tag.tag for tag in Tag.query.filter(Tag.movieId.in_(ids))} == {"horror", "action"}
+
+    response = test_client.patch(
+        "/api/v1/movies/batch", json={"movies": [{"id": ids[0], "rating": 5}, {"id": ids[1], "watched": True}]}
+    )
+    assert response.status_code == 200
+    assert Movie.query.get(ids[0]).rating == 5
+    assert Movie.query.get(ids[1]).last_seen is not None
+
+
+def test_api_batch_rejects_movies_of_another_user(test_client, init_database, log_in_second_user):
+    response = test_client.patch("/api/v1/movies/batch", json={"movies": [{"id": 1, "rating": 1}]})
+
+    assert response.status_code == 404
+    assert Movie.query.get(1).rating != 1
@@ -0,0 +1,56 @@
+"""
+This file (test_async.py) contains the functional tests for the async variants of the
+watchlist, movie detail and status pages.
+"""
+import inspect
+
+from webapp import db
+from webapp.models import Tag
+
+
+def test_async_views_registered(async_test_client):
+    app = async_test_client.application
+
+    for endpoint in ("movie.index", "movie.movie", "auth.status"):
+        assert inspect.iscoroutinefunction(inspect.unwrap(app.view_functions[endpoint]))
+
+
+def test_async_index_page(async_test_client, init_database, log_in_default_user):
+    response = async_test_client.get("/index", follow_redirects=True)
+
+    assert response.status_code == 200
+    assert b"Fast Furious 9" in response.data
+    assert b"Justin Lin" in response.data
+
+
+def test_async_movie_page(async_test_client, init_database, log_in_default_user):
+    db.session.add(Tag("action", 1))
+    db.session.commit()
+
+    response = async_test_client.get("/movie/1")
+
+    assert response.status_code == 200
+    assert b"Fast Furious 9" in response.data
+    assert b"action" in response.data
+
+
+def test_async_movie_page_invalid_movie(async_test_client, init_database, log_in_default_user):
+    response = async_test_client.get("/movie/999")
+
+    assert response.status_code == 404
+
+
+def test_async_index_page_not_modified(async_test_client, init_database, log_in_default_user):
+    async_test_client.get("/index")
+    etag = async_test_client.get("/index").headers["ETag"]
+
+    response = async_test_client.get("/index", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+
+
+def test_async_status_page(async_test_client, init_database):
+    response = async_test_client.get("/auth/status")
+
+    assert response.status_code == 200
+    assert b"Database initialized: True" in response.data
@@ -0,0 +1,165 @@
+"""
+This file (test_cache.py) contains the functional tests for the response cache of the
+watchlist and movie detail pages.
+"""
+import datetime
+
+from werkzeug.http import http_date
+
+from webapp import db, user_cache
+from webapp.models import Movie, User
+
+# Logging in flashes a message and pages showing one are not cached, so every test renders a
+# first page to consume it.
+
+
+def test_index_page_served_from_cache(test_client, init_database, log_in_default_user, response_cache_enabled):
+    test_client.get("/index")
+    hits = response_cache_enabled.hits
+
+    first = test_client.get("/index")
+    second = test_client.get("/index")
+
+    assert first.status_code == second.status_code == 200
+    assert first.data == second.data
+    assert response_cache_enabled.hits == hits + 1
+
+
+def test_cached_page_is_not_refreshed_by_direct_db_writes(
+    test_client, init_database, log_in_default_user, response_cache_enabled
+):
+    test_client.get("/movie/1")
+    test_client.get("/movie/1")
+    Movie.query.get(1).description = "Changed behind the cache"
+    db.session.commit()
+
+    assert b"Changed behind the cache" not in test_client.get("/movie/1").data
+
+
+def test_write_routes_invalidate_cache(test_client, init_database, log_in_default_user, response_cache_enabled):
+    test_client.get("/movie/1")
+    assert b"Not watched yet" in test_client.get("/movie/1").data
+
+    test_client.get("/movie/1/watch")
+
+    response = test_client.get("/movie/1")
+    assert b"Not watched yet" not in response.data
+    assert b"Last watched" in response.data
+
+
+def test_pages_with_flash_messages_are_not_cached(
+    test_client, init_database, log_in_default_user, response_cache_enabled
+):
+    test_client.get("/index")
+    response = test_client.post(
+        "/add", data={"title": "Heat", "director": "Michael Mann", "year": 1995}, follow_redirects=True
+    )
+    assert b"Added new movie (Heat)!" in response.data
+
+    response = test_client.get("/index")
+    assert b"Heat" in response.data
+    assert b"Added new movie (Heat)!" not in response.data
+
+
+def test_cache_is_per_user(test_client, init_database, response_cache_enabled):
+    test_client.post("/auth/login", data={"email": "test@test.com", "password": "testpassword"})
+    test_client.get("/index")
+    assert b"Fast Furious 9" in test_client.get("/index").data
+    test_client.get("/auth/logout")
+
+    test_client.post("/auth/login", data={"email": "test2@test.com", "password": "testpassword"})
+    test_client.get("/index")
+    response = test_client.get("/index")
+    test_client.get("/auth/logout")
+
+    assert b"Fast Furious 9" not in response.data
+
+
+def test_cache_stats(test_client, init_database, response_cache_enabled):
+    response = test_client.get("/auth/status/cache")
+
+    assert response.status_code == 200
+    assert response.json["backend"] == "LRUBackend"
+    assert {"hits", "misses", "hit_ratio"} <= set(response.json)
+
+
+# --------------
+# Conditional GET
+# --------------
+
+
+def backdate_watchlist(user_id=1, seconds=5):
+    """Move the user's last watchlist change into a past second, as Last-Modified is only sent once it is over."""
+    user = User.query.get(user_id)
+    user.watchlist_modified = datetime.datetime.utcnow() - datetime.timedelta(seconds=seconds)
+    db.session.commit()
+    user_cache.invalidate(user_id)
+
+
+def test_index_page_not_modified(test_client, init_database, log_in_default_user):
+    backdate_watchlist()
+    test_client.get("/index")
+    response = test_client.get("/index")
+    assert response.status_code == 200
+    assert response.headers["ETag"].startswith('W/"')
+    assert "Last-Modified" in response.headers
+    assert "private" in response.headers["Cache-Control"]
+
+    response = test_client.get("/index", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_movie_page_not_modified_since(test_client, init_database, log_in_default_user):
+    backdate_watchlist()
+    test_client.get("/movie/1")
+    last_modified = test_client.get("/movie/1").headers["Last-Modified"]
+
+    response = test_client.get("/movie/1", headers={"If-Modified-Since": last_modified})
+
+    assert response.status_code == 304
+
+
+def test_write_in_the_same_second_is_not_modified_since(test_client, init_database, log_in_default_user):
+    test_client.get("/movie/1")
+    test_client.get("/movie/1/3")
+    written = User.query.get(1).watchlist_modified.replace(microsecond=0, tzinfo=datetime.timezone.utc)
+
+    # A page rendered before the write, later in the same second, would carry that second as its date
+    response = test_client.get("/movie/1", headers={"If-Modified-Since": http_date(written)})
+
+    assert response.status_code == 200
+
+
+def test_theme_changes_last_modified(test_client, init_database, log_in_default_user):
+    backdate_watchlist()
+    test_client.get("/index")
+    last_modified = test_client.get("/index").headers["Last-Modified"]
+
+    test_client.get("/toggle-theme?current_page=/index")
+    response = test_client.get("/index", headers={"If-Modified-Since": last_modified})
+    test_client.get("/toggle-theme?current_page=/index")
+
+    assert response.status_code == 200
+
+
+def test_write_routes_change_etag(test_client, init_database, log_in_default_user):
+    test_client.get("/movie/1")
+    etag = test_client.get("/movie/1").headers["ETag"]
+
+    test_client.get("/movie/1/4")
+
+    response = test_client.get("/movie/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_theme_changes_etag(test_client, init_database, log_in_default_user):
+    test_client.get("/index")
+    etag = test_client.get("/index").headers["ETag"]
+
+    test_client.get("/toggle-theme?current_page=/index")
+    response = test_client.get("/index", headers={"If-None-Match": etag})
+    test_client.get("/toggle-theme?current_page=/index")
+
+    assert response.status_code == 200
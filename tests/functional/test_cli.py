@@ -1,6 +1,9 @@
 """
 This file (test_cli.py) contains the functional tests for the CLI (Command-Line Interface) functions.
 """
+import json
+
+from webapp.models import Movie, Cast, Tag
 
 
 def test_initialize_database(cli_test_client):
@@ -12,3 +15,125 @@ def test_initialize_database(cli_test_client):
     output = cli_test_client.invoke(args=["init_db"])
     assert output.exit_code == 0
     assert "Initialized the database!" in output.output
+
+
+def test_import_watchlist_csv(cli_test_client, cli_database, tmp_path):
+    """
+    GIVEN a CSV watchlist export with one invalid row
+    WHEN the 'flask import-watchlist' command is called
+    THEN check the valid rows are imported with their children and the invalid one is skipped
+    """
+    export = tmp_path / "watchlist.csv"
+    export.write_text(
+        "Name,Year,Directors,cast,tags\n"
+        "Heat,1995,Michael Mann,Al Pacino|Robert De Niro,crime|crime\n"
+        "Collateral,2004,Michael Mann,Tom Cruise,\n"
+        "Broken,not a year,Nobody,,\n"
+    )
+
+    output = cli_test_client.invoke(args=["import-watchlist", str(export), "--email", "cli@test.com", "--batch-size", "1"])
+
+    assert output.exit_code == 0
+    assert "Imported 2 movies (1 skipped)" in output.output
+    assert "rows/sec" in output.output
+    heat = Movie.query.filter_by(title="Heat").first()
+    assert heat.director == "Michael Mann"
+    assert heat.year == 1995
+    assert [cast.actor for cast in Cast.query.filter_by(movieId=heat.id)] == ["Al Pacino", "Robert De Niro"]
+    assert [tag.tag for tag in Tag.query.filter_by(movieId=heat.id)] == ["crime"]
+
+
+def test_import_watchlist_jsonl(cli_test_client, cli_database, tmp_path):
+    export = tmp_path / "watchlist.jsonl"
+    export.write_text(json.dumps({"title": "Arrival", "director": "Denis Villeneuve", "year": 2016, "tags": ["sci-fi"]}))
+
+    output = cli_test_client.invoke(args=["import-watchlist", str(export), "--email", "cli@test.com"])
+
+    assert output.exit_code == 0
+    assert "Imported 1 movies (0 skipped)" in output.output
+    assert Movie.query.filter_by(title="Arrival").count() == 1
+
+
+def test_import_watchlist_jsonl_skips_malformed_lines(cli_test_client, cli_database, tmp_path):
+    export = tmp_path / "watchlist.jsonl"
+    export.write_text(
+        json.dumps({"title": "Heat", "director": "Michael Mann", "year": 1995})
+        + '\n{"title": "Broken", "director"\n'
+        + '["list"]\n'
+        + json.dumps({"title": "Collateral", "director": "Michael Mann", "year": 2004})
+    )
+
+    output = cli_test_client.invoke(args=["import-watchlist", str(export), "--email", "cli@test.com", "--batch-size", "2"])
+
+    assert output.exit_code == 0
+    assert "Skipping line 2" in output.output
+    assert "Skipping line 3: expected an object, got list" in output.output
+    assert "Imported 2 movies (2 skipped)" in output.output
+    assert {movie.title for movie in Movie.query} == {"Heat", "Collateral"}
+
+
+def test_import_watchlist_unknown_user(cli_test_client, cli_database, tmp_path):
+    export = tmp_path / "watchlist.csv"
+    export.write_text("title,director,year\n")
+
+    output = cli_test_client.invoke(args=["import-watchlist", str(export), "--email", "nobody@test.com"])
+
+    assert output.exit_code != 0
+    assert "No user registered with the email nobody@test.com" in output.output
+
+
+def test_export_watchlist(cli_test_client, cli_database, tmp_path):
+    """
+    GIVEN a watchlist imported from a JSONL file
+    WHEN the 'flask export-watchlist' command is called
+    THEN check the movies are written back with their children
+    """
+    export = tmp_path / "watchlist.jsonl"
+    export.write_text(json.dumps({"title": "Heat", "director": "Michael Mann", "year": 1995, "cast": ["Al Pacino"]}))
+    cli_test_client.invoke(args=["import-watchlist", str(export), "--email", "cli@test.com"])
+
+    output = cli_test_client.invoke(args=["export-watchlist", "--email", "cli@test.com", "--format", "jsonl"])
+
+    assert output.exit_code == 0
+    record = json.loads(output.output)
+    assert record["title"] == "Heat"
+    assert record["cast"] == ["Al Pacino"]
+    assert record["tags"] == []
+
+
+def test_export_watchlist_round_trips_rating_and_last_seen(cli_test_client, cli_database, tmp_path):
+    export = tmp_path / "watchlist.csv"
+    export.write_text(
+        "title,director,year,rating,last_seen\n"
+        "Heat,Michael Mann,1995,4,2022-05-01T20:00:00\n"
+        "Collateral,Michael Mann,2004,,\n"
+        "Thief,Michael Mann,1981,6,\n"
+    )
+    output = cli_test_client.invoke(args=["import-watchlist", str(export), "--email", "cli@test.com"])
+    assert "Imported 2 movies (1 skipped)" in output.output
+
+    output = cli_test_client.invoke(args=["export-watchlist", "--email", "cli@test.com", "--format", "jsonl"])
+
+    heat, collateral = (json.loads(line) for line in output.output.splitlines())
+    assert (heat["rating"], heat["last_seen"]) == (4, "2022-05-01T20:00:00")
+    assert (collateral["rating"], collateral["last_seen"]) == (0, None)
+
+
+def test_reindex_search(cli_test_client, cli_database, tmp_path):
+    export = tmp_path / "watchlist.jsonl"
+    export.write_text(json.dumps({"title": "Heat", "director": "Michael Mann", "year": 1995}))
+    cli_test_client.invoke(args=["import-watchlist", str(export), "--email", "cli@test.com"])
+
+    output = cli_test_client.invoke(args=["reindex-search"])
+
+    assert output.exit_code == 0
+    assert "Indexed 1 movies for search." in output.output
+
+
+def test_benchmark_hashing(cli_test_client):
+    output = cli_test_client.invoke(args=["benchmark-hashing", "--rounds", "2"])
+
+    assert output.exit_code == 0
+    for scheme in ("sha256", "pbkdf2", "scrypt"):
+        assert scheme in output.output
+    assert "hashes/s" in output.output
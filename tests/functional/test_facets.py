@@ -0,0 +1,139 @@
+"""
+This file (test_facets.py) contains the functional tests for the filters and facet counts of the watchlist page.
+"""
+import datetime
+import logging
+
+import pytest
+
+from webapp import db, facet_cache
+from webapp.models import Movie
+from webapp.movie.facets import WatchlistFilters, facet_statements
+from webapp.movie.queries import insert_movie_children
+from tests.functional.test_query_plans import full_scans
+
+MOVIES = [
+    # title, director, year, rating, watched, cast, tags
+    ("Heat", "Michael Mann", 1995, 5, True, ["Al Pacino", "Robert De Niro"], ["crime", "heist"]),
+    ("Collateral", "Michael Mann", 2004, 4, False, ["Tom Cruise"], ["crime"]),
+    ("The Irishman", "Martin Scorsese", 2019, 0, False, ["Al Pacino", "Robert De Niro"], ["crime", "drama"]),
+    ("Casino", "Martin Scorsese", 1995, 4, True, ["Robert De Niro"], ["drama"]),
+]
+
+
+@pytest.fixture(scope="module")
+def watchlist(test_client, init_database):
+    for title, director, year, rating, watched, cast, tags in MOVIES:
+        movie = Movie(title, director, year, userId=1)
+        movie.rating = rating
+        movie.last_seen = datetime.datetime(2023, 1, 1) if watched else None
+        db.session.add(movie)
+        db.session.flush()
+        insert_movie_children(movie.id, cast=cast, tags=tags)
+    db.session.commit()
+
+
+def listed_titles(response):
+    return [title for title, *_ in MOVIES if f'<p class="table_movieTitle">{title}</p>' in response.text]
+
+
+def test_filter_by_tag(test_client, watchlist, log_in_default_user):
+    response = test_client.get("/index?tag=crime")
+
+    assert response.status_code == 200
+    assert listed_titles(response) == ["Heat", "Collateral", "The Irishman"]
+    assert "Fast Furious 9" not in response.text
+
+
+def test_filters_combine(test_client, watchlist, log_in_default_user):
+    response = test_client.get("/index?cast=Robert+De+Niro&director=Martin+Scorsese&watched=no")
+
+    assert listed_titles(response) == ["The Irishman"]
+
+
+def test_filter_by_year_range_and_rating(test_client, watchlist, log_in_default_user):
+    assert listed_titles(test_client.get("/index?year_from=1990&year_to=1999")) == ["Heat", "Casino"]
+    assert listed_titles(test_client.get("/index?rating=4")) == ["Collateral", "Casino"]
+    assert listed_titles(test_client.get("/index?rating=0&tag=drama")) == ["The Irishman"]
+
+
+def test_facet_counts(test_client, watchlist, log_in_default_user):
+    response = test_client.get("/index")
+
+    assert "crime (3)" in response.text
+    assert "Robert De Niro (3)" in response.text
+    assert "Michael Mann (2)" in response.text
+    assert "1990s (2)" in response.text
+    assert "Not watched yet (3)" in response.text
+
+
+def test_facet_counts_apply_the_other_filters(test_client, watchlist, log_in_default_user):
+    response = test_client.get("/index?tag=drama")
+
+    # The tag facet ignores its own filter, so the other tags can still be picked
+    assert "crime (3)" in response.text
+    assert "drama (2)" in response.text
+    assert "Martin Scorsese (2)" in response.text
+    assert "Michael Mann" not in response.text
+
+
+def test_no_movies_match_filters(test_client, watchlist, log_in_default_user):
+    response = test_client.get("/index?tag=crime&year_from=2030")
+
+    assert response.status_code == 200
+    assert "No movies match these filters." in response.text
+
+
+def test_pagination_keeps_filters(test_client, watchlist, log_in_default_user):
+    response = test_client.get("/index?tag=crime&per_page=1")
+
+    assert "after=" in response.text
+    assert "tag=crime" in response.text.split('class="pagination"')[1]
+
+
+def test_facet_costs_are_logged(test_client, watchlist, log_in_default_user, caplog):
+    with caplog.at_level(logging.INFO):
+        test_client.get("/index")
+
+    message = next(record.getMessage() for record in caplog.records if "Facet counts" in record.getMessage())
+    for facet in ("tag", "cast", "director", "decade", "rating", "watched"):
+        assert f"{facet} " in message
+
+
+def test_facet_counts_are_cached_per_watchlist_version(test_client, watchlist, log_in_default_user, query_budget):
+    facet_cache.configure(maxsize=16, ttl=60)
+    try:
+        test_client.get("/index?tag=heist")
+        with query_budget(2):
+            test_client.get("/index?tag=heist")
+    finally:
+        facet_cache.configure(maxsize=16, ttl=0)
+
+
+def test_api_facets(test_client, watchlist, log_in_default_user):
+    response = test_client.get("/api/v1/movies/facets?director=Michael+Mann")
+
+    assert response.status_code == 200
+    facets = {facet["name"]: facet for facet in response.json["facets"]}
+    assert {value["label"]: value["count"] for value in facets["tag"]["values"]} == {"crime": 2, "heist": 1}
+    assert facets["director"]["values"][0] == {
+        "label": "Michael Mann",
+        "count": 2,
+        "args": {},
+        "selected": True,
+    }
+
+
+def test_api_list_movies_with_filters(test_client, watchlist, log_in_default_user):
+    response = test_client.get("/api/v1/movies?tag=heist")
+
+    assert [movie["title"] for movie in response.json["movies"]] == ["Heat"]
+
+
+@pytest.mark.parametrize("facet", ["tag", "cast", "director", "decade", "rating", "watched"])
+def test_facet_query_uses_index(test_client, watchlist, facet):
+    filters = WatchlistFilters(tag="crime", cast="Al Pacino", year_from=1990, year_to=2009, watched=True)
+    statement = facet_statements(1, filters, limit=10)[facet]
+
+    # Sorting the grouped values is fine, reading the whole table is not
+    assert [line for line in full_scans(statement) if "TEMP B-TREE" not in line] == []
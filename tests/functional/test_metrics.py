@@ -0,0 +1,35 @@
+"""
+This file (test_metrics.py) contains the functional tests for the request instrumentation.
+"""
+import re
+
+from webapp import metrics
+
+
+def test_metrics_record_latency_and_statements(test_client, init_database, log_in_default_user):
+    metrics.reset()
+    test_client.get("/movie/1")
+
+    response = test_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert 'watchlist_request_duration_seconds_count{endpoint="movie.movie",method="GET"} 1' in response.text
+    statements = re.search(
+        r'watchlist_request_sql_statements_sum\{endpoint="movie.movie",method="GET"\} (\d+)', response.text
+    )
+    # The movie and its children take two statements, loading the user at most one more
+    assert 1 <= float(statements.group(1)) <= 3
+    assert 'endpoint="metrics"' not in response.text
+
+
+def test_server_timing_header(test_client, init_database, log_in_default_user, monkeypatch):
+    monkeypatch.setattr(metrics, "server_timing", True)
+
+    response = test_client.get("/movie/1")
+
+    assert re.match(r'app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"', response.headers["Server-Timing"])
+
+
+def test_no_server_timing_header_by_default(test_client, init_database, log_in_default_user):
+    assert "Server-Timing" not in test_client.get("/movie/1").headers
@@ -1,5 +1,9 @@
+import json
 import re
 
+from webapp import db
+from webapp.models import Movie, Tag, Cast, Series
+
 # --------------
 # Home page
 # --------------
@@ -62,6 +66,31 @@ def test_index_page_logged_in(test_client, init_database, log_in_default_user):
     assert b"2020" in response.data
 
 
+def test_index_page_keyset_pagination(test_client, init_database, log_in_default_user):
+    movie = Movie(title="Malibu Rising", director="Taylor J. Reid", year=2021, userId=1)
+    db.session.add(movie)
+    db.session.commit()
+
+    response = test_client.get("/index?per_page=1")
+    assert response.status_code == 200
+    assert b"Fast Furious 9" in response.data
+    assert b"Malibu Rising" not in response.data
+    assert b"Next" in response.data
+    assert b"Previous" not in response.data
+
+    response = test_client.get("/index?per_page=1&after=1")
+    assert response.status_code == 200
+    assert b"Malibu Rising" in response.data
+    assert b"Fast Furious 9" not in response.data
+    assert b"Previous" in response.data
+
+    response = test_client.get(f"/index?per_page=1&before={movie.id}")
+    assert response.status_code == 200
+    assert b"Fast Furious 9" in response.data
+    assert b"Malibu Rising" not in response.data
+    assert b"Next" in response.data
+
+
 def test_index_page_logged_in_no_movies_added(test_client):
     test_client.post(
         "/auth/register",
@@ -114,6 +143,28 @@ def test_post_add_movie(test_client, init_database, log_in_default_user):
     assert response.status_code == 200
 
 
+def test_post_add_movie_with_children(test_client, init_database, log_in_default_user):
+    response = test_client.post(
+        "/add",
+        data={
+            "title": "Furious 7",
+            "director": "James Wan",
+            "year": 2015,
+            "cast": "Vin Diesel\nPaul Walker\n\nVin Diesel ",
+            "tags": "action\naction\n",
+            "series": "Fast & Furious",
+        },
+        follow_redirects=True,
+    )
+    assert response.status_code == 200
+    assert b"Added new movie (Furious 7)!" in response.data
+
+    movie = Movie.query.filter_by(title="Furious 7").first()
+    assert [cast.actor for cast in Cast.query.filter_by(movieId=movie.id)] == ["Vin Diesel", "Paul Walker"]
+    assert [tag.tag for tag in Tag.query.filter_by(movieId=movie.id)] == ["action"]
+    assert [serial.series for serial in Series.query.filter_by(movieId=movie.id)] == ["Fast & Furious"]
+
+
 def test_post_add_movie_not_logged_in(test_client):
     response = test_client.post(
         "/add",
@@ -162,6 +213,24 @@ def test_get_single_movie_page_logged_in(test_client, init_database, log_in_defa
     assert b"Not watched yet" in response.data
 
 
+def test_get_single_movie_page_with_children(test_client, init_database, log_in_default_user):
+    db.session.add_all([Tag("heist", 1), Cast("Vin Diesel", 1), Series("Fast & Furious 10", 1)])
+    db.session.commit()
+
+    response = test_client.get("/movie/1")
+
+    assert response.status_code == 200
+    assert b"heist" in response.data
+    assert b"Vin Diesel" in response.data
+    assert b"Fast &amp; Furious 10" in response.data
+
+
+def test_get_single_movie_page_invalid_movie(test_client, init_database, log_in_default_user):
+    response = test_client.get("/movie/333")
+
+    assert response.status_code == 404
+
+
 def test_get_single_movie_page_not_logged_in(
     test_client,
     init_database,
@@ -367,7 +436,9 @@ def test_get_add_tags_page_logged_in_own_movie(test_client, init_database, log_i
 
 def test_get_add_tags_page_logged_in_not_own_movie(test_client, init_database, log_in_second_user):
     response = test_client.get("/add/tags/1")
-    assert response.status_code == 200
+    # Forbidden pages are rendered with a 500, as for the other movie routes
+    assert response.status_code == 500
+    assert b"OOOOPS! Something went wrong on the server." in response.data
 
 
 def test_get_add_tags_page_not_logged_in(test_client, init_database):
@@ -393,3 +464,154 @@ def test_post_add_tags(test_client, init_database, log_in_default_user):
     )
 
     assert response.status_code == 200
+
+
+# --------------
+# Export watchlist
+# --------------
+
+
+def test_export_watchlist_csv(test_client, init_database, log_in_default_user):
+    response = test_client.get("/export.csv")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert "attachment; filename=watchlist.csv" in response.headers["Content-Disposition"]
+    lines = response.data.decode().splitlines()
+    assert lines[0] == "title,director,year,rating,last_seen,description,video_link,cast,tags,series"
+    assert len(lines) == 1 + Movie.query.filter_by(userId=1).count()
+
+
+def test_export_watchlist_jsonl(test_client, init_database, log_in_default_user):
+    response = test_client.get("/export.jsonl")
+
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [record["title"] for record in records] == [movie.title for movie in Movie.query.filter_by(userId=1).order_by(Movie.id)]
+    furious = next(record for record in records if record["title"] == "Furious 7")
+    assert furious["cast"] == ["Vin Diesel", "Paul Walker"]
+    assert furious["tags"] == ["action"]
+    assert furious["series"] == ["Fast & Furious"]
+
+
+def test_export_watchlist_not_logged_in(test_client, init_database):
+    response = test_client.get("/export.csv")
+
+    assert response.status_code == 302
+
+
+# --------------
+# Search
+# --------------
+
+
+def test_search_movies(test_client, init_database, log_in_default_user):
+    test_client.post(
+        "/add",
+        data={
+            "title": "Blade Runner",
+            "director": "Ridley Scott",
+            "year": 1982,
+            "cast": "Harrison Ford",
+            "tags": "cyberpunk",
+            "description": "A blade runner must pursue and terminate four replicants.",
+        },
+        follow_redirects=True,
+    )
+
+    for query in ["blade", "harr", "CYBERPUNK", "scott runner", "replicants"]:
+        response = test_client.get(f"/search?q={query}")
+        assert response.status_code == 200
+        assert b"Blade Runner" in response.data
+
+    response = test_client.get("/search?q=nosferatu")
+    assert response.status_code == 200
+    assert b"Blade Runner" not in response.data
+    assert b"No movies match" in response.data
+
+
+def test_search_movies_follows_edits_and_deletes(test_client, init_database, log_in_default_user):
+    movie = Movie.query.filter_by(title="Blade Runner").first()
+
+    test_client.post(
+        f"/edit/{movie.id}",
+        data={"title": "Blade Runner 2049", "director": "Denis Villeneuve", "year": 2017},
+        follow_redirects=True,
+    )
+    assert b"Blade Runner 2049" in test_client.get("/search?q=villeneuve").data
+    assert b"Blade Runner" not in test_client.get("/search?q=ridley").data
+
+    test_client.get(f"/{movie.id}/delete", follow_redirects=True)
+    assert b"Blade Runner" not in test_client.get("/search?q=blade").data
+
+
+def test_search_movies_other_users_movies(test_client, init_database, log_in_second_user):
+    response = test_client.get("/search?q=harrison")
+
+    assert response.status_code == 200
+    assert b"Blade Runner" not in response.data
+
+
+def test_search_movies_empty_query(test_client, init_database, log_in_default_user):
+    response = test_client.get("/search?q=+")
+
+    assert response.status_code == 302
+
+
+# Query budgets: the number of SQL statements a page runs must not grow with the size of the
+# watchlist or of a movie's cast, tags and series. The budgets leave room for loading the user.
+
+
+def test_index_page_query_budget(test_client, init_database, log_in_default_user, query_budget):
+    db.session.add_all([Movie(f"Budget {number}", "Director", 2000, userId=1) for number in range(20)])
+    db.session.commit()
+    test_client.get("/index")
+
+    # The page and the user, plus one GROUP BY statement per facet
+    with query_budget(8):
+        response = test_client.get("/index")
+    assert response.status_code == 200
+
+
+def test_single_movie_page_query_budget(test_client, init_database, log_in_default_user, query_budget):
+    db.session.add_all([Tag(f"tag {number}", 1) for number in range(10)])
+    db.session.add_all([Cast(f"Actor {number}", 1) for number in range(10)])
+    db.session.add_all([Series(f"Series {number}", 1) for number in range(10)])
+    db.session.commit()
+
+    with query_budget(3):
+        response = test_client.get("/movie/1")
+    assert response.status_code == 200
+
+
+def test_post_add_movie_query_budget(test_client, init_database, log_in_default_user, query_budget):
+    # One upsert adds the movie, its cast and its tags to the statistics counters. Updating the similar
+    # movies takes up to nine more: the movies listing it, the posting lists of its features and the
+    # norms of the movies in them, its own list, then the stored lists it ranks into
+    with query_budget(22):
+        response = test_client.post(
+            "/add",
+            data={
+                "title": "Furious 8",
+                "director": "F. Gary Gray",
+                "year": 2017,
+                "cast": "\n".join(f"Actor {number}" for number in range(10)),
+                "tags": "\n".join(f"tag {number}" for number in range(10)),
+                "series": "Fast & Furious",
+            },
+        )
+    assert response.status_code == 302
+
+
+def test_export_watchlist_query_budget(test_client, init_database, log_in_default_user, query_budget):
+    with query_budget(5):
+        response = test_client.get("/export.csv")
+    assert response.status_code == 200
+
+
+def test_search_movies_query_budget(test_client, init_database, log_in_default_user, query_budget):
+    test_client.get("/index")
+
+    with query_budget(2):
+        response = test_client.get("/search?q=furious")
+    assert response.status_code == 200
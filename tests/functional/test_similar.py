@@ -0,0 +1,182 @@
+"""
+This file (test_similar.py) contains the functional tests for the similar movies and their neighbour index.
+"""
+import numpy as np
+import pytest
+
+from webapp import db
+from webapp.models import Movie, MovieNeighbour, Tag, User
+from webapp.movie import similar
+from webapp.movie.similar import FeatureMatrix, rebuild_neighbours, similar_movies_statement, update_neighbours
+from tests.functional.test_query_plans import full_scans
+
+
+def neighbour_rows(user_id=1):
+    rows = (
+        db.session.query(MovieNeighbour)
+        .join(Movie, Movie.id == MovieNeighbour.movieId)
+        .filter(Movie.userId == user_id)
+        .order_by(MovieNeighbour.movieId, MovieNeighbour.rank)
+    )
+    return [(row.movieId, row.rank, row.neighbourId, round(row.score, 9)) for row in rows]
+
+
+def movie_id(title):
+    return Movie.query.filter_by(title=title).first().id
+
+
+def test_feature_matrix_ranks_by_cosine_similarity():
+    # Movie 10 shares two features with 20 and one with 30; 40 shares nothing
+    movie_ids = np.array([10, 20, 30, 40])
+    rows = np.array([0, 0, 0, 1, 1, 2, 2, 3])
+    features = np.array([0, 1, 2, 0, 1, 2, 3, 4])
+    matrix = FeatureMatrix(movie_ids, rows, features, np.ones(len(rows)))
+
+    neighbours = matrix.neighbours(matrix.index_of([10]), k=3)
+
+    assert [row["neighbourId"] for row in neighbours] == [20, 30]
+    assert neighbours[0]["score"] == pytest.approx(2 / np.sqrt(3 * 2))
+    assert neighbours[1]["score"] == pytest.approx(1 / np.sqrt(3 * 2))
+    assert list(matrix.index_of([40, 50])) == [3]
+
+
+def test_write_routes_keep_neighbours_in_step_with_rebuild(test_client, init_database, log_in_default_user):
+    test_client.post(
+        "/add",
+        data={"title": "Heat", "director": "Michael Mann", "year": 1995, "cast": "Al Pacino", "tags": "crime\nheist"},
+    )
+    test_client.post("/add", data={"title": "Collateral", "director": "Michael Mann", "year": 2004, "tags": "crime"})
+    test_client.post("/add", data={"title": "Alien", "director": "Ridley Scott", "year": 1979, "tags": "space"})
+    heat, collateral, alien = movie_id("Heat"), movie_id("Collateral"), movie_id("Alien")
+
+    test_client.post(f"/add/tags/{alien}", data={"tags": "heist"})
+    test_client.post(f"/edit/{collateral}", data={"title": "Collateral", "director": "M. Mann", "year": 2004})
+    crime = next(tag for tag in Tag.query.filter_by(movieId=collateral) if tag.tag == "crime")
+    test_client.get(f"/movie/{collateral}/delete/tags/{crime.id}")
+
+    created = test_client.post(
+        "/api/v1/movies/batch",
+        json={
+            "movies": [
+                {"title": "Thief", "director": "Michael Mann", "year": 1981, "tags": ["heist"]},
+                {"title": "Scarface", "director": "Brian De Palma", "year": 1983, "cast": ["Al Pacino"]},
+            ]
+        },
+    ).json["movies"]
+    thief, scarface = (movie["id"] for movie in created)
+    test_client.patch(f"/api/v1/movies/{scarface}", json={"director": "Michael Mann"})
+    cast = test_client.post(f"/api/v1/movies/{thief}/cast", json={"values": ["James Caan"]}).json
+    test_client.delete(f"/api/v1/movies/{thief}/cast/{cast[0]['id']}")
+    test_client.post("/api/v1/tags/batch", json={"items": [{"movie_id": collateral, "tags": ["heist"]}]})
+    test_client.delete(f"/api/v1/movies/{thief}")
+
+    incremental = neighbour_rows()
+    assert thief not in {neighbour for _, _, neighbour, _ in incremental}
+    heat_neighbours = [neighbour for movie, _, neighbour, _ in incremental if movie == heat]
+    assert heat_neighbours[0] == scarface
+    assert set(heat_neighbours) == {scarface, collateral, alien}
+
+    rebuild_neighbours(test_client.application.config["SIMILAR_MOVIES"])
+    db.session.commit()
+    assert neighbour_rows() == incremental
+
+
+def test_editing_the_director_updates_neighbours(test_client, init_database, log_in_default_user):
+    test_client.post("/add", data={"title": "Ronin", "director": "John Frankenheimer", "year": 1998})
+    ronin = movie_id("Ronin")
+    assert ronin not in {movie for movie, _, _, _ in neighbour_rows()}
+
+    test_client.post(f"/edit/{ronin}", data={"title": "Ronin", "director": "Michael Mann", "year": 1998})
+
+    incremental = neighbour_rows()
+    assert movie_id("Heat") in {neighbour for movie, _, neighbour, _ in incremental if movie == ronin}
+    rebuild_neighbours(test_client.application.config["SIMILAR_MOVIES"])
+    db.session.commit()
+    assert neighbour_rows() == incremental
+
+
+def test_updates_rewrite_only_the_affected_lists(test_client, init_database):
+    # Forty movies of the second user share a tag, so each has 39 others to rank
+    movies = [Movie(f"Action {number}", f"Director {number}", 2000, userId=2) for number in range(40)]
+    db.session.add_all(movies)
+    db.session.flush()
+    db.session.add_all([Tag("action", movie.id) for movie in movies])
+    rebuild_neighbours(5, user_id=2)
+    db.session.commit()
+    second, last = movies[1].id, movies[-1].id
+
+    # A tag of its own makes the last movie less similar to every other: only its own list changes
+    db.session.add(Tag("rare", last))
+    assert update_neighbours(2, 5, changed=[last]) == 5
+
+    # Sharing a second tag with the last movie ranks it first for the second movie, merged into its list
+    db.session.add(Tag("heist", second))
+    update_neighbours(2, 5, changed=[second])
+    db.session.add(Tag("heist", last))
+    assert update_neighbours(2, 5, changed=[last]) == 10
+    db.session.commit()
+
+    incremental = neighbour_rows(user_id=2)
+    assert [neighbour for movie, _, neighbour, _ in incremental if movie == second][0] == last
+    rebuild_neighbours(5, user_id=2)
+    db.session.commit()
+    assert neighbour_rows(user_id=2) == incremental
+
+
+def test_rebuild_in_smaller_blocks_gives_the_same_neighbours(test_client, init_database, monkeypatch):
+    expected = neighbour_rows(user_id=2)
+    # Each of the forty movies is scored against the others in a block of its own
+    monkeypatch.setattr(similar, "BLOCK_PRODUCTS", 50)
+
+    rebuild_neighbours(5, user_id=2)
+    db.session.commit()
+
+    assert neighbour_rows(user_id=2) == expected
+
+
+def test_movie_page_lists_similar_movies(test_client, init_database, log_in_default_user):
+    response = test_client.get(f"/movie/{movie_id('Heat')}")
+
+    assert response.status_code == 200
+    assert "Similar movies" in response.text
+    assert f'href="/movie/{movie_id("Scarface")}"' in response.text
+
+
+def test_async_movie_page_lists_similar_movies(async_test_client, init_database, log_in_default_user):
+    response = async_test_client.get(f"/movie/{movie_id('Heat')}")
+
+    assert response.status_code == 200
+    assert f'href="/movie/{movie_id("Scarface")}"' in response.text
+
+
+def test_movie_page_without_similar_movies(test_client, init_database, log_in_default_user):
+    response = test_client.get("/movie/1")
+
+    assert response.status_code == 200
+    assert "Similar movies" not in response.text
+
+
+def test_similar_movies_lookup_uses_index(test_client, init_database):
+    assert full_scans(similar_movies_statement(1, 5)) == []
+
+
+def test_rebuild_neighbours_command(cli_test_client, cli_database):
+    with cli_test_client.app.app_context():
+        user_id = User.query.filter_by(email="cli@test.com").first().id
+        db.session.add_all([Movie(title, "Michael Mann", 1995, userId=user_id) for title in ("Heat", "Thief")])
+        db.session.commit()
+
+    output = cli_test_client.invoke(args=["rebuild-neighbours", "--email", "cli@test.com"])
+
+    assert output.exit_code == 0
+    # Each movie is the other's only neighbour
+    assert "Rebuilt 2 similar movies" in output.output
+    with cli_test_client.app.app_context():
+        assert len(neighbour_rows(user_id)) == 2
+
+
+def test_rebuild_neighbours_command_unknown_user(cli_test_client, cli_database):
+    output = cli_test_client.invoke(args=["rebuild-neighbours", "--email", "nobody@test.com"])
+
+    assert output.exit_code != 0
+    assert "No user registered with the email nobody@test.com" in output.output
@@ -0,0 +1,125 @@
+"""
+This file (test_sorting.py) contains the functional tests for the sort orders of the watchlist page.
+"""
+import base64
+import datetime
+import json
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from webapp import db
+from webapp.models import Movie
+from webapp.movie.queries import SORT_COLUMNS, WatchlistSort, movie_page_statement, paginate_movies
+from tests.functional.test_query_plans import full_scans
+
+MOVIES = [
+    # title, year, rating, last seen
+    ("Alien", 1979, 5, datetime.datetime(2023, 3, 1)),
+    ("Brazil", 1985, 4, None),
+    ("Akira", 1988, 4, datetime.datetime(2023, 3, 1)),
+    ("Zodiac", 2007, 0, None),
+    ("Memento", 2000, 5, datetime.datetime(2022, 7, 14)),
+]
+
+
+@pytest.fixture(scope="module")
+def watchlist(test_client, init_database):
+    for title, year, rating, last_seen in MOVIES:
+        movie = Movie(title, "Someone", year, userId=1)
+        movie.rating = rating
+        movie.last_seen = last_seen
+        db.session.add(movie)
+    db.session.commit()
+
+
+def expected_ids(sort):
+    """Sort the movies in Python the way the database should, NULLs first as on SQLite."""
+    movies = Movie.query.filter_by(userId=1).all()
+
+    def key(movie):
+        value = getattr(movie, sort.column.key)
+        return (value is not None, value or 0, movie.id)
+
+    return [movie.id for movie in sorted(movies, key=key, reverse=sort.descending)]
+
+
+ALL_SORTS = [WatchlistSort(key, descending) for key in SORT_COLUMNS for descending in (False, True)]
+
+
+@pytest.mark.parametrize("sort", ALL_SORTS, ids=lambda sort: f"{sort.key}-{'desc' if sort.descending else 'asc'}")
+def test_pages_walk_the_sort_order(test_client, watchlist, sort):
+    ids, page = [], paginate_movies(1, per_page=2, sort=sort)
+    ids += [movie.id for movie in page.movies]
+    while page.next_cursor is not None:
+        page = paginate_movies(1, per_page=2, after=sort.parse_cursor(str(page.next_cursor)), sort=sort)
+        ids += [movie.id for movie in page.movies]
+
+    assert ids == expected_ids(sort)
+
+    # And back again from the last page
+    back = [movie.id for movie in page.movies]
+    while page.prev_cursor is not None:
+        page = paginate_movies(1, per_page=2, before=sort.parse_cursor(str(page.prev_cursor)), sort=sort)
+        back = [movie.id for movie in page.movies] + back
+
+    assert back == ids
+
+
+def test_index_sorted_by_title(test_client, watchlist, log_in_default_user):
+    response = test_client.get("/index?sort=title&order=desc")
+
+    titles = [title for title, *_ in MOVIES]
+    positions = sorted((response.text.index(f'<p class="table_movieTitle">{title}</p>'), title) for title in titles)
+    assert [title for _, title in positions] == sorted(titles, reverse=True)
+    assert "sort_link--selected" in response.text
+
+
+def test_pagination_keeps_sort(test_client, watchlist, log_in_default_user):
+    response = test_client.get("/index?sort=year&per_page=2")
+
+    pagination = response.text.split('class="pagination"')[1]
+    assert "sort=year" in pagination
+    assert "after=" in pagination
+
+
+def test_invalid_sort_and_cursor_are_ignored(test_client, watchlist, log_in_default_user):
+    assert test_client.get("/index?sort=password_hashed").status_code == 200
+    assert test_client.get("/index?sort=year&after=not-a-cursor").status_code == 200
+    assert WatchlistSort.from_args(MultiDict({"sort": "password_hashed"})) == WatchlistSort()
+
+
+def test_cursor_with_a_value_of_the_wrong_type_is_ignored(test_client, watchlist, log_in_default_user):
+    crafted = base64.urlsafe_b64encode(json.dumps([5, 1]).encode()).decode()
+
+    with pytest.raises(ValueError):
+        WatchlistSort("last_seen").parse_cursor(crafted)
+    assert test_client.get(f"/index?sort=last_seen&after={crafted}").status_code == 200
+    assert test_client.get(f"/api/v1/movies?sort=last_seen&after={crafted}").status_code == 200
+
+
+def test_api_sorted_cursor(test_client, watchlist, log_in_default_user):
+    first = test_client.get("/api/v1/movies?sort=rating&order=desc&per_page=2").json
+    second = test_client.get(f"/api/v1/movies?sort=rating&order=desc&per_page=2&after={first['next_cursor']}").json
+
+    ratings = [movie["rating"] for movie in first["movies"] + second["movies"]]
+    assert ratings == sorted(ratings, reverse=True)
+    assert {movie["id"] for movie in first["movies"]}.isdisjoint(movie["id"] for movie in second["movies"])
+
+
+CURSOR_KEYS = {
+    "added": [(3,)],
+    "title": [("Memento", 3)],
+    "year": [(1988, 3)],
+    "rating": [(4, 3)],
+    # Movies never watched have no last_seen, and are sought separately from the others
+    "last_seen": [(datetime.datetime(2023, 3, 1), 3), (None, 3)],
+}
+
+
+@pytest.mark.parametrize("sort", ALL_SORTS, ids=lambda sort: f"{sort.key}-{'desc' if sort.descending else 'asc'}")
+def test_sorted_pages_read_index_in_order(test_client, watchlist, sort):
+    assert full_scans(movie_page_statement(1, per_page=50, sort=sort)) == []
+    for key in CURSOR_KEYS[sort.key]:
+        assert full_scans(movie_page_statement(1, per_page=50, after=key, sort=sort)) == []
+        assert full_scans(movie_page_statement(1, per_page=50, before=key, sort=sort)) == []
@@ -0,0 +1,63 @@
+"""
+This file (test_startup.py) contains the startup-time budget of a worker.
+
+A fresh interpreter imports the app and runs `create_app()` under `python -X importtime`, as a
+gunicorn worker does on a cold start.
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+from webapp import create_app
+imported = time.perf_counter()
+create_app()
+print(json.dumps({"import": imported - started, "create_app": time.perf_counter() - imported}))
+"""
+# Wall time allowed for importing the app and running `create_app`, with the importtime overhead
+STARTUP_BUDGET_SECONDS = 2.0
+# Only needed by the CLI or by some views, so they must not be imported when a worker starts
+DEFERRED_MODULES = ("alembic", "flask_migrate", "wtforms", "email_validator", "dns", "numpy")
+
+
+@pytest.fixture(scope="module")
+def startup():
+    env = dict(os.environ, CONFIG_TYPE="config.TestingConfig", DEFER_SCHEMA_CHECK="true")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+        cwd=Path(__file__).parents[2],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # Lines look like "import time:  self [us] | cumulative | package", indented by import depth
+    imports = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:"):
+            _, cumulative, module = line.split("|")
+            if cumulative.strip().isdigit():
+                imports[module.strip()] = int(cumulative)
+    return json.loads(result.stdout.splitlines()[-1]), imports
+
+
+def test_startup_defers_cli_and_form_modules(startup):
+    _, imports = startup
+
+    imported = sorted(module for module in imports if module.split(".")[0] in DEFERRED_MODULES)
+    assert imported == []
+
+
+def test_create_app_within_budget(startup):
+    timings, imports = startup
+    slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:10]
+
+    total = timings["import"] + timings["create_app"]
+    assert total < STARTUP_BUDGET_SECONDS, f"Startup took {total:.2f}s; slowest imports (us): {slowest}"
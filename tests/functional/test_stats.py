@@ -0,0 +1,139 @@
+"""
+This file (test_stats.py) contains the functional tests for the watchlist statistics and their counters.
+"""
+import datetime
+
+from webapp import db
+from webapp.models import Movie, Tag, User, WatchlistStat
+from webapp.movie.stats import month_keys, rebuild_stats
+
+
+def stat_counters(user_id=1):
+    rows = WatchlistStat.query.filter(WatchlistStat.userId == user_id, WatchlistStat.count != 0)
+    return {(row.kind, row.key): row.count for row in rows}
+
+
+def test_write_routes_keep_counters_in_step_with_rebuild(test_client, init_database, log_in_default_user):
+    # The conftest movie is added behind the routes' back
+    rebuild_stats()
+    db.session.commit()
+
+    test_client.post(
+        "/add",
+        data={"title": "Heat", "director": "Michael Mann", "year": 1995, "cast": "Al Pacino", "tags": "crime\nheist"},
+    )
+    heat = Movie.query.filter_by(title="Heat").first()
+    test_client.get(f"/movie/{heat.id}/watch")
+    test_client.get(f"/movie/{heat.id}/4")
+    test_client.post(f"/edit/{heat.id}", data={"title": "Heat", "director": "M. Mann", "year": 1996})
+    test_client.post(f"/add/tags/{heat.id}", data={"tags": "drama"})
+    heist = next(tag for tag in Tag.query.filter_by(movieId=heat.id) if tag.tag == "heist")
+    test_client.get(f"/movie/{heat.id}/delete/tags/{heist.id}")
+
+    created = test_client.post(
+        "/api/v1/movies/batch",
+        json={
+            "movies": [
+                {"title": "Casino", "director": "Martin Scorsese", "year": 1995, "cast": ["Robert De Niro"]},
+                {"title": "Alien", "director": "Ridley Scott", "year": 1979, "tags": ["horror", "space"]},
+            ]
+        },
+    ).json["movies"]
+    casino, alien = (movie["id"] for movie in created)
+    test_client.patch("/api/v1/movies/batch", json={"movies": [{"id": casino, "rating": 5, "watched": True}]})
+    test_client.patch(f"/api/v1/movies/{alien}", json={"director": "R. Scott", "last_seen": "2022-05-01T20:00:00"})
+    cast = test_client.post(f"/api/v1/movies/{casino}/cast", json={"values": ["Sharon Stone"]}).json
+    test_client.delete(f"/api/v1/movies/{casino}/cast/{cast[0]['id']}")
+    test_client.post("/api/v1/tags/batch", json={"items": [{"movie_id": alien, "tags": ["classic"]}]})
+    test_client.delete(f"/api/v1/movies/{alien}")
+
+    incremental = stat_counters()
+    assert incremental[("tag", "drama")] == 1
+    assert ("tag", "heist") not in incremental
+    assert incremental[("director", "M. Mann")] == 1
+    assert ("director", "Michael Mann") not in incremental
+    assert incremental[("rating", "5")] == 1
+    assert ("director", "R. Scott") not in incremental
+
+    rebuild_stats()
+    db.session.commit()
+    assert stat_counters() == incremental
+
+
+def test_tag_routes_refuse_other_users_movies(test_client, init_database, log_in_second_user):
+    heat = Movie.query.filter_by(title="Heat").first()
+    tag = Tag.query.filter_by(movieId=heat.id).first()
+    owner_counters, own_counters = stat_counters(1), stat_counters(2)
+
+    # Forbidden pages are rendered with a 500, as for the other movie routes
+    assert test_client.post(f"/add/tags/{heat.id}", data={"tags": "stolen"}).status_code == 500
+    assert test_client.get(f"/movie/{heat.id}/delete/tags/{tag.id}").status_code == 500
+
+    assert Tag.query.get(tag.id) is not None
+    assert stat_counters(1) == owner_counters
+    assert stat_counters(2) == own_counters
+
+
+def test_tags_count_each_movie_once(test_client, init_database, log_in_default_user):
+    heat = Movie.query.filter_by(title="Heat").first()
+    drama = stat_counters()[("tag", "drama")]
+
+    test_client.post(f"/add/tags/{heat.id}", data={"tags": "drama\nsequel"})
+    test_client.post(f"/api/v1/movies/{heat.id}/tags", json={"values": ["drama", "sequel"]})
+    test_client.post("/api/v1/tags/batch", json={"items": [{"movie_id": heat.id, "tags": ["sequel", "sequel"]}]})
+
+    assert [tag.term.name for tag in Tag.query.filter_by(movieId=heat.id)].count("sequel") == 1
+    incremental = stat_counters()
+    assert incremental[("tag", "drama")] == drama
+    assert incremental[("tag", "sequel")] == 1
+
+    # A name stored twice on a movie, as older versions allowed, still counts one movie
+    db.session.add(Tag("sequel", heat.id))
+    db.session.commit()
+    rebuild_stats()
+    db.session.commit()
+    assert stat_counters() == incremental
+
+
+def test_stats_page(test_client, init_database, log_in_default_user):
+    response = test_client.get("/stats")
+
+    assert response.status_code == 200
+    stats = stat_counters()
+    assert f'<span class="stats_number">{stats[("movies", "")]}</span> movies' in response.text
+    assert "Top directors" in response.text
+    assert "M. Mann" in response.text
+    assert datetime.date.today().strftime("%Y-%m") in response.text
+
+
+def test_stats_page_reads_counters_only(test_client, init_database, log_in_default_user, query_budget):
+    # Loading the user, then the summary and the directors, tags and actors
+    with query_budget(5):
+        response = test_client.get("/stats")
+    assert response.status_code == 200
+
+
+def test_month_keys_cross_years():
+    assert month_keys(datetime.date(2024, 2, 15), 3) == ["2023-12", "2024-01", "2024-02"]
+
+
+def test_rebuild_stats_command(cli_test_client, cli_database):
+    with cli_test_client.app.app_context():
+        user_id = User.query.filter_by(email="cli@test.com").first().id
+        db.session.add(Movie("Heat", "Michael Mann", 1995, userId=user_id))
+        db.session.commit()
+
+    output = cli_test_client.invoke(args=["rebuild-stats", "--email", "cli@test.com"])
+
+    assert output.exit_code == 0
+    # movies, watched, rating, decade and director
+    assert "Rebuilt 5 statistics counters" in output.output
+    with cli_test_client.app.app_context():
+        assert stat_counters(user_id)[("decade", "1990")] == 1
+
+
+def test_rebuild_stats_command_unknown_user(cli_test_client, cli_database):
+    output = cli_test_client.invoke(args=["rebuild-stats", "--email", "nobody@test.com"])
+
+    assert output.exit_code != 0
+    assert "No user registered with the email nobody@test.com" in output.output
@@ -1,8 +1,15 @@
 import re
+import threading
 import pytest
 import requests
 import requests_mock
 from requests.exceptions import HTTPError
+from flask import g
+import sqlalchemy
+from sqlalchemy import event
+
+from webapp import db, hashing_executor, user_cache
+from webapp.models import User
 
 # from webapp import some_func
 
@@ -253,3 +260,81 @@ def test_page_not_found_404(test_client):
         assert b"Go to home" in response.data
         assert b"Log in" in response.data
         assert b"Register" in response.data
+
+
+def test_load_user_served_from_identity_cache(test_client, init_database, log_in_default_user):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # The test client shares one app context and session between requests, so start afresh as a worker would
+    g.pop("_login_user", None)
+    test_client.get("/index")
+    g.pop("_login_user", None)
+    db.session.expunge_all()
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        response = test_client.get("/index")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    assert not [statement for statement in statements if 'FROM "user"' in statement or "FROM user" in statement]
+
+
+def test_load_user_cache_invalidated_by_set_password(test_client, init_database):
+    user = User.query.filter_by(email="test2@test.com").first()
+    user_cache.set(user.id, user.cached_state())
+
+    user.set_password("newpassword")
+
+    assert user_cache.get(user.id) is None
+    user.set_password("testpassword")
+    db.session.commit()
+
+
+def test_status_page_reuses_engine(test_client, init_database, monkeypatch):
+    def create_engine(*args, **kwargs):
+        raise AssertionError("the status page must reuse db.engine")
+
+    monkeypatch.setattr(sqlalchemy, "create_engine", create_engine)
+    response = test_client.get("/auth/status")
+
+    assert response.status_code == 200
+    assert b"Database initialized: True" in response.data
+    assert b"Database `movie` table created: True" in response.data
+
+
+def test_health_check(test_client, init_database):
+    response = test_client.get("/auth/health")
+
+    assert response.status_code == 200
+    assert response.json["status"] == "ok"
+    assert response.json["database"] == "ok"
+    assert "uptime" in response.json
+
+
+def test_login_upgrades_legacy_password_hash(test_client, init_database):
+    user = User(email="legacy@test.com", password_plaintext="testpassword", method="sha256")
+    db.session.add(user)
+    db.session.commit()
+
+    response = test_client.post(
+        "/auth/login", data={"email": "legacy@test.com", "password": "testpassword"}, follow_redirects=True
+    )
+    test_client.get("/auth/logout")
+
+    assert b"Login successful" in response.data
+    db.session.expire_all()
+    assert User.query.filter_by(email="legacy@test.com").first().password_hashed.startswith("pbkdf2:sha256:1000$")
+
+
+def test_login_rejected_while_hashing_pool_is_full(test_client, init_database, monkeypatch):
+    monkeypatch.setattr(hashing_executor, "_slots", threading.BoundedSemaphore(1))
+    hashing_executor._slots.acquire()
+
+    response = test_client.post("/auth/login", data={"email": "test@test.com", "password": "testpassword"})
+
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
@@ -0,0 +1,38 @@
+"""
+This file (test_vocabulary.py) contains the functional tests for the tag, person and series vocabularies.
+"""
+from webapp import db
+from webapp.models import Cast, Movie, Person, Tag, TagName
+from webapp.movie.queries import insert_movie_children
+
+
+def test_names_are_stored_once_across_movies(test_client, init_database, log_in_default_user):
+    second_movie = Movie(title="Furious 7", director="James Wan", year=2015, userId=1)
+    db.session.add(second_movie)
+    db.session.flush()
+
+    insert_movie_children(1, cast=["Vin Diesel"], tags=["action", "cars"])
+    insert_movie_children(second_movie.id, cast=["Vin Diesel", "Paul Walker"], tags=["action"])
+    db.session.commit()
+
+    assert TagName.query.filter_by(name="action").count() == 1
+    assert Person.query.filter_by(name="Vin Diesel").count() == 1
+    tag_ids = {tag.tagId for tag in Tag.query.filter(Tag.movieId.in_([1, second_movie.id])) if tag.tag == "action"}
+    assert len(tag_ids) == 1
+
+
+def test_orm_rows_reuse_existing_names(test_client, init_database):
+    db.session.add_all([Tag("drama", 1), Tag("drama", 1), Cast("Vin Diesel", 1)])
+    db.session.commit()
+
+    assert TagName.query.filter_by(name="drama").count() == 1
+    assert Person.query.filter_by(name="Vin Diesel").count() == 1
+    assert [tag.tag for tag in Tag.query.filter_by(movieId=1) if tag.tag == "drama"] == ["drama", "drama"]
+
+
+def test_movie_page_shows_interned_names(test_client, init_database, log_in_default_user):
+    response = test_client.get("/movie/1")
+
+    assert response.status_code == 200
+    assert b"cars" in response.data
+    assert b"Vin Diesel" in response.data
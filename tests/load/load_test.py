@@ -0,0 +1,109 @@
+"""
+Load test comparing the sync (WSGI) and async (ASGI) serving modes on the read-heavy pages.
+
+Start both servers against the same database, e.g.
+
+    gunicorn main:app --threads 4 --bind 127.0.0.1:8000
+    ASYNC_VIEWS=true uvicorn asgi:app --port 8001
+
+then run
+
+    python tests/load/load_test.py --email test@test.com --password testpassword \\
+        --target sync=http://127.0.0.1:8000 --target async=http://127.0.0.1:8001
+
+Each target is hit by `--concurrency` logged-in clients for `--requests` requests in total,
+spread over the watchlist, a movie page and the status page, and the throughput and latency
+percentiles are printed side by side.
+"""
+import argparse
+import itertools
+import re
+import statistics
+import threading
+import time
+
+import requests
+
+PATHS = ("/index", "/movie/{movie_id}", "/auth/status")
+
+
+def logged_in_session(base_url: str, email: str, password: str) -> requests.Session:
+    session = requests.Session()
+    login_page = session.get(f"{base_url}/auth/login").text
+    csrf_token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', login_page)
+    data = {"email": email, "password": password, "csrf_token": csrf_token.group(1) if csrf_token else ""}
+    response = session.post(f"{base_url}/auth/login", data=data, allow_redirects=False)
+    if response.status_code != 302 or response.headers["Location"].endswith("/auth/login"):
+        raise SystemExit(f"Could not log in to {base_url} as {email}")
+    return session
+
+
+def run_target(base_url: str, args) -> dict:
+    paths = itertools.cycle(path.format(movie_id=args.movie_id) for path in PATHS)
+    lock = threading.Lock()
+    timings, errors = [], 0
+    remaining = args.requests
+
+    def worker():
+        nonlocal remaining, errors
+        session = logged_in_session(base_url, args.email, args.password)
+        while True:
+            with lock:
+                if remaining <= 0:
+                    return
+                remaining -= 1
+                path = next(paths)
+            started = time.perf_counter()
+            try:
+                ok = session.get(f"{base_url}{path}", allow_redirects=False).status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                timings.append(elapsed)
+                errors += not ok
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    timings.sort()
+    percentile = lambda p: timings[min(len(timings) - 1, int(len(timings) * p))] * 1000
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "req/s": len(timings) / duration,
+        "mean ms": statistics.mean(timings) * 1000,
+        "p50 ms": percentile(0.50),
+        "p95 ms": percentile(0.95),
+        "p99 ms": percentile(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", required=True, help="name=base_url, may be repeated")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--movie-id", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    results = {}
+    for target in args.target:
+        name, base_url = target.split("=", 1)
+        results[name] = run_target(base_url.rstrip("/"), args)
+
+    columns = list(next(iter(results.values())))
+    print(f"{'target':<10}" + "".join(f"{column:>12}" for column in columns))
+    for name, result in results.items():
+        print(f"{name:<10}" + "".join(f"{result[column]:>12.1f}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+from webapp.cache import LRUBackend, SQLiteBackend
+
+
+def test_lru_backend_evicts_least_recently_used():
+    backend = LRUBackend(maxsize=2)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.get("a")
+    backend.set("c", "3")
+
+    assert backend.get("a") == "1"
+    assert backend.get("b") is None
+    assert backend.get("c") == "3"
+
+
+def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = SQLiteBackend(path)
+    second = SQLiteBackend(path)
+
+    first.set("page", "<html></html>")
+
+    assert second.get("page") == "<html></html>"
+
+
+def test_sqlite_backend_trims_oldest_entries(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.db"), maxsize=2)
+    for key in "abc":
+        backend.set(key, key)
+
+    assert backend.get("a") is None
+    assert backend.get("c") == "c"
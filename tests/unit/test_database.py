@@ -0,0 +1,46 @@
+import sqlalchemy as sa
+
+from config import Config
+from webapp.database import configure_engine, engine_options, pool_limits
+
+
+def make_config(**overrides):
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config.update(overrides)
+    return config
+
+
+def test_pool_limits_follow_thread_count():
+    config = make_config(DB_POOL_SIZE=8, DB_MAX_OVERFLOW=8, DB_MAX_CONNECTIONS=0)
+
+    assert pool_limits(config) == (8, 8)
+
+
+def test_pool_limits_share_max_connections_between_workers():
+    config = make_config(DB_POOL_SIZE=8, DB_MAX_OVERFLOW=8, DB_MAX_CONNECTIONS=40, WEB_CONCURRENCY=4)
+
+    assert pool_limits(config) == (8, 2)
+
+
+def test_engine_options_skip_in_memory_sqlite():
+    assert engine_options(make_config(SQLALCHEMY_DATABASE_URI="sqlite://")) == {}
+
+
+def test_engine_options_for_postgres():
+    config = make_config(SQLALCHEMY_DATABASE_URI="postgresql://localhost/movies", DB_POOL_PRE_PING=True)
+    options = engine_options(config)
+
+    assert options["pool_pre_ping"] is True
+    assert "connect_args" not in options
+
+
+def test_sqlite_pragmas_applied_to_new_connections(tmp_path):
+    config = make_config(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}")
+    engine = sa.create_engine(config["SQLALCHEMY_DATABASE_URI"], **engine_options(config))
+    configure_engine(engine, config)
+
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == config["SQLITE_BUSY_TIMEOUT"]
+    engine.dispose()
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from webapp.hashing import HashingBusy, HashingExecutor
+from webapp.models import PBKDF2Hasher
+
+
+def make_executor(workers=1, queue_size=0, timeout=10):
+    app = Flask(__name__)
+    app.config.update(
+        PASSWORD_HASH_WORKERS=workers,
+        PASSWORD_HASH_QUEUE_SIZE=queue_size,
+        PASSWORD_HASH_TIMEOUT=timeout,
+        PASSWORD_HASH_RETRY_AFTER=2,
+    )
+    return HashingExecutor(app)
+
+
+def test_executor_without_workers_runs_inline():
+    executor = make_executor(workers=0)
+
+    assert executor.enabled is False
+    assert executor.run(sum, [1, 2, 3]) == 6
+
+
+def test_executor_hashes_in_worker_process():
+    executor = make_executor()
+    hasher = PBKDF2Hasher(iterations=1000)
+    try:
+        hashed = executor.run(hasher.hash, "FlaskIsAwesome")
+        assert executor.run(hasher.verify, hashed, "FlaskIsAwesome") is True
+    finally:
+        executor.shutdown()
+
+
+def test_executor_rejects_work_beyond_its_queue():
+    executor = make_executor(workers=1, queue_size=0)
+    executor.run(sum, [0])  # start the worker process
+    busy = threading.Thread(target=executor.run, args=(time.sleep, 1))
+    busy.start()
+    try:
+        time.sleep(0.2)
+        with pytest.raises(HashingBusy) as e:
+            executor.run(sum, [1])
+        assert e.value.code == 503
+        assert e.value.get_response().headers["Retry-After"] == "2"
+    finally:
+        busy.join()
+        executor.shutdown()
+
+
+def test_executor_keeps_the_slot_of_a_timed_out_hash():
+    executor = make_executor(workers=1, queue_size=0, timeout=0.2)
+    executor.run(sum, [0])  # start the worker process
+    try:
+        with pytest.raises(HashingBusy):
+            executor.run(time.sleep, 1)
+        # The worker is still hashing, so another job is refused without being queued behind it
+        started = time.monotonic()
+        with pytest.raises(HashingBusy):
+            executor.run(sum, [1])
+        assert time.monotonic() - started < 0.1
+        time.sleep(1)
+        assert executor.run(sum, [1]) == 1
+    finally:
+        executor.shutdown()
@@ -0,0 +1,76 @@
+import io
+import json
+import logging
+import queue
+
+from flask import Flask
+
+from webapp.log_pipeline import DroppingQueueHandler, JSONFormatter, LogPipeline, SamplingFilter
+
+
+def make_record(level=logging.INFO, lineno=10, msg="message", args=()):
+    return logging.LogRecord("webapp", level, "webapp/module.py", lineno, msg, args, None)
+
+
+def test_json_formatter_includes_request_fields():
+    record = make_record(msg="Movie %s added", args=("Alien",))
+    record.request_id = "abc"
+    record.status = 201
+
+    data = json.loads(JSONFormatter().format(record))
+
+    assert data["message"] == "Movie Alien added"
+    assert data["level"] == "INFO"
+    assert data["request_id"] == "abc"
+    assert data["status"] == 201
+    assert "user_id" not in data
+
+
+def test_sampling_keeps_one_in_every_per_call_site():
+    sampling = SamplingFilter(every=3)
+
+    kept = [sampling.filter(make_record()) for _ in range(6)]
+    other_site = sampling.filter(make_record(lineno=20))
+
+    assert kept == [True, False, False, True, False, False]
+    assert other_site
+
+
+def test_sampling_always_keeps_warnings():
+    sampling = SamplingFilter(every=100)
+
+    assert all(sampling.filter(make_record(level=logging.WARNING)) for _ in range(5))
+
+
+def test_full_queue_drops_records_without_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+
+    for _ in range(5):
+        handler.emit(make_record())
+
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_pipeline_writes_request_records():
+    app = Flask(__name__)
+    app.config.update(LOG_QUEUE_SIZE=100, LOG_SAMPLE_EVERY=1, LOG_SAMPLE_MAX_LEVEL="INFO")
+    app.logger.setLevel(logging.INFO)
+    stream = io.StringIO()
+    pipeline = LogPipeline()
+    pipeline.init_app(app, [logging.StreamHandler(stream)])
+
+    @app.get("/ping")
+    def ping():
+        app.logger.info("pong")
+        return "pong"
+
+    response = app.test_client().get("/ping", headers={"X-Request-ID": "req-1"})
+    pipeline.stop()
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert response.headers["X-Request-ID"] == "req-1"
+    assert [record["message"] for record in records] == ["pong", "GET /ping 200"]
+    assert all(record["request_id"] == "req-1" and record["endpoint"] == "ping" for record in records)
+    assert records[1]["status"] == 200
+    assert "duration_ms" in records[1]
@@ -0,0 +1,11 @@
+from webapp.metrics import Histogram
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 5))
+    for value in (0.5, 1, 3, 7):
+        histogram.observe(value)
+
+    assert list(histogram.cumulative()) == [(1, 2), (5, 3), ("+Inf", 4)]
+    assert histogram.sum == 11.5
+    assert histogram.count == 4
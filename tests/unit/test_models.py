@@ -1,5 +1,7 @@
 import re
 
+from webapp.models import PBKDF2Hasher, ScryptHasher, User
+
 
 def test_new_user(new_user):
     """
@@ -150,3 +152,30 @@ def test_update_last_seen_movie(new_movie):
     # assert movie.director == "Justin Lin"
     # assert movie.year == 2020
     # assert movie.last_seen is not None
+
+
+def test_scrypt_hasher_round_trip():
+    hasher = ScryptHasher(n=2**10)
+    hashed = hasher.hash("FlaskIsAwesome")
+
+    assert hashed.startswith("scrypt:1024:8:1$")
+    assert hasher.verify(hashed, "FlaskIsAwesome") is True
+    assert hasher.verify(hashed, "FlaskIsNotAwesome") is False
+
+
+def test_pbkdf2_hasher_needs_rehash_when_cost_changes():
+    hashed = PBKDF2Hasher(iterations=1000).hash("FlaskIsAwesome")
+
+    assert PBKDF2Hasher(iterations=1000).needs_rehash(hashed) is False
+    assert PBKDF2Hasher(iterations=2000).needs_rehash(hashed) is True
+
+
+def test_legacy_hash_upgraded_on_check_password():
+    user = User("legacy@gmail.com", "FlaskIsAwesome", method="sha256")
+    assert user.password_hashed.startswith("sha256$")
+
+    assert user.check_password("FlaskIsNotAwesome") is False
+    assert user.password_hashed.startswith("sha256$")
+    assert user.check_password("FlaskIsAwesome") is True
+    assert user.password_hashed.startswith("pbkdf2:sha256:")
+    assert user.check_password("FlaskIsAwesome") is True
@@ -0,0 +1,64 @@
+import pytest
+import sqlalchemy as sa
+
+from webapp.query_budget import QueryBudget, QueryBudgetExceeded, statement_shape
+
+
+@pytest.fixture
+def engine():
+    engine = sa.create_engine("sqlite://")
+    yield engine
+    engine.dispose()
+
+
+def test_statement_shape_collapses_in_lists():
+    assert statement_shape("SELECT * FROM movie\nWHERE id IN (?, ?, ?)") == "SELECT * FROM movie WHERE id IN (?)"
+    assert statement_shape("SELECT * FROM movie WHERE id IN (?)") == "SELECT * FROM movie WHERE id IN (?)"
+
+
+def test_query_budget_within_budget(engine):
+    with engine.connect() as connection, QueryBudget(2) as budget:
+        connection.exec_driver_sql("SELECT 1")
+        connection.exec_driver_sql("SELECT 2")
+
+    assert len(budget.statements) == 2
+
+
+def test_query_budget_exceeded(engine):
+    with pytest.raises(QueryBudgetExceeded, match="3 SQL statements run, the budget is 2"):
+        with engine.connect() as connection, QueryBudget(2):
+            for number in range(3):
+                connection.exec_driver_sql(f"SELECT {number}")
+
+
+def test_query_budget_as_decorator(engine):
+    @QueryBudget(0)
+    def run_query():
+        with engine.connect() as connection:
+            connection.exec_driver_sql("SELECT 1")
+
+    with pytest.raises(QueryBudgetExceeded):
+        run_query()
+
+
+def test_repeated_query_detector_warns_once_per_shape(engine, caplog):
+    from flask import Flask
+
+    from webapp.query_budget import RepeatedQueryDetector
+
+    app = Flask(__name__)
+    app.config["QUERY_REPEAT_THRESHOLD"] = 2
+    RepeatedQueryDetector(app)
+
+    @app.route("/loop")
+    def loop():
+        with engine.connect() as connection:
+            for number in range(5):
+                connection.exec_driver_sql("SELECT ?", (number,))
+        return "done"
+
+    app.test_client().get("/loop")
+
+    warnings = [record for record in caplog.records if "Possible N+1 query in loop" in record.getMessage()]
+    assert len(warnings) == 1
+    assert "SELECT ?" in warnings[0].getMessage()
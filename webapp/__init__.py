@@ -1,14 +1,22 @@
 import os
 import logging
+import threading
 from logging.handlers import RotatingFileHandler
 from config import DevelopmentConfig
 import sqlalchemy as sa
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask.logging import default_handler
+import click
 from click import echo
+from webapp.aio import AsyncDatabase
+from webapp.cache import ResponseCache, TTLCache
+from webapp.database import configure_engine, describe_pool, engine_options
+from webapp.hashing import HashingExecutor
+from webapp.log_pipeline import LogPipeline
+from webapp.metrics import Metrics
+from webapp.query_budget import RepeatedQueryDetector
 
 # -------------
 # Configuration
@@ -16,10 +24,26 @@ from click import echo
 
 
 db = SQLAlchemy()
-migrate = Migrate()
 login = LoginManager()
 login.login_view = "auth.login"
 login.login_message = "Please login to access this page"
+response_cache = ResponseCache()
+# Identity cache used by the Flask-Login user loader
+user_cache = TTLCache()
+# Async engine of the async views, set up only when ASYNC_VIEWS is on
+async_db = AsyncDatabase()
+# Optional process pool for password hashing
+hashing_executor = HashingExecutor()
+# Queue-based JSON logging, used when LOG_ASYNC is on
+log_pipeline = LogPipeline()
+# Request latency and SQL statistics, served at /metrics
+metrics = Metrics()
+# Warns about statements repeated within a request, switched on by QUERY_REPEAT_THRESHOLD
+repeated_query_detector = RepeatedQueryDetector()
+# Results of the table checks run by `create_app` and the status page
+schema_cache = TTLCache(maxsize=8)
+# Facet counts of the watchlist page, per user, watchlist version and filters
+facet_cache = TTLCache()
 
 
 # ----------------------------
@@ -40,16 +64,13 @@ def create_app():
     configure_logging(app)
     register_cli_commands(app)
 
-    # Check if the database needs to be initialized
-    engine = sa.create_engine(app.config["SQLALCHEMY_DATABASE_URI"])
-    inspector = sa.inspect(engine)
-    if not inspector.has_table("user"):
-        with app.app_context():
-            db.drop_all()
-            db.create_all()
-            app.logger.info("Initialized the database!")
-    else:
-        app.logger.info("Database already contains the users table.")
+    with app.app_context():
+        app.logger.info(describe_pool(db.engine, app.config))
+        if app.config["DEFER_SCHEMA_CHECK"]:
+            # Let the worker start serving without opening a database connection
+            defer_schema_check(app)
+        else:
+            check_schema(app)
 
     return app
 
@@ -60,33 +81,95 @@ def create_app():
 
 
 def initialize_extensions(app):
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config))
     db.init_app(app)
-    migrate.init_app(app, db)
+    with app.app_context():
+        configure_engine(db.engine, app.config)
+    if click.get_current_context(silent=True) is not None:
+        # Flask-Migrate imports Alembic, which is only needed by the `flask db` commands
+        from flask_migrate import Migrate
+
+        Migrate(app, db)
     login.init_app(app)
+    response_cache.init_app(app)
+    hashing_executor.init_app(app)
+    metrics.init_app(app)
+    repeated_query_detector.init_app(app)
+    user_cache.configure(maxsize=app.config["USER_CACHE_SIZE"], ttl=app.config["USER_CACHE_TTL"])
+    schema_cache.configure(maxsize=8, ttl=app.config["SCHEMA_CHECK_TTL"])
+    facet_cache.configure(maxsize=app.config["FACET_CACHE_SIZE"], ttl=app.config["FACET_CACHE_TTL"])
     app.debug = 1
 
 
+def check_schema(app):
+    """Create the tables if the database does not have them yet."""
+    if not sa.inspect(db.engine).has_table("user"):
+        db.drop_all()
+        db.create_all()
+        app.logger.info("Initialized the database!")
+    else:
+        app.logger.info("Database already contains the users table.")
+
+
+def defer_schema_check(app):
+    """Run `check_schema` once, before the first request handled by this process."""
+    lock = threading.Lock()
+    pending = True
+
+    @app.before_request
+    def check_schema_once():
+        nonlocal pending
+        if not pending:
+            return
+        with lock:
+            if pending:
+                check_schema(app)
+                pending = False
+
+
 def register_blueprints(app):
     from webapp.movie.routes import bp as movie_bp
     from webapp.auth.routes import bp as auth_bp
+    from webapp.api.routes import bp as api_bp
 
     app.register_blueprint(movie_bp, url_prefix="/")
     app.register_blueprint(auth_bp, url_prefix="/auth")
+    app.register_blueprint(api_bp, url_prefix="/api/v1")
+
+    if app.config["ASYNC_VIEWS"]:
+        from webapp.async_views import register_async_views
+
+        register_async_views(app)
 
 
 def configure_logging(app):
-    if app.config["LOG_WITH_GUNICORN"]:
+    if app.config["LOG_WITH_GUNICORN"] and app.config["LOG_ASYNC"]:
+        # The listener thread writes to stderr, which gunicorn collects in its error log
+        handlers = [logging.StreamHandler()]
+    elif app.config["LOG_WITH_GUNICORN"]:
         gunicorn_error_logger = logging.getLogger("gunicorn.error")
-        app.logger.handlers.extend(gunicorn_error_logger.handlers)
+        handlers = gunicorn_error_logger.handlers
         app.logger.setLevel(logging.DEBUG)
     else:
-        file_handler = RotatingFileHandler("instance/logs/flask-user-management.log", maxBytes=16384, backupCount=20)
+        file_handler = RotatingFileHandler(
+            "instance/logs/flask-user-management.log",
+            maxBytes=app.config["LOG_FILE_MAX_BYTES"],
+            backupCount=app.config["LOG_FILE_BACKUP_COUNT"],
+        )
         file_formatter = logging.Formatter(
             "%(asctime)s %(levelname)s %(threadName)s-%(thread)d: %(message)s [in %(filename)s:%(lineno)d]"
         )
         file_handler.setFormatter(file_formatter)
         file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
+        handlers = [file_handler]
+
+    if app.config["LOG_ASYNC"]:
+        # The pipeline writes an access record per request, at INFO
+        if app.logger.level == logging.NOTSET:
+            app.logger.setLevel(logging.INFO)
+        log_pipeline.init_app(app, handlers)
+    else:
+        app.logger.handlers.extend(handlers)
 
     # Remove the default logger configured by Flask
     app.logger.removeHandler(default_handler)
@@ -100,3 +183,124 @@ def register_cli_commands(app):
         db.drop_all()
         db.create_all()
         echo("Initialized the database!")
+
+    @app.cli.command("import-watchlist")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--email", required=True, help="Email of the user who owns the imported movies.")
+    @click.option("--format", "file_format", type=click.Choice(["csv", "jsonl"]), help="Defaults to the file extension.")
+    @click.option("--batch-size", default=500, show_default=True, type=click.IntRange(min=1))
+    def import_watchlist_command(path, email, file_format, batch_size):
+        """Stream a CSV or JSONL watchlist export into a user's watchlist."""
+        from webapp.models import User
+        from webapp.movie.similar import rebuild_neighbours
+        from webapp.movie.stats import rebuild_stats
+        from webapp.movie.transfer import import_watchlist, read_watchlist_rows
+
+        user = User.query.filter_by(email=email).first()
+        if user is None:
+            raise click.ClickException(f"No user registered with the email {email}")
+
+        def report(result):
+            echo(f"{result.imported} imported, {result.skipped} skipped ({result.rows_per_second:.0f} rows/sec)")
+
+        def skip(line_number, error):
+            echo(f"Skipping line {line_number}: {error}", err=True)
+
+        user_id = user.id
+        result = import_watchlist(
+            read_watchlist_rows(path, file_format), user_id, batch_size=batch_size, on_batch=report, on_skip=skip
+        )
+        # The batches are committed as they go, so the counters and neighbours are recomputed once at the end
+        rebuild_stats(user_id)
+        rebuild_neighbours(app.config["SIMILAR_MOVIES"], user_id)
+        User.bump_watchlist_version(user_id)
+        db.session.commit()
+        echo(
+            f"Imported {result.imported} movies ({result.skipped} skipped) in {result.seconds:.2f}s"
+            f" - {result.rows_per_second:.0f} rows/sec"
+        )
+
+    @app.cli.command("export-watchlist")
+    @click.option("--email", required=True, help="Email of the user whose watchlist is exported.")
+    @click.option("--format", "file_format", type=click.Choice(["csv", "jsonl"]), default="csv", show_default=True)
+    @click.option("--output", type=click.File("w", encoding="utf-8"), default="-", help="Defaults to stdout.")
+    def export_watchlist_command(email, file_format, output):
+        """Stream a user's watchlist to a CSV or JSONL file."""
+        from webapp.models import User
+        from webapp.movie.transfer import EXPORT_WRITERS, iter_watchlist_export
+
+        user = User.query.filter_by(email=email).first()
+        if user is None:
+            raise click.ClickException(f"No user registered with the email {email}")
+
+        records = iter_watchlist_export(user.id, chunk_size=app.config["EXPORT_CHUNK_SIZE"])
+        for chunk in EXPORT_WRITERS[file_format](records):
+            output.write(chunk)
+
+    @app.cli.command("benchmark-hashing")
+    @click.option("--rounds", default=20, show_default=True, type=click.IntRange(min=1), help="Hashes per scheme.")
+    def benchmark_hashing_command(rounds):
+        """Report the hashing throughput and latency of each password scheme with the configured costs."""
+        import time
+        from webapp.models import configured_hashers
+
+        for name, hasher in configured_hashers().items():
+            timings = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                hasher.hash("correct horse battery staple")
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+            echo(
+                f"{name:<8} {hasher.method:<24} {len(timings) / sum(timings):10.1f} hashes/s"
+                f"  mean {sum(timings) / len(timings) * 1000:8.2f} ms  p99 {p99 * 1000:8.2f} ms"
+            )
+
+    @app.cli.command("reindex-search")
+    @click.option("--batch-size", default=1000, show_default=True, type=click.IntRange(min=1))
+    def reindex_search_command(batch_size):
+        """Rebuild the full-text search index from the movie tables."""
+        from webapp.movie.search import rebuild_index
+
+        echo(f"Indexed {rebuild_index(batch_size=batch_size)} movies for search.")
+
+    @app.cli.command("rebuild-stats")
+    @click.option("--email", help="Only rebuild the statistics of this user.")
+    def rebuild_stats_command(email):
+        """Recompute the watchlist statistics counters from the movie tables."""
+        import time
+        from webapp.models import User
+        from webapp.movie.stats import rebuild_stats
+
+        user_id = None
+        if email is not None:
+            user = User.query.filter_by(email=email).first()
+            if user is None:
+                raise click.ClickException(f"No user registered with the email {email}")
+            user_id = user.id
+
+        started = time.perf_counter()
+        counters = rebuild_stats(user_id)
+        db.session.commit()
+        echo(f"Rebuilt {counters} statistics counters in {time.perf_counter() - started:.2f}s.")
+
+    @app.cli.command("rebuild-neighbours")
+    @click.option("--email", help="Only rebuild the similar movies of this user's watchlist.")
+    def rebuild_neighbours_command(email):
+        """Recompute the similar movies of every movie from their directors, tags, cast and series."""
+        import time
+        from webapp.models import User
+        from webapp.movie.similar import rebuild_neighbours
+
+        user_id = None
+        if email is not None:
+            user = User.query.filter_by(email=email).first()
+            if user is None:
+                raise click.ClickException(f"No user registered with the email {email}")
+            user_id = user.id
+
+        started = time.perf_counter()
+        neighbours = rebuild_neighbours(app.config["SIMILAR_MOVIES"], user_id)
+        db.session.commit()
+        echo(f"Rebuilt {neighbours} similar movies in {time.perf_counter() - started:.2f}s.")
@@ -0,0 +1,43 @@
+from contextlib import asynccontextmanager
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+# Drivers used by the async engine for each database the app supports
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_database_url(uri: str):
+    """Turn the `SQLALCHEMY_DATABASE_URI` into the URL of the matching async driver."""
+    url = make_url(uri)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+class AsyncDatabase:
+    """Async engine and sessions used by the async views.
+
+    Flask runs each async view in an event loop of its own, and aiosqlite and asyncpg connections
+    are bound to the loop that opened them, so connections are not pooled across requests.
+    Pooling belongs to the database side here (pgbouncer), or to a native ASGI framework.
+    """
+
+    def __init__(self, app=None):
+        self.engine = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Imported here so the async drivers are only required when async views are switched on
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        self.engine = create_async_engine(
+            async_database_url(app.config["SQLALCHEMY_DATABASE_URI"]), poolclass=NullPool
+        )
+        app.extensions["async_db"] = self
+
+    @asynccontextmanager
+    async def session(self):
+        from sqlalchemy.ext.asyncio import AsyncSession
+
+        async with AsyncSession(self.engine, expire_on_commit=False) as session:
+            yield session
@@ -0,0 +1,296 @@
+import datetime
+from dataclasses import asdict
+from typing import Iterable, List
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from flask_login import current_user
+from pydantic import ValidationError
+from werkzeug.exceptions import HTTPException
+
+from webapp import db
+from webapp.api.schemas import MovieChildren, MovieCreate, MoviesCreate, MovieUpdate, StatusBatch, TagsBatch
+from webapp.models import Cast, Movie, Series, Tag, User
+from webapp.movie.facets import WatchlistFilters, load_facets
+from webapp.movie.queries import (
+    WatchlistSort,
+    bulk_insert_movie_children,
+    insert_movie_children,
+    load_movie_details,
+    new_children,
+    paginate_movies,
+)
+from webapp.movie.schemas import MovieModel
+from webapp.movie.search import reindex_movies, remove_from_index
+from webapp.movie.similar import update_neighbours
+from webapp.movie.stats import child_stat_keys, movie_stat_keys, stored_child_stat_keys, update_stats
+
+
+bp = Blueprint("api", __name__)
+
+CHILD_MODELS = {"tags": Tag, "cast": Cast, "series": Series}
+# Movie columns that feed the search index
+INDEXED_FIELDS = {"title", "director", "description"}
+
+
+@bp.before_request
+def require_login():
+    if not current_user.is_authenticated:
+        abort(401)
+
+
+@bp.errorhandler(HTTPException)
+def http_error(e):
+    return jsonify(error=e.name, message=e.description), e.code
+
+
+@bp.errorhandler(ValidationError)
+def validation_error(e):
+    return jsonify(error="Unprocessable Entity", message="Invalid data submitted", details=e.errors()), 422
+
+
+# ----------------
+# Helper Functions
+# ----------------
+
+
+def parse_body(model):
+    data = request.get_json(silent=True)
+    if data is None:
+        abort(400, "Expected a JSON body")
+    return model.parse_obj(data)
+
+
+def check_batch_size(items: List) -> None:
+    limit = current_app.config["API_MAX_BATCH_SIZE"]
+    if len(items) > limit:
+        abort(400, f"Batches are limited to {limit} items")
+
+
+def owned_movies(movie_ids: Iterable[int]) -> dict:
+    """Load the current user's movies with the given ids in one query, or abort with 404 if any is missing."""
+    movie_ids = set(movie_ids)
+    movies = {movie.id: movie for movie in Movie.query.filter(Movie.id.in_(movie_ids), Movie.userId == current_user.id)}
+    missing = sorted(movie_ids - movies.keys())
+    if missing:
+        abort(404, f"Movies not found: {', '.join(map(str, missing))}")
+    return movies
+
+
+def features_changed(changed=(), removed=()) -> None:
+    update_neighbours(current_user.id, current_app.config["SIMILAR_MOVIES"], changed=changed, removed=removed)
+
+
+def movie_details_json(movie_id: int):
+    movie = load_movie_details(movie_id)
+    if movie is None or movie.userId != current_user.id:
+        abort(404, f"Movie not found: {movie_id}")
+
+    data = asdict(movie)
+    if movie.last_seen is not None:
+        data["last_seen"] = movie.last_seen.isoformat()
+    return data
+
+
+def apply_update(movie: Movie, update) -> bool:
+    """Apply a `MovieUpdate` or `MovieStatus` to a movie and its statistics.
+
+    Returns whether its search document changed.
+    """
+    stat_keys = movie_stat_keys(movie)
+    fields = update.dict(exclude_unset=True, exclude={"id", "rating", "last_seen", "watched"})
+    if fields:
+        merged = MovieModel(**{name: fields.get(name, getattr(movie, name)) for name in MovieModel.__fields__})
+        for name in fields:
+            setattr(movie, name, getattr(merged, name))
+
+    if update.rating is not None:
+        movie.rating = update.rating
+    if update.last_seen is not None:
+        movie.last_seen = update.last_seen
+    elif update.watched:
+        movie.last_seen = datetime.datetime.today()
+    update_stats(movie.userId, added=movie_stat_keys(movie), removed=stat_keys)
+    return bool(INDEXED_FIELDS & fields.keys())
+
+
+def create_movies(movies: List[MovieCreate]) -> List[Movie]:
+    """Add movies and their children to the current transaction with one insert per table."""
+    created = [Movie(userId=current_user.id, **movie.dict(include=set(MovieModel.__fields__))) for movie in movies]
+    db.session.add_all(created)
+    db.session.flush()
+    bulk_insert_movie_children((movie.id, data.cast, data.tags, data.series) for movie, data in zip(created, movies))
+    reindex_movies(movie.id for movie in created)
+    update_stats(
+        current_user.id,
+        added=[
+            key
+            for movie, data in zip(created, movies)
+            for key in movie_stat_keys(movie) + child_stat_keys(cast=data.cast, tags=data.tags)
+        ],
+    )
+    features_changed(changed=[movie.id for movie in created])
+    User.bump_watchlist_version(current_user.id)
+    return created
+
+
+# ------
+# Movies
+# ------
+
+
+@bp.get("/movies")
+def list_movies():
+    per_page = request.args.get("per_page", default=current_app.config["MOVIES_PER_PAGE"], type=int)
+    per_page = min(max(per_page, 1), current_app.config["MAX_MOVIES_PER_PAGE"])
+    sort = WatchlistSort.from_args(request.args)
+    page = paginate_movies(
+        current_user.id,
+        per_page=per_page,
+        after=request.args.get("after", type=sort.parse_cursor),
+        before=request.args.get("before", type=sort.parse_cursor),
+        filters=WatchlistFilters.from_args(request.args),
+        sort=sort,
+    )
+    return jsonify(
+        movies=[dict(movie._mapping) for movie in page.movies],
+        next_cursor=page.next_cursor,
+        prev_cursor=page.prev_cursor,
+    )
+
+
+@bp.get("/movies/facets")
+def movie_facets():
+    facets = load_facets(current_user, WatchlistFilters.from_args(request.args))
+    return jsonify(facets=[asdict(facet) for facet in facets])
+
+
+@bp.post("/movies")
+def create_movie():
+    movie = create_movies([parse_body(MovieCreate)])[0]
+    db.session.commit()
+    current_app.logger.info(f"Movie ({movie.title}) was added for user: {current_user.id}!")
+    return jsonify(movie_details_json(movie.id)), 201
+
+
+@bp.get("/movies/<int:movie_id>")
+def get_movie(movie_id):
+    return jsonify(movie_details_json(movie_id))
+
+
+@bp.patch("/movies/<int:movie_id>")
+def update_movie(movie_id):
+    update = parse_body(MovieUpdate)
+    movie = owned_movies([movie_id])[movie_id]
+
+    if apply_update(movie, update):
+        reindex_movies([movie.id])
+    if update.director is not None:
+        features_changed(changed=[movie.id])
+    User.bump_watchlist_version(current_user.id)
+    db.session.commit()
+    return jsonify(movie_details_json(movie_id))
+
+
+@bp.delete("/movies/<int:movie_id>")
+def delete_movie(movie_id):
+    movie = owned_movies([movie_id])[movie_id]
+
+    update_stats(current_user.id, removed=movie_stat_keys(movie) + stored_child_stat_keys([movie_id]))
+    features_changed(removed=[movie_id])
+    for model in CHILD_MODELS.values():
+        model.query.filter_by(movieId=movie_id).delete(synchronize_session=False)
+    remove_from_index([movie_id])
+    db.session.delete(movie)
+    User.bump_watchlist_version(current_user.id)
+    db.session.commit()
+    current_app.logger.info(f"Movie ({movie.title}) was deleted for user: {current_user.id}!")
+    return "", 204
+
+
+# ---------------------
+# Tags, cast and series
+# ---------------------
+
+
+@bp.get("/movies/<int:movie_id>/<any(tags, cast, series):kind>")
+def list_children(movie_id, kind):
+    return jsonify(movie_details_json(movie_id)[kind])
+
+
+@bp.post("/movies/<int:movie_id>/<any(tags, cast, series):kind>")
+def add_children(movie_id, kind):
+    children = parse_body(MovieChildren)
+    owned_movies([movie_id])
+
+    [(_, values)] = new_children(CHILD_MODELS[kind], [(movie_id, children.values)])
+    insert_movie_children(movie_id, **{kind: values})
+    reindex_movies([movie_id])
+    update_stats(current_user.id, added=child_stat_keys(**{kind: values}))
+    features_changed(changed=[movie_id])
+    User.bump_watchlist_version(current_user.id)
+    db.session.commit()
+    return jsonify(movie_details_json(movie_id)[kind]), 201
+
+
+@bp.delete("/movies/<int:movie_id>/<any(tags, cast, series):kind>/<int:child_id>")
+def delete_child(movie_id, kind, child_id):
+    owned_movies([movie_id])
+    child = CHILD_MODELS[kind].query.filter_by(id=child_id, movieId=movie_id).first()
+    if child is None:
+        abort(404, f"Not found: {kind} {child_id} of movie {movie_id}")
+
+    update_stats(current_user.id, removed=child_stat_keys(**{kind: [child.term.name]}))
+    db.session.delete(child)
+    reindex_movies([movie_id])
+    features_changed(changed=[movie_id])
+    User.bump_watchlist_version(current_user.id)
+    db.session.commit()
+    return "", 204
+
+
+# -------
+# Batches
+# -------
+
+
+@bp.post("/movies/batch")
+def create_movies_batch():
+    """Create several movies, with their children, in a single transaction."""
+    batch = parse_body(MoviesCreate)
+    check_batch_size(batch.movies)
+
+    created = create_movies(batch.movies)
+    db.session.commit()
+    current_app.logger.info(f"{len(created)} movies were added for user: {current_user.id}!")
+    return jsonify(movies=[{"id": movie.id, "title": movie.title} for movie in created]), 201
+
+
+@bp.patch("/movies/batch")
+def update_movies_batch():
+    """Rate several movies and/or mark them as watched in a single transaction."""
+    batch = parse_body(StatusBatch)
+    check_batch_size(batch.movies)
+    movies = owned_movies(status.id for status in batch.movies)
+
+    for status in batch.movies:
+        apply_update(movies[status.id], status)
+    User.bump_watchlist_version(current_user.id)
+    db.session.commit()
+    return jsonify(updated=len(batch.movies))
+
+
+@bp.post("/tags/batch")
+def add_tags_batch():
+    """Add tags to several movies in a single transaction."""
+    batch = parse_body(TagsBatch)
+    check_batch_size(batch.items)
+    owned_movies(item.movie_id for item in batch.items)
+
+    tags = new_children(Tag, ((item.movie_id, item.tags) for item in batch.items))
+    bulk_insert_movie_children((movie_id, (), movie_tags, ()) for movie_id, movie_tags in tags)
+    reindex_movies({item.movie_id for item in batch.items})
+    update_stats(current_user.id, added=[key for _, movie_tags in tags for key in child_stat_keys(tags=movie_tags)])
+    features_changed(changed={item.movie_id for item in batch.items})
+    User.bump_watchlist_version(current_user.id)
+    db.session.commit()
+    return jsonify(updated=len({item.movie_id for item in batch.items})), 201
@@ -0,0 +1,58 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, conint, conlist
+
+from webapp.movie.schemas import MovieModel
+
+
+Rating = conint(ge=1, le=5)
+
+
+class MovieCreate(MovieModel):
+    """Class for parsing a new movie, with its children, from a JSON body."""
+
+    cast: List[str] = []
+    tags: List[str] = []
+    series: List[str] = []
+
+
+class MovieUpdate(BaseModel):
+    """Class for parsing the fields of a movie to change; the merged movie is validated by `MovieModel`."""
+
+    title: Optional[str]
+    director: Optional[str]
+    year: Optional[int]
+    description: Optional[str]
+    video_link: Optional[str]
+    rating: Optional[Rating]
+    last_seen: Optional[datetime]
+    watched: bool = False
+
+
+class MovieChildren(BaseModel):
+    values: conlist(str, min_items=1)
+
+
+class MoviesCreate(BaseModel):
+    movies: conlist(MovieCreate, min_items=1)
+
+
+class MovieTags(BaseModel):
+    movie_id: int
+    tags: conlist(str, min_items=1)
+
+
+class TagsBatch(BaseModel):
+    items: conlist(MovieTags, min_items=1)
+
+
+class MovieStatus(BaseModel):
+    id: int
+    rating: Optional[Rating]
+    last_seen: Optional[datetime]
+    watched: bool = False
+
+
+class StatusBatch(BaseModel):
+    movies: conlist(MovieStatus, min_items=1)
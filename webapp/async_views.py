@@ -0,0 +1,122 @@
+"""Async variants of the read-heavy views, served instead of the sync ones when `ASYNC_VIEWS` is set.
+
+They keep the endpoints, URLs, templates and decorators of the views they replace, and only
+differ in awaiting their queries on the async engine of `webapp.aio`.
+"""
+import os
+
+from flask import abort, current_app, render_template, request
+from flask_login import current_user, login_required
+from sqlalchemy import inspect
+
+from webapp import async_db, schema_cache
+from webapp.cache import cached_page, conditional_page
+from webapp.movie.facets import WatchlistFilters, async_load_facets
+from webapp.movie.queries import (
+    WatchlistSort,
+    movie_children_query,
+    movie_details,
+    movie_page,
+    movie_page_statement,
+    movie_statement,
+)
+from webapp.movie.similar import similar_movies_statement
+
+
+# -----------
+# Movie views
+# -----------
+
+
+@login_required
+@conditional_page
+@cached_page
+async def index():
+    per_page = request.args.get("per_page", default=current_app.config["MOVIES_PER_PAGE"], type=int)
+    per_page = min(max(per_page, 1), current_app.config["MAX_MOVIES_PER_PAGE"])
+    filters = WatchlistFilters.from_args(request.args)
+    sort = WatchlistSort.from_args(request.args)
+    after = request.args.get("after", type=sort.parse_cursor)
+    before = request.args.get("before", type=sort.parse_cursor)
+
+    try:
+        async with async_db.session() as session:
+            statement = movie_page_statement(
+                current_user.id, per_page, after=after, before=before, filters=filters, sort=sort
+            )
+            page = movie_page((await session.execute(statement)).all(), per_page, after=after, before=before, sort=sort)
+        facets = await async_load_facets(current_user, filters)
+    except Exception as error:
+        current_app.logger.error("Error while getting movies from the database: {}".format(error))
+        abort(404, error)
+
+    return render_template(
+        "movie.html",
+        title="Movies Watchlist",
+        movies_data=page.movies,
+        page=page,
+        per_page=per_page,
+        filters=filters,
+        facets=facets,
+        sort=sort,
+    )
+
+
+@login_required
+@conditional_page
+@cached_page
+async def movie(movieId):
+    try:
+        async with async_db.session() as session:
+            row = (await session.execute(movie_statement(movieId))).first()
+            if row is not None:
+                details = movie_details(row, (await session.execute(movie_children_query(movieId))).all())
+                similar_movies = similar_movies_statement(movieId, current_app.config["SIMILAR_MOVIES"])
+                similar = (await session.execute(similar_movies)).all()
+    except Exception as error:
+        current_app.logger.error("MovieId {} is causing an IndexError".format(movieId))
+        abort(404, error)
+
+    if row is None:
+        abort(404)
+
+    return render_template(
+        "movie_details.html",
+        movie=details,
+        tags=details.tags,
+        cast=details.cast,
+        series=details.series,
+        similar=similar,
+    )
+
+
+# ----------
+# Auth views
+# ----------
+
+
+async def status():
+    names = ("user", "movie")
+    tables = schema_cache.get(names)
+    if tables is None:
+        async with async_db.engine.connect() as connection:
+            tables = await connection.run_sync(lambda sync: {name: inspect(sync).has_table(name) for name in names})
+        schema_cache.set(names, tables)
+
+    return render_template(
+        "status.html",
+        config_type=os.getenv("CONFIG_TYPE"),
+        database_status=all(tables.values()),
+        database_users_table_status=tables["user"],
+        database_movies_table_status=tables["movie"],
+    )
+
+
+ASYNC_VIEWS = {"movie.index": index, "movie.movie": movie, "auth.status": status}
+
+
+def register_async_views(app):
+    """Serve the endpoints of `ASYNC_VIEWS` with their async variants."""
+    async_db.init_app(app)
+    for endpoint, view in ASYNC_VIEWS.items():
+        app.view_functions[endpoint] = view
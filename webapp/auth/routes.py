@@ -1,10 +1,12 @@
 import os
-from flask import Blueprint, flash, redirect, render_template, url_for, current_app
+from flask import Blueprint, flash, jsonify, redirect, render_template, url_for
 from flask_login import current_user, login_user, logout_user
-from webapp import db
+from webapp import db, response_cache
+from webapp.health import database_tables, health_report
 from webapp.models import User
-from .forms import LoginForm, RegisterForm
-import sqlalchemy as sa
+
+# The forms are imported inside the views: WTForms loads email_validator and dnspython, which
+# take longer to import than the rest of the app and are not needed to start a worker
 
 bp = Blueprint("auth", __name__, template_folder="templates", static_folder="static")
 
@@ -25,6 +27,8 @@ def register():
         flash("Already logged in! Redirecting to your User Profile page...")
         return redirect(url_for("movie.index", user_id=current_user.id))
 
+    from .forms import RegisterForm
+
     form = RegisterForm()
     if form.validate_on_submit():
         if User.query.filter_by(email=form.email.data).first():
@@ -46,6 +50,8 @@ def login():
         flash("Already logged in! Redirecting to your User Profile page...")
         return redirect(url_for("movie.index", user_id=current_user.id))
 
+    from .forms import LoginForm
+
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
@@ -54,6 +60,8 @@ def login():
             flash("Login credentials not correct", category="danger")
             return redirect(url_for("auth.login"))
         else:
+            # check_password may have upgraded an outdated hash
+            db.session.commit()
             login_user(user, remember=True)
             flash("Login successful", "success")
         return redirect(url_for("movie.index"))
@@ -71,16 +79,23 @@ def logout():
 
 @bp.route("/status")
 def status():
-    engine = sa.create_engine(current_app.config["SQLALCHEMY_DATABASE_URI"])
-    inspector = sa.inspect(engine)
-    users_table_created = inspector.has_table("user")
-    movies_table_created = inspector.has_table("movie")
-    database_created = users_table_created and movies_table_created
+    tables = database_tables(("user", "movie"))
 
     return render_template(
         "status.html",
         config_type=os.getenv("CONFIG_TYPE"),
-        database_status=database_created,
-        database_users_table_status=users_table_created,
-        database_books_table_status=movies_table_created,
+        database_status=all(tables.values()),
+        database_users_table_status=tables["user"],
+        database_movies_table_status=tables["movie"],
     )
+
+
+@bp.route("/health")
+def health():
+    report = health_report()
+    return jsonify(report), 200 if report["status"] == "ok" else 503
+
+
+@bp.route("/status/cache")
+def cache_status():
+    return jsonify(response_cache.stats())
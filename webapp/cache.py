@@ -0,0 +1,302 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from typing import Optional
+
+from flask import current_app, get_flashed_messages, request, session
+from flask_login import current_user
+
+
+# ---------
+# TTL cache
+# ---------
+
+
+class TTLCache:
+    """Thread-safe least-recently-used mapping whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.configure(maxsize, ttl)
+
+    def configure(self, maxsize: int, ttl: float) -> None:
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# --------
+# Backends
+# --------
+
+
+class NullBackend:
+    """Backend that stores nothing, used to switch the cache off."""
+
+    enabled = False
+
+    def get(self, key: str) -> Optional[str]:
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class LRUBackend(NullBackend):
+    """In-process least-recently-used store, private to each worker."""
+
+    enabled = True
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteBackend(NullBackend):
+    """Store shared by every worker on the host, kept in a local SQLite file.
+
+    It stands in for a networked cache such as Redis or memcached: anything implementing the
+    same three methods can be plugged in through `RESPONSE_CACHE_BACKEND`.
+    """
+
+    enabled = True
+
+    def __init__(self, path: str, maxsize: int = 1024):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().execute("CREATE TABLE IF NOT EXISTS entry (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.connection.execute("PRAGMA journal_mode=WAL")
+        return self._local.connection
+
+    def get(self, key):
+        row = self._connection().execute("SELECT value FROM entry WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        connection = self._connection()
+        connection.execute("INSERT OR REPLACE INTO entry (key, value) VALUES (?, ?)", (key, value))
+        # Entries are trimmed oldest-first by rowid, which INSERT OR REPLACE refreshes on every write
+        connection.execute(
+            "DELETE FROM entry WHERE rowid <= (SELECT MAX(rowid) FROM entry) - ?",
+            (self.maxsize,),
+        )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM entry")
+
+
+# -----
+# Cache
+# -----
+
+
+class ResponseCache:
+    """Per-user cache of rendered pages.
+
+    Every key embeds the user's watchlist version, so the write routes invalidate a user's pages
+    just by bumping it; the superseded entries are never read again and age out of the backend.
+    """
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config["RESPONSE_CACHE_BACKEND"]
+        maxsize = app.config["RESPONSE_CACHE_SIZE"]
+        if backend == "lru":
+            self.backend = LRUBackend(maxsize=maxsize)
+        elif backend == "sqlite":
+            self.backend = SQLiteBackend(app.config["RESPONSE_CACHE_PATH"], maxsize=maxsize)
+        else:
+            self.backend = NullBackend()
+        app.extensions["response_cache"] = self
+
+    def page_key(self, user_id: int, version: int, *parts) -> str:
+        return ":".join(str(part) for part in ("page", user_id, version, *parts))
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.backend.set(key, value)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def cached_page(view):
+    """Serve a logged-in user's GET page from the response cache, rendering it on a miss.
+
+    Pages with pending flash messages are neither served from nor written to the cache, as the
+    messages are part of the rendered HTML.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = current_app.extensions["response_cache"]
+        if not cache.backend.enabled or request.method != "GET" or session.get("_flashes"):
+            return current_app.ensure_sync(view)(*args, **kwargs)
+
+        key = cache.page_key(
+            current_user.id, current_user.watchlist_version, session.get("theme", "light"), request.full_path
+        )
+        body = cache.get(key)
+        if body is not None:
+            return body
+
+        response = current_app.make_response(current_app.ensure_sync(view)(*args, **kwargs))
+        # get_flashed_messages() returns what this render displayed, if anything was flashed meanwhile
+        if response.status_code == 200 and response.mimetype == "text/html" and not get_flashed_messages():
+            cache.set(key, response.get_data(as_text=True))
+        return response
+
+    return wrapper
+
+
+# ---------------
+# Conditional GET
+# ---------------
+
+
+def watchlist_etag(user) -> str:
+    return f'{user.id}-{user.watchlist_version}-{session.get("theme", "light")}'
+
+
+def page_last_modified(user) -> Optional[datetime]:
+    """The Last-Modified of a user's pages: the latest of their last watchlist change and theme toggle.
+
+    HTTP dates have whole seconds, so the time is rounded up, and left out until that second is
+    over: a change later in the same second would otherwise carry the same date as the page the
+    client already has.
+    """
+    modified = user.watchlist_modified
+    if modified is not None and modified.tzinfo is None:
+        modified = modified.replace(tzinfo=timezone.utc)
+    if theme_changed_at := session.get("theme_changed_at"):
+        toggled = datetime.fromtimestamp(theme_changed_at, timezone.utc)
+        modified = max(modified, toggled) if modified else toggled
+    if modified is None:
+        return None
+
+    rounded = modified.replace(microsecond=0) + timedelta(seconds=1 if modified.microsecond else 0)
+    return rounded if rounded <= datetime.now(timezone.utc) else None
+
+
+def conditional_page(view):
+    """Answer a logged-in user's GET page with 304 Not Modified while their watchlist version is unchanged.
+
+    The weak ETag and Last-Modified come from the user row Flask-Login has already loaded, so a
+    304 is sent without querying the movie tables or rendering a template.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != "GET" or session.get("_flashes"):
+            return current_app.ensure_sync(view)(*args, **kwargs)
+
+        etag = watchlist_etag(current_user)
+        last_modified = page_last_modified(current_user)
+
+        # If-None-Match takes precedence, as the ETag also covers the theme
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = bool(
+                request.if_modified_since and last_modified and last_modified <= request.if_modified_since
+            )
+
+        if not_modified:
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.make_response(current_app.ensure_sync(view)(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag, weak=True)
+        response.last_modified = last_modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add("Cookie")
+        return response
+
+    return wrapper
@@ -0,0 +1,82 @@
+import sqlite3
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+
+# ---------------
+# Engine settings
+# ---------------
+
+
+def pool_limits(config) -> tuple:
+    """Return the `(pool_size, max_overflow)` of one worker, capped so all workers fit in `DB_MAX_CONNECTIONS`."""
+    pool_size = max(1, config["DB_POOL_SIZE"])
+    max_overflow = max(0, config["DB_MAX_OVERFLOW"])
+    if config["DB_MAX_CONNECTIONS"] > 0:
+        per_worker = max(1, config["DB_MAX_CONNECTIONS"] // max(1, config["WEB_CONCURRENCY"]))
+        pool_size = min(pool_size, per_worker)
+        max_overflow = min(max_overflow, per_worker - pool_size)
+    return pool_size, max_overflow
+
+
+def engine_options(config) -> dict:
+    """Build the `SQLALCHEMY_ENGINE_OPTIONS` matching the pool settings of `config`."""
+    url = sa.engine.make_url(config["SQLALCHEMY_DATABASE_URI"])
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # In-memory databases live in a single connection, which Flask-SQLAlchemy sets up itself
+        return {}
+
+    pool_size, max_overflow = pool_limits(config)
+    options = {
+        "poolclass": QueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+    }
+    if url.get_backend_name() == "sqlite":
+        # Pooled SQLite connections are handed to whichever thread checks them out next
+        options["connect_args"] = {"check_same_thread": False}
+    return options
+
+
+def configure_engine(engine, config) -> None:
+    """Apply the SQLite pragmas of `config` to every new connection of `engine`."""
+    if engine.dialect.name != "sqlite":
+        return
+
+    pragmas = (
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}",
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def describe_pool(engine, config) -> str:
+    """Summarize the effective pool of `engine` for the startup log."""
+    pool = engine.pool
+    description = f"Database pool: {type(pool).__name__} for {engine.dialect.name}"
+    if isinstance(pool, QueuePool):
+        description += (
+            f", size={pool.size()}, max_overflow={pool._max_overflow}, timeout={pool._timeout}s,"
+            f" recycle={pool._recycle}s, pre_ping={pool._pre_ping}"
+        )
+    description += f" ({config['WEB_CONCURRENCY']} workers x {config['GUNICORN_THREADS']} threads)"
+    if engine.dialect.name == "sqlite":
+        description += (
+            f"; SQLite journal_mode={config['SQLITE_JOURNAL_MODE']}, synchronous={config['SQLITE_SYNCHRONOUS']},"
+            f" busy_timeout={config['SQLITE_BUSY_TIMEOUT']}ms"
+        )
+    return description
@@ -0,0 +1,80 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from typing import Callable
+
+from werkzeug.exceptions import ServiceUnavailable
+
+
+class HashingBusy(ServiceUnavailable):
+    description = "Too many logins are being processed right now, please try again in a moment."
+
+
+class HashingExecutor:
+    """Runs password hashing in a pool of worker processes, off the request threads and their GIL.
+
+    At most `workers + queue_size` hashes are in flight; beyond that `HashingBusy` (a 503 with
+    Retry-After) is raised at once rather than letting requests pile up behind the pool. With no
+    workers configured, hashing runs inline in the calling thread.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 0
+        self.queue_size = 0
+        self.timeout = None
+        self.retry_after = 1
+        self._slots = None
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.shutdown()
+        self.workers = app.config["PASSWORD_HASH_WORKERS"]
+        self.queue_size = app.config["PASSWORD_HASH_QUEUE_SIZE"]
+        self.timeout = app.config["PASSWORD_HASH_TIMEOUT"]
+        self.retry_after = app.config["PASSWORD_HASH_RETRY_AFTER"]
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size) if self.workers > 0 else None
+        app.extensions["hashing_executor"] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self._slots is not None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # The pool is started on first use and again after a fork, so each gunicorn worker owns its processes
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def run(self, function: Callable, *args):
+        """Call `function(*args)` in the pool and wait for its result, or raise `HashingBusy` if the pool is full."""
+        if not self.enabled:
+            return function(*args)
+
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HashingBusy(retry_after=self.retry_after)
+        try:
+            future = self._get_pool().submit(function, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # A timed out hash keeps its slot until the worker is done with it, so the pool stays bounded
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy(retry_after=self.retry_after)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._pool_pid = None
@@ -0,0 +1,51 @@
+import time
+from typing import Dict, Iterable
+
+import sqlalchemy as sa
+from flask import current_app
+
+from webapp import db, schema_cache
+
+
+STARTED_AT = time.time()
+
+
+# ------------
+# Schema check
+# ------------
+
+
+def database_tables(names: Iterable[str] = ("user", "movie")) -> Dict[str, bool]:
+    """Report which of the given tables exist, inspecting the shared engine at most once per `SCHEMA_CHECK_TTL`."""
+    names = tuple(names)
+    tables = schema_cache.get(names)
+    if tables is None:
+        inspector = sa.inspect(db.engine)
+        tables = {name: inspector.has_table(name) for name in names}
+        schema_cache.set(names, tables)
+    return tables
+
+
+# ------------
+# Health check
+# ------------
+
+
+def health_report() -> dict:
+    """Build the health check payload: process state from memory and a single `SELECT 1` round trip."""
+    report = {
+        "status": "ok",
+        "environment": current_app.config["FLASK_ENV"],
+        "uptime": round(time.time() - STARTED_AT, 3),
+    }
+    started = time.perf_counter()
+    try:
+        with db.engine.connect() as connection:
+            connection.execute(sa.text("SELECT 1"))
+    except sa.exc.SQLAlchemyError as e:
+        current_app.logger.error(f"Health check could not reach the database: {e}")
+        report.update(status="error", database="unavailable")
+    else:
+        report["database"] = "ok"
+    report["database_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return report
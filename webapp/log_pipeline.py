@@ -0,0 +1,178 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import List
+
+from flask import current_app, g, has_request_context, request
+
+
+# -------
+# Records
+# -------
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records logged during a request with its id, user, endpoint and elapsed time.
+
+    It runs on the request thread, before the record is queued, as the listener thread has no
+    request context. The user is only read if Flask-Login has already loaded it.
+    """
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get("request_id")
+            record.endpoint = request.endpoint
+            user = g.get("_login_user")
+            record.user_id = user.get_id() if user is not None else None
+            if "log_started" in g:
+                record.duration_ms = round((time.perf_counter() - g.log_started) * 1000, 3)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in `every` records from each call site, for records up to `max_level`.
+
+    Records above `max_level` (warnings and errors by default) are always kept. Kept records
+    carry their `sample_rate` so counts can be scaled back up.
+    """
+
+    def __init__(self, every: int = 1, max_level: int = logging.INFO):
+        super().__init__()
+        self.every = every
+        self.max_level = max_level
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.every <= 1 or record.levelno > self.max_level:
+            return True
+
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sample_rate = self.every
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    FIELDS = ("request_id", "user_id", "endpoint", "duration_ms", "status", "sample_rate")
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+            "location": f"{record.filename}:{record.lineno}",
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue records for the listener thread without ever blocking the caller.
+
+    When the queue is full the record is dropped and counted in `dropped`, so a stalled disk
+    slows down logging rather than the requests.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Unlike QueueHandler.prepare, keep the message and traceback apart for the JSON formatter
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# --------
+# Pipeline
+# --------
+
+
+class LogPipeline:
+    """Asynchronous JSON logging: the app logger only queues records, a listener thread writes them."""
+
+    def __init__(self):
+        self.queue_handler = None
+        self.listener = None
+        self._logger = None
+        atexit.register(self.stop)
+
+    def init_app(self, app, handlers: List[logging.Handler]):
+        self.stop()
+        formatter = JSONFormatter()
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=app.config["LOG_QUEUE_SIZE"])
+        self.queue_handler = DroppingQueueHandler(log_queue)
+        self.queue_handler.addFilter(
+            SamplingFilter(
+                every=app.config["LOG_SAMPLE_EVERY"],
+                max_level=logging.getLevelName(app.config["LOG_SAMPLE_MAX_LEVEL"]),
+            )
+        )
+        self.queue_handler.addFilter(RequestContextFilter())
+        self.listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+        self._logger = app.logger
+        app.logger.addHandler(self.queue_handler)
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+        app.extensions["log_pipeline"] = self
+
+    def _start_request(self):
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        g.log_started = time.perf_counter()
+
+    def _end_request(self, response):
+        response.headers.setdefault("X-Request-ID", g.get("request_id", ""))
+        current_app.logger.info(
+            f"{request.method} {request.full_path.rstrip('?')} {response.status_code}",
+            extra={"status": response.status_code},
+        )
+        return response
+
+    def stop(self) -> None:
+        """Write out the queued records and detach from the app logger."""
+        if self._logger is not None:
+            self._logger.removeHandler(self.queue_handler)
+            self._logger = None
+        if self.listener is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
@@ -0,0 +1,139 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Sequence, Tuple
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus layout: bucket counts, sum and count."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            yield bound, total
+
+
+# --------------
+# SQL statements
+# --------------
+
+
+# The listeners are attached to every engine once, and only count statements run inside a request
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and conn.info.get("query_started"):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        g.sql_statements = g.get("sql_statements", 0) + 1
+        g.sql_seconds = g.get("sql_seconds", 0.0) + elapsed
+
+
+def listen_for_statements() -> None:
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# -------
+# Metrics
+# -------
+
+
+class Metrics:
+    """Per-endpoint request latency, SQL statement count and SQL time, exposed at `/metrics`.
+
+    Figures are kept per process, so with several gunicorn workers each scrape reports the
+    worker that answered it.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.server_timing = app.config["SERVER_TIMING_HEADER"]
+        app.extensions["metrics"] = self
+        if not app.config["METRICS_ENABLED"]:
+            return
+
+        listen_for_statements()
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.latency: Dict[Tuple[str, str], Histogram] = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+            self.statements: Dict[Tuple[str, str], Histogram] = defaultdict(lambda: Histogram(STATEMENT_BUCKETS))
+            self.sql_seconds: Dict[Tuple[str, str], Histogram] = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+
+    def _start_request(self):
+        g.request_started = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    def _end_request(self, response):
+        if "request_started" not in g or request.endpoint in (None, "static", "metrics"):
+            return response
+
+        elapsed = time.perf_counter() - g.request_started
+        key = (request.endpoint, request.method)
+        with self._lock:
+            self.latency[key].observe(elapsed)
+            self.statements[key].observe(g.sql_statements)
+            self.sql_seconds[key].observe(g.sql_seconds)
+
+        if self.server_timing:
+            response.headers.add(
+                "Server-Timing",
+                f'app;dur={elapsed * 1000:.1f}, db;dur={g.sql_seconds * 1000:.1f};desc="{g.sql_statements} queries"',
+            )
+        return response
+
+    def render(self) -> str:
+        """Render every histogram in the Prometheus text exposition format."""
+        families = (
+            ("watchlist_request_duration_seconds", "Time spent handling requests.", self.latency),
+            ("watchlist_request_sql_statements", "SQL statements run per request.", self.statements),
+            ("watchlist_request_sql_duration_seconds", "Time spent in SQL statements per request.", self.sql_seconds),
+        )
+        lines = []
+        with self._lock:
+            for name, help_text, histograms in families:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (endpoint, method), histogram in sorted(histograms.items()):
+                    labels = f'endpoint="{endpoint}",method="{method}"'
+                    for bound, total in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def metrics_view(self):
+        return current_app.response_class(self.render(), mimetype="text/plain; version=0.0.4")
@@ -1,8 +1,17 @@
+import hashlib
+import hmac
+import secrets
+import time
+from collections import defaultdict
 from datetime import datetime
+from flask import current_app, has_app_context, has_request_context, session
 from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import Session, make_transient_to_detached
 from werkzeug.security import check_password_hash, generate_password_hash
-from webapp import db, login
-from typing import Optional
+from webapp import db, hashing_executor, login, user_cache
+from typing import Dict, Optional
 
 
 class NotFoundError(Exception):
@@ -13,6 +22,101 @@ class NotAuthorizedError(Exception):
     pass
 
 
+# ----------------
+# Password hashers
+# ----------------
+
+
+class PasswordHasher:
+    """Hashes passwords with one scheme and recognizes the hashes it produced.
+
+    Hashes use Werkzeug's `method$salt$hash` layout, the method naming the scheme and its cost
+    parameters, so a stored hash says which hasher verifies it and whether it is out of date.
+    """
+
+    name = ""
+    method = ""
+
+    def hash(self, password: str) -> str:
+        return generate_password_hash(password, method=self.method)
+
+    def verify(self, hashed: str, password: str) -> bool:
+        return check_password_hash(hashed, password)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """Tell whether `hashed` was produced by another scheme or with other cost parameters."""
+        return hashed.split("$", 1)[0] != self.method
+
+
+class LegacySHA256Hasher(PasswordHasher):
+    """A single round of salted SHA-256, as used before hashers were configurable."""
+
+    name = "sha256"
+    method = "sha256"
+
+
+class PBKDF2Hasher(PasswordHasher):
+    name = "pbkdf2"
+
+    def __init__(self, iterations: int = 260000, digest: str = "sha256"):
+        self.method = f"pbkdf2:{digest}:{iterations}"
+
+
+class ScryptHasher(PasswordHasher):
+    """scrypt through `hashlib`, stored in the `scrypt:n:r:p$salt$hash` layout of Werkzeug 3."""
+
+    name = "scrypt"
+
+    def __init__(self, n: int = 2**15, r: int = 8, p: int = 1):
+        self.n, self.r, self.p = n, r, p
+        self.method = f"scrypt:{n}:{r}:{p}"
+
+    @staticmethod
+    def _derive(password: str, salt: str, n: int, r: int, p: int) -> str:
+        return hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=132 * n * r * p
+        ).hex()
+
+    def hash(self, password):
+        salt = secrets.token_urlsafe(12)
+        return f"{self.method}${salt}${self._derive(password, salt, self.n, self.r, self.p)}"
+
+    def verify(self, hashed, password):
+        try:
+            method, salt, expected = hashed.split("$", 2)
+            n, r, p = (int(value) for value in method.split(":")[1:])
+        except ValueError:
+            return False
+        return hmac.compare_digest(self._derive(password, salt, n, r, p), expected)
+
+
+def configured_hashers() -> Dict[str, PasswordHasher]:
+    """Build every hasher with the cost parameters of the app config, or the defaults outside an app."""
+    config = current_app.config if has_app_context() else {}
+    return {
+        "sha256": LegacySHA256Hasher(),
+        "pbkdf2": PBKDF2Hasher(iterations=config.get("PASSWORD_PBKDF2_ITERATIONS", 260000)),
+        "scrypt": ScryptHasher(
+            n=config.get("PASSWORD_SCRYPT_N", 2**15),
+            r=config.get("PASSWORD_SCRYPT_R", 8),
+            p=config.get("PASSWORD_SCRYPT_P", 1),
+        ),
+    }
+
+
+def get_hasher(method: Optional[str] = None) -> PasswordHasher:
+    """Return the hasher for `method`, or the one selected by `PASSWORD_HASH_METHOD`."""
+    if method is None:
+        method = current_app.config.get("PASSWORD_HASH_METHOD", "pbkdf2") if has_app_context() else "pbkdf2"
+    return configured_hashers()[method]
+
+
+def hasher_for(hashed: str) -> PasswordHasher:
+    """Return the hasher that verifies `hashed`, falling back to Werkzeug's own check."""
+    scheme = hashed.split("$", 1)[0].split(":", 1)[0]
+    return configured_hashers().get(scheme, PasswordHasher())
+
+
 class User(UserMixin, db.Model):
     __table_name__ = "user"
 
@@ -20,37 +124,89 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(100), index=True, unique=True, nullable=False)
     password_hashed = db.Column(db.String(300), nullable=False)
     registered_on = db.Column(db.DateTime(timezone=True), nullable=False)
+    # Bumped by every change to the user's movies; pages and ETags are derived from it
+    watchlist_version = db.Column(db.Integer(), nullable=False, default=0, server_default="0")
+    watchlist_modified = db.Column(db.DateTime(timezone=True))
 
     # Define the relationship to the `Movie` class
     movie = db.relationship("Movie", backref="user", lazy="dynamic")
 
-    def __init__(self, email: str, password_plaintext: str, method: str = "sha256"):
+    def __init__(self, email: str, password_plaintext: str, method: Optional[str] = None):
         """Create a new User object using the email address and hashing the
-        plaintext password using Werkzeug.Security.
+        plaintext password with the configured password hasher.
         """
         self.email = email
         self.password_hashed = self._generate_password_hash(password_plaintext, method=method)
         self.registered_on = datetime.now()
+        self.watchlist_version = 0
+        self.watchlist_modified = datetime.utcnow()
 
     def __repr__(self):
         return f"<User: {self.email}>"
 
     def is_password_correct(self, password_plaintext: str):
-        return check_password_hash(self.password_hashed, password_plaintext)
+        hasher = hasher_for(self.password_hashed)
+        return hashing_executor.run(hasher.verify, self.password_hashed, password_plaintext)
 
     def set_password(self, password_plaintext: str):
         self.password_hashed = self._generate_password_hash(password_plaintext)
+        user_cache.invalidate(self.id)
 
     @staticmethod
-    def _generate_password_hash(password_plaintext: str, method: str = "sha256"):
-        return generate_password_hash(password_plaintext, method=method)
+    def _generate_password_hash(password_plaintext: str, method: Optional[str] = None):
+        return hashing_executor.run(get_hasher(method).hash, password_plaintext)
 
     def check_password(self, password_plaintext):
-        return check_password_hash(self.password_hashed, password_plaintext)
+        """Check the password, rehashing it with the configured hasher if it was stored with an outdated one.
+
+        The new hash is only set on the user; committing it is left to the caller.
+        """
+        if not self.is_password_correct(password_plaintext):
+            return False
+        if get_hasher().needs_rehash(self.password_hashed):
+            self.set_password(password_plaintext)
+        return True
+
+    @classmethod
+    def bump_watchlist_version(cls, user_id: int):
+        """Mark the watchlist of a user as changed, as part of the current transaction."""
+        db.session.execute(
+            db.update(cls)
+            .where(cls.id == user_id)
+            .values(watchlist_version=cls.watchlist_version + 1, watchlist_modified=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        user_cache.invalidate(user_id)
+        # Other workers may still hold the old version in their user cache; the browser's
+        # session makes them load this user from the database until those entries expire.
+        if has_request_context():
+            session["watchlist_changed_at"] = time.time()
+
+    def cached_state(self) -> dict:
+        return {column.key: getattr(self, column.key) for column in self.__table__.columns}
+
+    @classmethod
+    def from_cached_state(cls, state: dict) -> "User":
+        """Attach a user built from `cached_state()` to the session without querying the database."""
+        user = cls.__mapper__.class_manager.new_instance()
+        for key, value in state.items():
+            setattr(user, key, value)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
 
 
 class Movie(db.Model):
     __table_name__ = "movie"
+    __table_args__ = (
+        # Sort orders of the watchlist page, each ending with the id tiebreaker; their prefixes
+        # also serve the filters and facet counts
+        db.Index("ix_movie_userId_id", "userId", "id"),
+        db.Index("ix_movie_userId_title_id", "userId", "title", "id"),
+        db.Index("ix_movie_userId_year_id", "userId", "year", "id"),
+        db.Index("ix_movie_userId_rating_id", "userId", "rating", "id"),
+        db.Index("ix_movie_userId_last_seen_id", "userId", "last_seen", "id"),
+        db.Index("ix_movie_userId_director", "userId", "director"),
+    )
 
     id = db.Column(db.Integer(), primary_key=True, autoincrement=True)
     title = db.Column(db.String(100), index=True, nullable=False)
@@ -114,12 +270,93 @@ class Movie(db.Model):
         return f"<Movie: {self.title}>"
 
 
+class MovieNeighbour(db.Model):
+    """One of the movies most similar to a movie of the same watchlist, ranked from 1.
+
+    Kept up to date by `webapp.movie.similar` as tags, cast, series and directors change, so the
+    movie page reads a movie's neighbours in rank order straight from the primary key.
+    """
+
+    __tablename__ = "movie_neighbour"
+
+    movieId = db.Column(db.Integer(), db.ForeignKey("movie.id"), primary_key=True)
+    rank = db.Column(db.Integer(), primary_key=True, autoincrement=False)
+    neighbourId = db.Column(db.Integer(), db.ForeignKey("movie.id"), nullable=False, index=True)
+    score = db.Column(db.Float(), nullable=False)
+
+    def __repr__(self):
+        return f"<MovieNeighbour: {self.movieId} #{self.rank} {self.neighbourId} ({self.score:.3f})>"
+
+
+class WatchlistStat(db.Model):
+    """One counter of a user's watchlist statistics, such as the number of movies rated 4 or tagged "crime".
+
+    The write routes keep the counters up to date through `webapp.movie.stats`, so the
+    statistics page reads a handful of rows instead of aggregating the movie tables.
+    """
+
+    __tablename__ = "watchlist_stat"
+    __table_args__ = (db.Index("ix_watchlist_stat_userId_kind_count", "userId", "kind", "count"),)
+
+    userId = db.Column(db.Integer(), db.ForeignKey("user.id"), primary_key=True)
+    kind = db.Column(db.String(20), primary_key=True)
+    key = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer(), nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<WatchlistStat: {self.userId} {self.kind} {self.key!r} = {self.count}>"
+
+
+# ------------
+# Vocabularies
+# ------------
+#
+# Tag, actor and series names are stored once each, in the vocabulary tables below, and the
+# movies refer to them by id through the `movie_tag`, `movie_cast` and `movie_series` tables.
+
+
+class TagName(db.Model):
+    __tablename__ = "tag"
+
+    id = db.Column(db.Integer(), primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f"<TagName: {self.name}>"
+
+
+class Person(db.Model):
+    __tablename__ = "person"
+
+    id = db.Column(db.Integer(), primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f"<Person: {self.name}>"
+
+
+class SeriesName(db.Model):
+    __tablename__ = "series"
+
+    id = db.Column(db.Integer(), primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f"<SeriesName: {self.name}>"
+
+
 class Tag(db.Model):
-    __table_name__ = "tag"
+    """A tag of a movie. `tag` reads and writes the name through the `TagName` vocabulary."""
+
+    __tablename__ = "movie_tag"
+    __table_args__ = (db.Index("ix_movie_tag_tagId_movieId", "tagId", "movieId"),)
 
     id = db.Column(db.Integer(), primary_key=True)
-    tag = db.Column(db.String(100), nullable=True)
-    movieId = db.Column(db.Integer(), db.ForeignKey("movie.id"))
+    movieId = db.Column(db.Integer(), db.ForeignKey("movie.id"), index=True)
+    tagId = db.Column(db.Integer(), db.ForeignKey("tag.id"), nullable=False)
+
+    term = db.relationship(TagName, lazy="joined", innerjoin=True)
+    tag = association_proxy("term", "name", creator=lambda name: TagName(name=name))
 
     def __init__(self, tag: str, movieId: int):
         self.tag = tag
@@ -130,11 +367,17 @@ class Tag(db.Model):
 
 
 class Cast(db.Model):
-    __table_name__ = "cast"
+    """An actor of a movie. `actor` reads and writes the name through the `Person` vocabulary."""
+
+    __tablename__ = "movie_cast"
+    __table_args__ = (db.Index("ix_movie_cast_personId_movieId", "personId", "movieId"),)
 
     id = db.Column(db.Integer(), primary_key=True)
-    actor = db.Column(db.String(100), nullable=True)
-    movieId = db.Column(db.Integer(), db.ForeignKey("movie.id"))
+    movieId = db.Column(db.Integer(), db.ForeignKey("movie.id"), index=True)
+    personId = db.Column(db.Integer(), db.ForeignKey("person.id"), nullable=False)
+
+    term = db.relationship(Person, lazy="joined", innerjoin=True)
+    actor = association_proxy("term", "name", creator=lambda name: Person(name=name))
 
     def __init__(self, actor: str, movieId: int):
         self.actor = actor
@@ -145,11 +388,17 @@ class Cast(db.Model):
 
 
 class Series(db.Model):
-    __table_name__ = "series"
+    """A series a movie belongs to. `series` reads and writes the name through the `SeriesName` vocabulary."""
+
+    __tablename__ = "movie_series"
+    __table_args__ = (db.Index("ix_movie_series_seriesId_movieId", "seriesId", "movieId"),)
 
     id = db.Column(db.Integer(), primary_key=True)
-    series = db.Column(db.String(100), nullable=True)
-    movieId = db.Column(db.Integer(), db.ForeignKey("movie.id"))
+    movieId = db.Column(db.Integer(), db.ForeignKey("movie.id"), index=True)
+    seriesId = db.Column(db.Integer(), db.ForeignKey("series.id"), nullable=False)
+
+    term = db.relationship(SeriesName, lazy="joined", innerjoin=True)
+    series = association_proxy("term", "name", creator=lambda name: SeriesName(name=name))
 
     def __init__(self, series: str, movieId: int):
         self.series = series
@@ -159,9 +408,50 @@ class Series(db.Model):
         return f"<id: {self.id}, series: {self.series}, movieId: {self.movieId}"
 
 
+# Vocabulary model and id column of each movie child table
+VOCABULARIES = {Tag: (TagName, "tagId"), Cast: (Person, "personId"), Series: (SeriesName, "seriesId")}
+
+
+@event.listens_for(Session, "before_flush")
+def intern_vocabulary_names(session, flush_context, instances):
+    """Point new tag, cast and series rows created through the ORM at the existing vocabulary entries.
+
+    Setting `Tag.tag` and the like always creates a new vocabulary entry; before it is inserted,
+    it is swapped for the stored entry with the same name, or for the first new one.
+    """
+    rows = [obj for obj in session.new if type(obj) in VOCABULARIES and obj.term is not None and obj.term.id is None]
+    if not rows:
+        return
+
+    names = defaultdict(set)
+    for row in rows:
+        names[type(row.term)].add(row.term.name)
+    terms = {}
+    with session.no_autoflush:
+        for vocabulary, vocabulary_names in names.items():
+            for term in session.query(vocabulary).filter(vocabulary.name.in_(vocabulary_names)):
+                terms[vocabulary, term.name] = term
+
+    for row in rows:
+        term = terms.setdefault((type(row.term), row.term.name), row.term)
+        if term is not row.term:
+            if row.term in session:
+                session.expunge(row.term)
+            row.term = term
+
+
 @login.user_loader
 def load_user(id):
     try:
-        return User.query.get(int(id))
+        user_id = int(id)
+        state = user_cache.get(user_id)
+        changed_at = session.get("watchlist_changed_at", 0) if has_request_context() else 0
+        if state is not None and time.time() - changed_at > user_cache.ttl:
+            return User.from_cached_state(state)
+
+        user = db.session.get(User, user_id)
+        if user is not None:
+            user_cache.set(user_id, user.cached_state())
+        return user
     except:
         return None
@@ -0,0 +1,237 @@
+import dataclasses
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from webapp import async_db, db, facet_cache
+from webapp.models import Movie, Tag, Cast, TagName, Person
+
+
+# --------------
+# Helper Classes
+# --------------
+
+
+@dataclass(frozen=True)
+class WatchlistFilters:
+    """Filters of the watchlist page, read from and written back to its query string.
+
+    Every filter is optional and they combine with AND; `rating` 0 selects the unrated movies.
+    """
+
+    tag: Optional[str] = None
+    director: Optional[str] = None
+    cast: Optional[str] = None
+    year_from: Optional[int] = None
+    year_to: Optional[int] = None
+    rating: Optional[int] = None
+    watched: Optional[bool] = None
+
+    @classmethod
+    def from_args(cls, args) -> "WatchlistFilters":
+        def text(name):
+            value = args.get(name, default="").strip()
+            return value or None
+
+        watched = args.get("watched")
+        return cls(
+            tag=text("tag"),
+            director=text("director"),
+            cast=text("cast"),
+            year_from=args.get("year_from", type=int),
+            year_to=args.get("year_to", type=int),
+            rating=args.get("rating", type=int),
+            watched={"yes": True, "no": False}.get(watched),
+        )
+
+    @property
+    def active(self) -> bool:
+        return self != WatchlistFilters()
+
+    def args(self) -> Dict[str, str]:
+        """Query string arguments of the filters that are set."""
+        args = {field.name: getattr(self, field.name) for field in dataclasses.fields(self)}
+        if self.watched is not None:
+            args["watched"] = "yes" if self.watched else "no"
+        return {name: value for name, value in args.items() if value is not None}
+
+    def toggle(self, **changes) -> "WatchlistFilters":
+        """Set the given filters, or clear them if they are already set to these values."""
+        if all(getattr(self, name) == value for name, value in changes.items()):
+            changes = {name: None for name in changes}
+        return dataclasses.replace(self, **changes)
+
+
+@dataclass(frozen=True)
+class FacetValue:
+    label: str
+    count: int
+    args: Dict[str, str]
+    selected: bool = False
+
+
+@dataclass(frozen=True)
+class Facet:
+    name: str
+    title: str
+    values: Tuple[FacetValue, ...]
+
+
+# -------
+# Filters
+# -------
+
+
+def filter_conditions(filters: WatchlistFilters, skip: Optional[str] = None) -> List:
+    """Build the WHERE conditions of the filters, leaving out those of the facet named `skip`.
+
+    A facet counts the movies matching every filter but its own, so that its other values can
+    still be picked.
+    """
+    conditions = []
+    if filters.tag is not None and skip != "tag":
+        tagged = select(Tag.movieId).join_from(Tag, TagName).where(TagName.name == filters.tag)
+        conditions.append(Movie.id.in_(tagged))
+    if filters.cast is not None and skip != "cast":
+        starring = select(Cast.movieId).join_from(Cast, Person).where(Person.name == filters.cast)
+        conditions.append(Movie.id.in_(starring))
+    if filters.director is not None and skip != "director":
+        conditions.append(Movie.director == filters.director)
+    if skip != "decade":
+        if filters.year_from is not None:
+            conditions.append(Movie.year >= filters.year_from)
+        if filters.year_to is not None:
+            conditions.append(Movie.year <= filters.year_to)
+    if filters.rating is not None and skip != "rating":
+        conditions.append(Movie.rating == filters.rating)
+    if filters.watched is not None and skip != "watched":
+        conditions.append(Movie.last_seen.is_not(None) if filters.watched else Movie.last_seen.is_(None))
+    return conditions
+
+
+# ------
+# Facets
+# ------
+
+
+def facet_statements(user_id: int, filters: WatchlistFilters, limit: int) -> Dict:
+    """Select the value counts of every facet with one GROUP BY statement each.
+
+    The tag, cast and director facets keep their `limit` most common values, after the selected
+    value if there is one.
+    """
+
+    def movies(skip):
+        return [Movie.userId == user_id, *filter_conditions(filters, skip=skip)]
+
+    def top_values(column, selected, count=func.count()):
+        count = count.label("count")
+        statement = select(column, count).group_by(column)
+        if selected is not None:
+            statement = statement.order_by((column == selected).desc())
+        return statement.order_by(count.desc(), column).limit(limit)
+
+    decade = (Movie.year - Movie.year % 10).label("decade")
+    count = func.count().label("count")
+    return {
+        # A movie can be given the same tag or actor twice, so movies are counted rather than rows
+        "tag": top_values(TagName.name, filters.tag, func.count(func.distinct(Movie.id)))
+        .select_from(Movie)
+        .join(Tag, Tag.movieId == Movie.id)
+        .join(TagName, TagName.id == Tag.tagId)
+        .where(*movies("tag")),
+        "cast": top_values(Person.name, filters.cast, func.count(func.distinct(Movie.id)))
+        .select_from(Movie)
+        .join(Cast, Cast.movieId == Movie.id)
+        .join(Person, Person.id == Cast.personId)
+        .where(*movies("cast")),
+        "director": top_values(Movie.director, filters.director).where(*movies("director")),
+        "decade": select(decade, count).where(*movies("decade")).group_by(decade).order_by(decade.desc()),
+        "rating": select(Movie.rating, count)
+        .where(*movies("rating"))
+        .group_by(Movie.rating)
+        .order_by(Movie.rating.desc()),
+        "watched": select(func.count(Movie.last_seen), count).where(*movies("watched")),
+    }
+
+
+def build_facets(filters: WatchlistFilters, rows: Dict[str, List]) -> List[Facet]:
+    """Turn the rows selected by `facet_statements` into the facets rendered by `movie.html`."""
+
+    def value(label, count, **changes):
+        selected = all(getattr(filters, name) == change for name, change in changes.items())
+        return FacetValue(label, count, filters.toggle(**changes).args(), selected)
+
+    watched, total = rows["watched"][0]
+    facets = [
+        Facet("tag", "Tags", tuple(value(name, count, tag=name) for name, count in rows["tag"])),
+        Facet("cast", "Cast", tuple(value(name, count, cast=name) for name, count in rows["cast"])),
+        Facet("director", "Directors", tuple(value(name, count, director=name) for name, count in rows["director"])),
+        Facet(
+            "decade",
+            "Release Date",
+            tuple(value(f"{decade}s", count, year_from=decade, year_to=decade + 9) for decade, count in rows["decade"]),
+        ),
+        Facet(
+            "rating",
+            "Rating",
+            tuple(
+                value(f"{rating} / 5" if rating else "Unrated", count, rating=rating)
+                for rating, count in rows["rating"]
+            ),
+        ),
+        Facet(
+            "watched",
+            "Watched",
+            (value("Watched", watched, watched=True), value("Not watched yet", total - watched, watched=False)),
+        ),
+    ]
+    return [facet for facet in facets if any(facet_value.count for facet_value in facet.values)]
+
+
+def log_facet_costs(user_id: int, timings: Dict[str, float], rows: Dict[str, List]) -> None:
+    costs = ", ".join(f"{name} {seconds * 1000:.1f} ms/{len(rows[name])} rows" for name, seconds in timings.items())
+    current_app.logger.info(f"Facet counts for user {user_id} in {sum(timings.values()) * 1000:.1f} ms: {costs}")
+
+
+def load_facets(user, filters: WatchlistFilters) -> List[Facet]:
+    """Count the watchlist facets in SQL, logging the time each facet query takes.
+
+    Counts are cached per watchlist version, so moving between the pages of the same filters
+    does not count them again.
+    """
+    key = (user.id, user.watchlist_version, filters)
+    facets = facet_cache.get(key)
+    if facets is None:
+        rows, timings = {}, {}
+        for name, statement in facet_statements(user.id, filters, current_app.config["FACET_VALUES_LIMIT"]).items():
+            started = time.perf_counter()
+            rows[name] = db.session.execute(statement).all()
+            timings[name] = time.perf_counter() - started
+
+        log_facet_costs(user.id, timings, rows)
+        facets = build_facets(filters, rows)
+        facet_cache.set(key, facets)
+    return facets
+
+
+async def async_load_facets(user, filters: WatchlistFilters) -> List[Facet]:
+    """`load_facets` on the async engine."""
+    key = (user.id, user.watchlist_version, filters)
+    facets = facet_cache.get(key)
+    if facets is None:
+        rows, timings = {}, {}
+        async with async_db.session() as session:
+            statements = facet_statements(user.id, filters, current_app.config["FACET_VALUES_LIMIT"])
+            for name, statement in statements.items():
+                started = time.perf_counter()
+                rows[name] = (await session.execute(statement)).all()
+                timings[name] = time.perf_counter() - started
+
+        log_facet_costs(user.id, timings, rows)
+        facets = build_facets(filters, rows)
+        facet_cache.set(key, facets)
+    return facets
@@ -0,0 +1,365 @@
+import base64
+import datetime
+import json
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from sqlalchemy import and_, bindparam, insert, literal, or_, select, tuple_, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+
+from webapp import db
+from webapp.movie.facets import WatchlistFilters, filter_conditions
+from webapp.models import VOCABULARIES, Movie, Tag, Cast, Series, TagName, Person, SeriesName
+
+
+# --------------
+# Helper Classes
+# --------------
+
+
+@dataclass(frozen=True)
+class MoviePage:
+    """One page of a user's watchlist plus the cursors needed to move around it."""
+
+    movies: List
+    next_cursor: Optional[Union[int, str]] = None
+    prev_cursor: Optional[Union[int, str]] = None
+
+
+# Columns the watchlist can be sorted by; each has a (userId, column, id) index to walk
+SORT_COLUMNS = {
+    "added": Movie.id,
+    "title": Movie.title,
+    "year": Movie.year,
+    "rating": Movie.rating,
+    "last_seen": Movie.last_seen,
+}
+
+
+@dataclass(frozen=True)
+class WatchlistSort:
+    """Sort order of the watchlist page, read from and written back to its query string.
+
+    Movies are ordered by one of `SORT_COLUMNS`, then by id in the same direction, so that every
+    row has a distinct position and a page can resume from the (value, id) key of its last row.
+    Movies are added with increasing ids, so the "added" order is the id order.
+    """
+
+    key: str = "added"
+    descending: bool = False
+
+    @classmethod
+    def from_args(cls, args) -> "WatchlistSort":
+        key = args.get("sort", default="added")
+        return cls(key=key if key in SORT_COLUMNS else "added", descending=args.get("order") == "desc")
+
+    @property
+    def column(self):
+        return SORT_COLUMNS[self.key]
+
+    @property
+    def columns(self) -> Tuple:
+        return (Movie.id,) if self.column is Movie.id else (self.column, Movie.id)
+
+    def args(self) -> Dict[str, str]:
+        """Query string arguments of the sort, left out for the default order."""
+        args = {} if self.key == "added" else {"sort": self.key}
+        if self.descending:
+            args["order"] = "desc"
+        return args
+
+    def toggle(self, key: str) -> "WatchlistSort":
+        """Sort by `key` in ascending order, or reverse the order if the movies are already sorted by it."""
+        return WatchlistSort(key, descending=not self.descending if key == self.key else False)
+
+    def order_by(self, reverse: bool = False) -> List:
+        descending = self.descending != reverse
+        return [column.desc() if descending else column.asc() for column in self.columns]
+
+    def seek(self, key: Tuple, reverse: bool = False):
+        """Select the rows following `key` in this order, or preceding it if `reverse`."""
+        ascending = self.descending == reverse
+        following = tuple_(*self.columns) > tuple_(*key) if ascending else tuple_(*self.columns) < tuple_(*key)
+        if not self.column.nullable:
+            return following
+
+        # NULLs fail every comparison, so they are sought separately, on the side of the order
+        # where the database puts them: after the other values on Postgres, before them on SQLite.
+        value, movie_id = key
+        nulls_follow = ascending == (db.engine.dialect.name == "postgresql")
+        null_rows = and_(self.column.is_(None), Movie.id > movie_id if ascending else Movie.id < movie_id)
+        if value is None:
+            return null_rows if nulls_follow else or_(self.column.is_not(None), null_rows)
+        return or_(following, self.column.is_(None)) if nulls_follow else following
+
+    def cursor(self, row) -> Union[int, str]:
+        """Encode the key of `row`, a plain id for the "added" order and an opaque token for the others."""
+        if self.key == "added":
+            return row.id
+        value = getattr(row, self.column.key)
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        return base64.urlsafe_b64encode(json.dumps([value, row.id]).encode()).decode()
+
+    def parse_cursor(self, cursor: str) -> Tuple:
+        """Decode a cursor made by `cursor`, raising `ValueError` on anything else.
+
+        Meant as the `type` of `request.args.get`, which then ignores a malformed cursor.
+        """
+        if self.key == "added":
+            return (int(cursor),)
+        try:
+            value, movie_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (TypeError, UnicodeDecodeError) as error:
+            raise ValueError(error)
+        if isinstance(value, str) and self.column.type.python_type is datetime.datetime:
+            value = datetime.datetime.fromisoformat(value)
+        if not isinstance(movie_id, int) or not (
+            isinstance(value, self.column.type.python_type) or (value is None and self.column.nullable)
+        ):
+            raise ValueError(f"Invalid cursor for the {self.key} order: {cursor}")
+        return value, movie_id
+
+
+@dataclass(frozen=True)
+class TagView:
+    id: int
+    tag: str
+
+
+@dataclass(frozen=True)
+class CastView:
+    id: int
+    actor: str
+
+
+@dataclass(frozen=True)
+class SeriesView:
+    id: int
+    series: str
+
+
+@dataclass(frozen=True)
+class MovieDetails:
+    """Read-only snapshot of a movie and its child rows, as rendered by `movie_details.html`."""
+
+    id: int
+    title: str
+    director: str
+    year: int
+    last_seen: Optional[datetime.datetime]
+    rating: int
+    description: Optional[str]
+    video_link: Optional[str]
+    userId: int
+    tags: Tuple[TagView, ...] = ()
+    cast: Tuple[CastView, ...] = ()
+    series: Tuple[SeriesView, ...] = ()
+
+
+# --------------
+# Watchlist page
+# --------------
+
+
+def movie_list_query(user_id: int):
+    """Select only the columns the watchlist table renders."""
+    return db.session.query(Movie.id, Movie.title, Movie.director, Movie.year).filter(Movie.userId == user_id)
+
+
+def movie_page_statement(
+    user_id: int,
+    per_page: int,
+    after: Optional[Tuple] = None,
+    before: Optional[Tuple] = None,
+    filters: Optional[WatchlistFilters] = None,
+    sort: WatchlistSort = WatchlistSort(),
+):
+    """Select one page of movies plus one extra row, walking backwards from `before` or forwards from `after`.
+
+    The cursors are keys decoded by `WatchlistSort.parse_cursor`.
+    """
+    query = movie_list_query(user_id)
+    if sort.column.key not in {column["name"] for column in query.column_descriptions}:
+        query = query.add_columns(sort.column)
+    if filters is not None:
+        query = query.filter(*filter_conditions(filters))
+    if before is not None:
+        return (
+            query.filter(sort.seek(before, reverse=True))
+            .order_by(*sort.order_by(reverse=True))
+            .limit(per_page + 1)
+            .statement
+        )
+    if after is not None:
+        query = query.filter(sort.seek(after))
+    return query.order_by(*sort.order_by()).limit(per_page + 1).statement
+
+
+def movie_page(
+    rows: List,
+    per_page: int,
+    after: Optional[Tuple] = None,
+    before: Optional[Tuple] = None,
+    sort: WatchlistSort = WatchlistSort(),
+) -> MoviePage:
+    """Build the page and its cursors from the rows selected by `movie_page_statement`."""
+    if before is not None:
+        has_previous = len(rows) > per_page
+        movies = list(reversed(rows[:per_page]))
+        return MoviePage(
+            movies=movies,
+            next_cursor=sort.cursor(movies[-1]) if movies else None,
+            prev_cursor=sort.cursor(movies[0]) if movies and has_previous else None,
+        )
+
+    has_next = len(rows) > per_page
+    movies = rows[:per_page]
+    return MoviePage(
+        movies=movies,
+        next_cursor=sort.cursor(movies[-1]) if movies and has_next else None,
+        prev_cursor=sort.cursor(movies[0]) if movies and after is not None else None,
+    )
+
+
+def paginate_movies(
+    user_id: int,
+    per_page: int,
+    after: Optional[Tuple] = None,
+    before: Optional[Tuple] = None,
+    filters: Optional[WatchlistFilters] = None,
+    sort: WatchlistSort = WatchlistSort(),
+) -> MoviePage:
+    """Return a page of movies, optionally filtered and sorted, using keyset pagination.
+
+    `after` returns the page following the given key, `before` the page preceding it. Each sort
+    order walks its own (userId, column, id) index and one extra row is fetched to know whether
+    another page exists, so the cost of a page does not depend on how far into the watchlist it is.
+    """
+    statement = movie_page_statement(user_id, per_page, after=after, before=before, filters=filters, sort=sort)
+    rows = db.session.execute(statement).all()
+    return movie_page(rows, per_page, after=after, before=before, sort=sort)
+
+
+# ------------
+# Movie detail
+# ------------
+
+
+def movie_children_query(movie_id: int):
+    """Select the tags, cast and series of a movie in a single UNION ALL statement."""
+    return union_all(
+        select(literal("tags").label("kind"), Tag.id.label("id"), TagName.name.label("value"))
+        .join_from(Tag, TagName)
+        .where(Tag.movieId == movie_id),
+        select(literal("cast"), Cast.id, Person.name).join_from(Cast, Person).where(Cast.movieId == movie_id),
+        select(literal("series"), Series.id, SeriesName.name)
+        .join_from(Series, SeriesName)
+        .where(Series.movieId == movie_id),
+    )
+
+
+def movie_statement(movie_id: int):
+    return select(*Movie.__table__.columns).where(Movie.id == movie_id)
+
+
+def movie_details(movie, children: Iterable) -> MovieDetails:
+    """Build the details of a movie from its row and the rows selected by `movie_children_query`."""
+    grouped = {"tags": [], "cast": [], "series": []}
+    views = {"tags": TagView, "cast": CastView, "series": SeriesView}
+    # A movie has few child rows, so they are ordered here rather than with an ORDER BY over the union
+    for kind, child_id, value in sorted(children, key=lambda row: row.id):
+        grouped[kind].append(views[kind](child_id, value))
+
+    return MovieDetails(
+        **movie._mapping,
+        tags=tuple(grouped["tags"]),
+        cast=tuple(grouped["cast"]),
+        series=tuple(grouped["series"]),
+    )
+
+
+def load_movie_details(movie_id: int) -> Optional[MovieDetails]:
+    """Load a movie with all its child rows in two statements, or None if it does not exist."""
+    movie = db.session.execute(movie_statement(movie_id)).first()
+    if movie is None:
+        return None
+    return movie_details(movie, db.session.execute(movie_children_query(movie_id)))
+
+
+# ----------
+# Child rows
+# ----------
+
+
+def unique_lines(lines: Iterable[str]) -> List[str]:
+    """Strip the lines of a `StringListField`, dropping empty and duplicate ones but keeping their order."""
+    return list(dict.fromkeys(line.strip() for line in lines if line and line.strip()))
+
+
+def new_children(model, entries: Iterable[Tuple[int, Iterable[str]]]) -> List[Tuple[int, List[str]]]:
+    """Keep the lines of each `(movie_id, lines)` entry that its movie does not have yet, with one statement.
+
+    The lines are stripped and deduplicated as by `unique_lines`, also across entries of the same movie,
+    so that the statistics count each name once per movie.
+    """
+    entries = [(movie_id, unique_lines(lines)) for movie_id, lines in entries]
+    vocabulary, _ = VOCABULARIES[model]
+    statement = (
+        select(model.movieId, vocabulary.name)
+        .join_from(model, vocabulary)
+        .where(model.movieId.in_({movie_id for movie_id, _ in entries}))
+    )
+    known = set(db.session.execute(statement).all())
+
+    result = []
+    for movie_id, lines in entries:
+        lines = [line for line in lines if (movie_id, line) not in known]
+        known.update((movie_id, line) for line in lines)
+        result.append((movie_id, lines))
+    return result
+
+
+def insert_names(vocabulary, names: Iterable[str]) -> None:
+    """Add the names a vocabulary table does not have yet, in one executemany statement.
+
+    ON CONFLICT DO NOTHING skips the known names and lets concurrent requests add the same name.
+    """
+    dialect_insert = postgresql.insert if db.engine.dialect.name == "postgresql" else sqlite.insert
+    db.session.execute(
+        dialect_insert(vocabulary).on_conflict_do_nothing(index_elements=["name"]), [{"name": name} for name in names]
+    )
+
+
+def insert_movie_children(
+    movie_id: int, cast: Iterable[str] = (), tags: Iterable[str] = (), series: Iterable[str] = ()
+) -> None:
+    """Insert the cast, tags and series of a movie with two executemany statements per child table:
+    one adding the new names to its vocabulary, one inserting the rows.
+
+    The rows are added to the current transaction; committing is left to the caller so the movie
+    and its children are saved together.
+    """
+    bulk_insert_movie_children([(movie_id, cast, tags, series)])
+
+
+def bulk_insert_movie_children(
+    children: Iterable[Tuple[int, Iterable[str], Iterable[str], Iterable[str]]]
+) -> None:
+    """Insert the `(movie_id, cast, tags, series)` entries of many movies with two statements per child table."""
+    names = {Cast: [], Tag: [], Series: []}
+    for movie_id, cast, tags, series in children:
+        names[Cast].extend((movie_id, line) for line in unique_lines(cast))
+        names[Tag].extend((movie_id, line) for line in unique_lines(tags))
+        names[Series].extend((movie_id, line) for line in unique_lines(series))
+
+    for model, model_names in names.items():
+        if model_names:
+            vocabulary, id_column = VOCABULARIES[model]
+            insert_names(vocabulary, {name for _, name in model_names})
+            # Each row looks up the id of its name as it is inserted
+            by_name = select(bindparam("movie_id"), vocabulary.id).where(vocabulary.name == bindparam("name"))
+            db.session.execute(
+                insert(model).from_select(["movieId", id_column], by_name),
+                [{"movie_id": movie_id, "name": name} for movie_id, name in model_names],
+            )
@@ -1,33 +1,33 @@
 import datetime
+import time
 
-from pydantic import BaseModel, validator, ValidationError
-from typing import Optional
+from pydantic import ValidationError
 
 from flask import current_app
-from flask import Blueprint, redirect, render_template, session, url_for, request, flash, abort
+from flask import Blueprint, redirect, render_template, session, url_for, request, flash, abort, stream_with_context
 from flask_login import current_user, login_required
 
 from webapp import db
-from webapp.models import Movie, User, Tag, Cast, Series
-from webapp.movie.forms import MovieForm, EditMovieForm, AddTagsForm
+from webapp.cache import cached_page, conditional_page
+from webapp.models import Movie, User, Tag
+from webapp.movie.facets import WatchlistFilters, load_facets
+from webapp.movie.schemas import MovieModel
+from webapp.movie.queries import WatchlistSort, insert_movie_children, load_movie_details, new_children, paginate_movies
+from webapp.movie.search import reindex_movies, remove_from_index, search_movies
+from webapp.movie.similar import load_similar_movies, update_neighbours
+from webapp.movie.stats import child_stat_keys, load_stats, movie_stat_keys, stored_child_stat_keys, update_stats
+from webapp.movie.transfer import EXPORT_MIMETYPES, EXPORT_WRITERS, iter_watchlist_export
 
+# The forms are imported inside the views: WTForms loads email_validator and dnspython, which
+# take longer to import than the rest of the app and are not needed to start a worker
 
-bp = Blueprint("movie", __name__, template_folder="templates", static_folder="static")
-
-
-# --------------
-# Helper Classes
-# --------------
 
+bp = Blueprint("movie", __name__, template_folder="templates", static_folder="static")
 
-class MovieModel(BaseModel):
-    """Class for parsing new movie data from a form."""
 
-    title: str
-    director: str
-    year: int
-    description: Optional[str] = ""
-    video_link: Optional[str] = ""
+# ----------------
+# Helper Functions
+# ----------------
 
 
 def movie_rating_check(value: int, movie: MovieModel) -> int:
@@ -38,6 +38,19 @@ def movie_rating_check(value: int, movie: MovieModel) -> int:
     return value
 
 
+def features_changed(user_id: int, changed=(), removed=()) -> None:
+    """Update the similar movies after the tags, cast, series or director of some movies changed."""
+    update_neighbours(user_id, current_app.config["SIMILAR_MOVIES"], changed=changed, removed=removed)
+
+
+def watchlist_changed(user_id: int) -> None:
+    """Bump the watchlist version of a user whose movies are changed by the current transaction.
+
+    Cached pages and ETags are derived from the version, so committing it invalidates them.
+    """
+    User.bump_watchlist_version(user_id)
+
+
 @bp.errorhandler(404)
 def page_not_found(e):
     return render_template("404.html"), 404
@@ -63,37 +76,82 @@ def home():
 
 @bp.route("/index")
 @login_required
+@conditional_page
+@cached_page
 def index():
     if not current_user.is_authenticated:
         flash("You must be logged in to view your profile!", "danger")
         return redirect(url_for("auth.login"))
 
+    per_page = request.args.get("per_page", default=current_app.config["MOVIES_PER_PAGE"], type=int)
+    per_page = min(max(per_page, 1), current_app.config["MAX_MOVIES_PER_PAGE"])
+    filters = WatchlistFilters.from_args(request.args)
+    sort = WatchlistSort.from_args(request.args)
+
     try:
-        movies = Movie.query.filter_by(userId=current_user.id).all()
+        page = paginate_movies(
+            current_user.id,
+            per_page=per_page,
+            after=request.args.get("after", type=sort.parse_cursor),
+            before=request.args.get("before", type=sort.parse_cursor),
+            filters=filters,
+            sort=sort,
+        )
+        facets = load_facets(current_user, filters)
     except Exception as error:
         current_app.logger.error("Error while getting movies from the database: {}".format(error))
         abort(404, error)
 
-    return render_template("movie.html", title="Movies Watchlist", movies_data=movies)
+    return render_template(
+        "movie.html",
+        title="Movies Watchlist",
+        movies_data=page.movies,
+        page=page,
+        per_page=per_page,
+        filters=filters,
+        facets=facets,
+        sort=sort,
+    )
+
+
+@bp.route("/search")
+@login_required
+def search():
+    query = request.args.get("q", default="").strip()
+    if not query:
+        return redirect(url_for("movie.index"))
+
+    try:
+        movies = search_movies(current_user.id, query, limit=current_app.config["MAX_MOVIES_PER_PAGE"])
+    except Exception as error:
+        current_app.logger.error("Error while searching the movies: {}".format(error))
+        abort(404, error)
+
+    return render_template("movie.html", title="Movies Watchlist - Search", movies_data=movies, query=query)
 
 
 @bp.route("/movie/<int:movieId>", methods=["GET"])
 @login_required
+@conditional_page
+@cached_page
 def movie(movieId):
     current_app.logger.info("getting the movie from the database...")
-    movie = Movie.query.get_or_404(movieId)
 
     try:
-        current_app.logger.debug("Get tags, cast and series with index: {}".format(movieId))
-        tags = Tag.query.filter_by(movieId=movie.id)
-        cast = Cast.query.filter_by(movieId=movie.id)
-        series = Series.query.filter_by(movieId=movie.id)
+        current_app.logger.debug("Get movie, tags, cast and series with index: {}".format(movieId))
+        movie = load_movie_details(movieId)
+        similar = load_similar_movies(movieId, current_app.config["SIMILAR_MOVIES"]) if movie else []
 
     except Exception as error:
         current_app.logger.error("MovieId {} is causing an IndexError".format(movieId))
         abort(404, error)
 
-    return render_template("movie_details.html", movie=movie, tags=tags, cast=cast, series=series)
+    if movie is None:
+        abort(404)
+
+    return render_template(
+        "movie_details.html", movie=movie, tags=movie.tags, cast=movie.cast, series=movie.series, similar=similar
+    )
 
 
 @bp.route("/add", methods=["GET", "POST"])
@@ -105,48 +163,46 @@ def add_movie():
         flash("You must be logged in to add a movie!", "danger")
         return redirect(url_for("auth.login"))
 
-    user = User.query.filter_by(id=current_user.id).first()
+    from webapp.movie.forms import MovieForm
+
     form = MovieForm()
 
     if request.method == "POST":
         try:
-            movie_data = MovieModel(title=form.title.data, director=form.director.data, year=form.year.data)
-            movie = Movie(title=movie_data.title, director=movie_data.director, year=movie_data.year, userId=user.id)
-            db.session.add(movie)
-            db.session.commit()
+            movie_data = MovieModel(
+                title=form.title.data,
+                director=form.director.data,
+                year=form.year.data,
+                description=form.description.data or "",
+                video_link=form.video_link.data or "",
+            )
 
         except ValidationError as e:
+            movie_data = None
             flash("Error with movie data submitted!")
-            db.session.rollback()
 
-        if form.validate_on_submit():
+        if movie_data is not None and form.validate_on_submit():
             try:
-                for actor in form.cast.data:
-                    cast = Cast(actor=actor, movieId=movie.id)
-                    db.session.add(cast)
-
-                for tag in form.tags.data:
-                    tag = Tag(tag=tag, movieId=movie.id)
-                    db.session.add(tag)
-
-                for serial in form.series.data:
-                    single_serial = Series(series=serial, movieId=movie.id)
-                    db.session.add(single_serial)
-
-                if form.description.data != "":
-                    movie.description = form.description.data
-
-                if form.video_link.data != "":
-                    movie.video_link = form.video_link.data
-
+                movie = Movie(userId=current_user.id, **movie_data.dict())
+                db.session.add(movie)
+                db.session.flush()
+                insert_movie_children(movie.id, cast=form.cast.data, tags=form.tags.data, series=form.series.data)
+                reindex_movies([movie.id])
+                update_stats(
+                    current_user.id,
+                    added=movie_stat_keys(movie) + child_stat_keys(cast=form.cast.data, tags=form.tags.data),
+                )
+                features_changed(current_user.id, changed=[movie.id])
+                watchlist_changed(current_user.id)
                 db.session.commit()
+
                 flash(f"Added new movie ({movie.title})!")
                 current_app.logger.info(f"Movie ({movie.title}) was added for user: {current_user.id}!")
                 return redirect(url_for("movie.index"))
 
             except Exception as error:
                 db.session.rollback()
-                current_app.logger.error("MovieId {} is causing an IndexError".format(movieId))
+                current_app.logger.error(f"Error while adding the movie: {movie_data.title} - {error}")
                 abort(404, error)
 
     return render_template("new_movie.html", title="Movies Watchlist - Add Movie", form=form)
@@ -158,6 +214,8 @@ def edit_movie(movieId):
     """Edit a movie in the database."""
 
     movie = Movie.query.get_or_404(movieId)
+    from webapp.movie.forms import EditMovieForm
+
     form = EditMovieForm(obj=movie)
 
     if movie is None:
@@ -168,12 +226,19 @@ def edit_movie(movieId):
 
     if form.validate_on_submit():
         try:
+            stat_keys = movie_stat_keys(movie)
+            director = movie.director
             movie.title = form.title.data
             movie.director = form.director.data
             movie.year = form.year.data
             movie.description = form.description.data
             movie.video_link = form.video_link.data
 
+            reindex_movies([movie.id])
+            update_stats(movie.userId, added=movie_stat_keys(movie), removed=stat_keys)
+            if movie.director != director:
+                features_changed(movie.userId, changed=[movie.id])
+            watchlist_changed(movie.userId)
             db.session.commit()
 
         except Exception as e:
@@ -200,7 +265,11 @@ def delete_movie(movieId):
     if movie.userId != current_user.id:
         abort(403)
 
+    remove_from_index([movie.id])
+    update_stats(movie.userId, removed=movie_stat_keys(movie) + stored_child_stat_keys([movie.id]))
+    features_changed(movie.userId, removed=[movie.id])
     db.session.delete(movie)
+    watchlist_changed(movie.userId)
     db.session.commit()
     flash(f"Movie ({movie.title}) was deleted!")
     current_app.logger.info(f"Movie ({movie.title}) was deleted for user: {current_user.id}!")
@@ -211,19 +280,30 @@ def delete_movie(movieId):
 @bp.route("/add/tags/<int:movieId>", methods=["GET", "POST"])
 @login_required
 def add_tags(movieId):
+    movie = Movie.query.get_or_404(movieId)
+
+    if movie.userId != current_user.id:
+        abort(403)
+
     tags = Tag.query.filter_by(movieId=movieId)
+    from webapp.movie.forms import AddTagsForm
+
     form = AddTagsForm()
 
     if form.validate_on_submit():
         try:
-            for tag in form.tags.data:
-                tag = Tag(tag=tag, movieId=movieId)
-                db.session.add(tag)
+            # Names the movie already has are skipped, so the tag counters count movies
+            [(_, new_tags)] = new_children(Tag, [(movieId, form.tags.data)])
+            insert_movie_children(movieId, tags=new_tags)
+            reindex_movies([movieId])
+            update_stats(movie.userId, added=child_stat_keys(tags=new_tags))
+            features_changed(movie.userId, changed=[movie.id])
+            watchlist_changed(movie.userId)
             db.session.commit()
 
         except Exception as e:
             db.session.rollback()
-            current_app.logger.critical(f"Error while adding the tag: {tag} - {e}")
+            current_app.logger.critical(f"Error while adding the tags: {form.tags.data} - {e}")
             current_app.logger.exception(e)
 
             flash("There was an error while adding your tag. Try again later.", "danger")
@@ -239,9 +319,17 @@ def add_tags(movieId):
 @login_required
 def delete_tag(tag_id, movieId):
     tag = Tag.query.filter_by(id=tag_id).first_or_404()
+    movie = Movie.query.get_or_404(tag.movieId)
+
+    if movie.userId != current_user.id:
+        abort(403)
 
     try:
         db.session.delete(tag)
+        reindex_movies([tag.movieId])
+        update_stats(movie.userId, removed=[("tag", tag.tag)])
+        features_changed(movie.userId, changed=[movie.id])
+        watchlist_changed(movie.userId)
         db.session.commit()
 
     except Exception as e:
@@ -261,7 +349,10 @@ def delete_tag(tag_id, movieId):
 def watch_today(movieId):
     movie = Movie.query.get_or_404(movieId)
     last_watched = datetime.datetime.today()
+    stat_keys = movie_stat_keys(movie)
     movie.last_seen = last_watched
+    update_stats(movie.userId, added=movie_stat_keys(movie), removed=stat_keys)
+    watchlist_changed(movie.userId)
     db.session.commit()
     return redirect(url_for("movie.movie", movieId=movie.id))
 
@@ -273,12 +364,42 @@ def rate_movie(movieId, new_rating):
 
     movie_rating = movie_rating_check(new_rating, movie)
 
+    stat_keys = movie_stat_keys(movie)
     movie.rating = movie_rating
+    update_stats(movie.userId, added=movie_stat_keys(movie), removed=stat_keys)
+    watchlist_changed(movie.userId)
     db.session.commit()
 
     return redirect(url_for("movie.movie", movieId=movie.id))
 
 
+@bp.route("/stats")
+@login_required
+@conditional_page
+@cached_page
+def stats():
+    """Render the watchlist statistics from the per-user counters kept by the write routes."""
+    return render_template(
+        "stats.html",
+        title="Movies Watchlist - Statistics",
+        stats=load_stats(current_user.id, top=current_app.config["STATS_TOP_VALUES"]),
+    )
+
+
+@bp.route("/export.<any(csv, jsonl):file_format>")
+@login_required
+def export_watchlist(file_format):
+    """Stream the user's watchlist as a CSV or JSONL download."""
+    records = iter_watchlist_export(current_user.id, chunk_size=current_app.config["EXPORT_CHUNK_SIZE"])
+    current_app.logger.info(f"Exporting the watchlist of user: {current_user.id} as {file_format}")
+
+    return current_app.response_class(
+        stream_with_context(EXPORT_WRITERS[file_format](records)),
+        mimetype=EXPORT_MIMETYPES[file_format],
+        headers={"Content-Disposition": f"attachment; filename=watchlist.{file_format}"},
+    )
+
+
 @bp.get("/toggle-theme")
 def toggle_theme():
     current_theme = session.get("theme")
@@ -286,6 +407,8 @@ def toggle_theme():
         session["theme"] = "light"
     else:
         session["theme"] = "dark"
+    # Pages rendered with the other theme are stale for If-Modified-Since as well
+    session["theme_changed_at"] = time.time()
 
     return redirect(request.args.get("current_page"))
 
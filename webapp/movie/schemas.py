@@ -0,0 +1,20 @@
+from datetime import datetime
+from pydantic import BaseModel, conint
+from typing import Optional
+
+
+class MovieModel(BaseModel):
+    """Class for parsing new movie data from a form."""
+
+    title: str
+    director: str
+    year: int
+    description: Optional[str] = ""
+    video_link: Optional[str] = ""
+
+
+class MovieImport(MovieModel):
+    """Class for parsing a movie from a watchlist export, with the rating and viewing date it was exported with."""
+
+    rating: conint(ge=0, le=5) = 0
+    last_seen: Optional[datetime] = None
@@ -0,0 +1,167 @@
+import re
+from typing import Iterable, List
+
+from sqlalchemy import DDL, bindparam, event, text
+
+from webapp import db
+from webapp.models import Movie
+
+
+# The text index lives in its own table, keyed by movie id: an FTS5 virtual table on SQLite and a
+# tsvector column with a GIN index on Postgres. Both are created and dropped along with `movie`.
+SEARCH_TABLE = "movie_search"
+
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        title, director, description, actors, tags, "userId" UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+]
+POSTGRES_DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+        "movieId" INTEGER PRIMARY KEY REFERENCES movie (id) ON DELETE CASCADE,
+        "userId" INTEGER NOT NULL,
+        document TSVECTOR NOT NULL
+    )""",
+    f'CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)',
+    f'CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_userId ON {SEARCH_TABLE} ("userId")',
+]
+
+for statement in SQLITE_DDL:
+    event.listen(Movie.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_DDL:
+    event.listen(Movie.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+event.listen(Movie.__table__, "before_drop", DDL(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+# ----------------
+# Index statements
+# ----------------
+
+
+SQLITE_REINDEX = f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, title, director, description, actors, tags, "userId")
+    SELECT movie.id, movie.title, movie.director, COALESCE(movie.description, ''),
+        COALESCE((SELECT group_concat(person.name, ' ') FROM movie_cast
+            JOIN person ON person.id = movie_cast."personId" WHERE movie_cast."movieId" = movie.id), ''),
+        COALESCE((SELECT group_concat(tag.name, ' ') FROM movie_tag
+            JOIN tag ON tag.id = movie_tag."tagId" WHERE movie_tag."movieId" = movie.id), ''),
+        movie."userId"
+    FROM movie WHERE movie.id IN :movie_ids
+"""
+POSTGRES_REINDEX = f"""
+    INSERT INTO {SEARCH_TABLE} ("movieId", "userId", document)
+    SELECT movie.id, movie."userId",
+        setweight(to_tsvector('simple', movie.title), 'A')
+        || setweight(to_tsvector('simple', movie.director), 'B')
+        || setweight(to_tsvector('simple', COALESCE(
+            (SELECT string_agg(person.name, ' ') FROM movie_cast
+                JOIN person ON person.id = movie_cast."personId" WHERE movie_cast."movieId" = movie.id), '')), 'B')
+        || setweight(to_tsvector('simple', COALESCE(
+            (SELECT string_agg(tag.name, ' ') FROM movie_tag
+                JOIN tag ON tag.id = movie_tag."tagId" WHERE movie_tag."movieId" = movie.id), '')), 'B')
+        || setweight(to_tsvector('simple', COALESCE(movie.description, '')), 'C')
+    FROM movie WHERE movie.id IN :movie_ids
+    ON CONFLICT ("movieId") DO UPDATE SET "userId" = EXCLUDED."userId", document = EXCLUDED.document
+"""
+
+# bm25 weights follow the column order: title, director, description, actors, tags
+SQLITE_SEARCH = f"""
+    SELECT movie.id, movie.title, movie.director, movie.year
+    FROM {SEARCH_TABLE} JOIN movie ON movie.id = {SEARCH_TABLE}.rowid
+    WHERE {SEARCH_TABLE} MATCH :query AND {SEARCH_TABLE}."userId" = :user_id
+    ORDER BY bm25({SEARCH_TABLE}, 10.0, 4.0, 1.0, 4.0, 4.0), movie.id
+    LIMIT :limit
+"""
+POSTGRES_SEARCH = f"""
+    SELECT movie.id, movie.title, movie.director, movie.year
+    FROM {SEARCH_TABLE} JOIN movie ON movie.id = {SEARCH_TABLE}."movieId"
+    WHERE {SEARCH_TABLE}."userId" = :user_id AND {SEARCH_TABLE}.document @@ to_tsquery('simple', :query)
+    ORDER BY ts_rank({SEARCH_TABLE}.document, to_tsquery('simple', :query)) DESC, movie.id
+    LIMIT :limit
+"""
+
+
+def _is_postgres() -> bool:
+    return db.engine.dialect.name == "postgresql"
+
+
+# ----------------
+# Helper Functions
+# ----------------
+
+
+def search_terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def match_expression(terms: List[str]) -> str:
+    """Build a prefix query matching every term, with user input reduced to plain words."""
+    if _is_postgres():
+        return " & ".join(f"{term}:*" for term in terms)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+# -------------
+# Index updates
+# -------------
+
+
+def remove_from_index(movie_ids: Iterable[int]) -> None:
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return
+
+    key = '"movieId"' if _is_postgres() else "rowid"
+    statement = text(f"DELETE FROM {SEARCH_TABLE} WHERE {key} IN :movie_ids")
+    db.session.execute(statement.bindparams(bindparam("movie_ids", expanding=True)), {"movie_ids": movie_ids})
+
+
+def reindex_movies(movie_ids: Iterable[int]) -> None:
+    """Rebuild the search documents of the given movies in the current transaction."""
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return
+
+    # The documents are built from the tables, so pending ORM changes have to reach them first
+    db.session.flush()
+    if _is_postgres():
+        statement = text(POSTGRES_REINDEX)
+    else:
+        # FTS5 tables have no upsert, so the old documents are replaced
+        remove_from_index(movie_ids)
+        statement = text(SQLITE_REINDEX)
+    db.session.execute(statement.bindparams(bindparam("movie_ids", expanding=True)), {"movie_ids": movie_ids})
+
+
+def rebuild_index(batch_size: int = 1000) -> int:
+    """Reindex every movie, committing one batch at a time. Returns the number of movies indexed."""
+    indexed = 0
+    last_id = 0
+    while True:
+        movie_ids = [
+            movie_id
+            for (movie_id,) in db.session.query(Movie.id).filter(Movie.id > last_id).order_by(Movie.id).limit(batch_size)
+        ]
+        if not movie_ids:
+            return indexed
+
+        reindex_movies(movie_ids)
+        db.session.commit()
+        indexed += len(movie_ids)
+        last_id = movie_ids[-1]
+
+
+# ------
+# Search
+# ------
+
+
+def search_movies(user_id: int, query: str, limit: int = 50) -> List:
+    """Return the user's movies matching every word of `query`, best match first."""
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    statement = text(POSTGRES_SEARCH if _is_postgres() else SQLITE_SEARCH)
+    params = {"query": match_expression(terms), "user_id": user_id, "limit": limit}
+    return db.session.execute(statement, params).all()
@@ -0,0 +1,375 @@
+from collections import defaultdict
+from typing import Iterable, List, Optional
+
+from sqlalchemy import String, cast, delete, distinct, func, insert, literal, or_, select, union_all
+from sqlalchemy.orm import aliased
+
+from webapp import db
+from webapp.models import Cast, Movie, MovieNeighbour, Series, Tag
+
+# Movies are compared within a watchlist by the cosine similarity of sparse feature vectors: one
+# dimension per director, tag, actor and series, weighted as below. A shared series says more
+# about two movies than a shared tag or actor does.
+FEATURE_WEIGHTS = {"director": 1.0, "tag": 1.0, "actor": 1.0, "series": 2.0}
+CHILD_FEATURES = ((Tag, "tag", Tag.tagId), (Cast, "actor", Cast.personId), (Series, "series", Series.seriesId))
+# Movies whose neighbours are computed and written together, and the most (movie, candidate)
+# products a block may score at once, which bounds its memory whatever the size of the watchlist
+BLOCK_SIZE = 256
+BLOCK_PRODUCTS = 1_000_000
+
+
+# --------------
+# Helper Classes
+# --------------
+
+
+class FeatureMatrix:
+    """The sparse feature vectors of a set of movies, one row per movie, held as NumPy arrays.
+
+    The entries are kept both by row, to read the features of a movie, and by feature (the
+    posting list of each feature), to find the movies sharing them. The dot products of a block
+    of movies with the others are then the sums, over their features, of the products with the
+    postings of those features: only the pairs of movies sharing a feature are ever scored.
+
+    `norms` defaults to the norms of the rows' own entries. A matrix holding only the features
+    some movies share with others passes the full norms of every movie instead.
+    """
+
+    def __init__(self, movie_ids, rows, features, weights, norms=None):
+        import numpy as np
+
+        self.np = np
+        self.movie_ids = movie_ids
+        self.size = len(movie_ids)
+        feature_count = int(features.max()) + 1 if len(features) else 0
+
+        by_row = np.lexsort((features, rows))
+        self.row_features, self.row_weights = features[by_row], weights[by_row]
+        self.row_start = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=self.size))))
+        by_feature = np.argsort(features, kind="stable")
+        self.posting_rows, self.posting_weights = rows[by_feature], weights[by_feature]
+        self.posting_start = np.concatenate(([0], np.cumsum(np.bincount(features, minlength=feature_count))))
+        if norms is None:
+            norms = np.sqrt(np.bincount(rows, weights=weights**2, minlength=self.size))
+        self.norms = norms
+
+    def index_of(self, movie_ids: Iterable[int]):
+        """Row indexes of the given movies, leaving out those not in the matrix."""
+        movie_ids = self.np.asarray(list(movie_ids), dtype=self.np.int64)
+        indexes = self.np.searchsorted(self.movie_ids, movie_ids)
+        found = indexes < self.size
+        found[found] &= self.movie_ids[indexes[found]] == movie_ids[found]
+        return indexes[found]
+
+    def _expand(self, starts, lengths):
+        """Positions `starts[i]` to `starts[i] + lengths[i]` of every range, concatenated."""
+        offsets = self.np.repeat(self.np.cumsum(lengths) - lengths, lengths)
+        return self.np.repeat(starts, lengths) + self.np.arange(lengths.sum()) - offsets
+
+    def _entries(self, rows):
+        """(query position, feature, weight) of every entry of the given rows."""
+        lengths = self.row_start[rows + 1] - self.row_start[rows]
+        positions = self._expand(self.row_start[rows], lengths)
+        query = self.np.repeat(self.np.arange(len(rows)), lengths)
+        return query, self.row_features[positions], self.row_weights[positions]
+
+    def blocks(self, rows):
+        """Split rows into blocks of at most `BLOCK_SIZE` rows and, past their first row, `BLOCK_PRODUCTS` products."""
+        query, features, _ = self._entries(rows)
+        products = self.np.bincount(
+            query, weights=self.posting_start[features + 1] - self.posting_start[features], minlength=len(rows)
+        )
+        start, total = 0, 0
+        for end, count in enumerate(products):
+            if end > start and (end - start == BLOCK_SIZE or total + count > BLOCK_PRODUCTS):
+                yield rows[start:end]
+                start, total = end, 0
+            total += count
+        if start < len(rows):
+            yield rows[start:]
+
+    def _products(self, rows):
+        """`(pair, product)` of every feature the given rows share, a pair being `query position * size + row index`."""
+        np = self.np
+        query, features, weights = self._entries(rows)
+        lengths = self.posting_start[features + 1] - self.posting_start[features]
+        positions = self._expand(self.posting_start[features], lengths)
+        pairs = np.repeat(query, lengths) * self.size + self.posting_rows[positions]
+        return pairs, np.repeat(weights, lengths) * self.posting_weights[positions]
+
+    def scores(self, rows):
+        """Cosine similarities of the given rows with the movies sharing a feature with them.
+
+        Returns `(query position, row index, score)` arrays, one entry per pair of distinct
+        movies; every other score is 0.
+        """
+        np = self.np
+        pairs, products = self._products(rows)
+        pairs, inverse = np.unique(pairs, return_inverse=True)
+        dots = np.bincount(inverse.ravel(), weights=products, minlength=len(pairs))
+
+        query, columns = pairs // self.size, pairs % self.size
+        others = columns != rows[query]
+        query, columns, dots = query[others], columns[others], dots[others]
+        return query, columns, dots / (self.norms[rows[query]] * self.norms[columns])
+
+    def dense_scores(self, rows):
+        """The same similarities as a `len(rows)` by `size` array, for blocks small enough to hold one."""
+        np = self.np
+        pairs, products = self._products(rows)
+        dots = np.bincount(pairs, weights=products, minlength=len(rows) * self.size).reshape(len(rows), self.size)
+        dots[np.arange(len(rows)), rows] = 0
+        return dots / np.outer(self.norms[rows], self.norms)
+
+    def neighbours(self, rows, k: int) -> List[dict]:
+        """The `movie_neighbour` rows of the `k` most similar movies of each given row, by score then id.
+
+        Only the scores up to the `k`-th best of their row can rank, so a partition per row keeps
+        those, ties included for the id tiebreak, and only they are sorted.
+        """
+        np = self.np
+        if len(rows) * self.size <= BLOCK_PRODUCTS:
+            scores = self.dense_scores(rows)
+            kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1] if k < self.size else np.zeros(len(rows))
+            query, columns = np.nonzero((scores > 0) & (scores >= kth[:, None]))
+            scores = scores[query, columns]
+        else:
+            query, columns, scores = self.scores(rows)
+            bounds = np.searchsorted(query, np.arange(len(rows) + 1))
+            kth = np.zeros(len(rows))
+            for position, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+                if end - start > k:
+                    kth[position] = np.partition(scores[start:end], end - start - k)[end - start - k]
+            kept = scores >= kth[query]
+            query, columns, scores = query[kept], columns[kept], scores[kept]
+
+        order = np.lexsort((self.movie_ids[columns], -scores, query))
+        query, columns, scores = query[order], columns[order], scores[order]
+        ranks = np.arange(len(query)) - np.searchsorted(query, query)
+        top = ranks < k
+
+        return [
+            {"movieId": int(movie_id), "rank": int(rank) + 1, "neighbourId": int(neighbour_id), "score": float(score)}
+            for movie_id, rank, neighbour_id, score in zip(
+                self.movie_ids[rows[query[top]]], ranks[top], self.movie_ids[columns[top]], scores[top]
+            )
+        ]
+
+
+# --------
+# Features
+# --------
+
+
+def feature_statement(user_id: int, exclude: Iterable[int] = (), sharing: Optional[Iterable[int]] = None):
+    """Select the `(movieId, kind, value)` features of a user's movies, leaving out the `exclude` movies.
+
+    With `sharing`, only the features of those movies are selected, for every movie that has
+    them: the posting lists their similarities are computed from.
+    """
+    exclude = list(exclude)
+    owned = [Movie.userId == user_id, *([Movie.id.not_in(exclude)] if exclude else [])]
+    directors = select(Movie.id.label("movieId"), literal("director").label("kind"), Movie.director.label("value"))
+    directors = directors.where(*owned)
+    if sharing is not None:
+        target = aliased(Movie)
+        directors = directors.where(Movie.director.in_(select(target.director).where(target.id.in_(list(sharing)))))
+
+    children = []
+    for model, kind, id_column in CHILD_FEATURES:
+        statement = select(model.movieId, literal(kind), cast(id_column, String))
+        if sharing is None:
+            statement = statement.join_from(model, Movie).where(*owned)
+        else:
+            # Driven by the postings of the shared features, each row checking its movie by primary
+            # key, rather than by every movie of the watchlist
+            target = aliased(model)
+            shared = select(getattr(target, id_column.key)).where(target.movieId.in_(list(sharing)))
+            statement = statement.where(
+                id_column.in_(shared), select(Movie.id).where(Movie.id == model.movieId, *owned).exists()
+            )
+        children.append(statement)
+    return union_all(directors, *children)
+
+
+def load_norms(movie_ids, movies):
+    """Norms of the feature vectors of the given sorted movie ids, counted in one statement.
+
+    `movies` selects the same ids. Every movie has one director; the children are counted per
+    kind, a repeated child counting once as in `load_features`.
+    """
+    import numpy as np
+
+    statement = union_all(
+        *(
+            select(model.movieId, literal(kind), func.count(distinct(id_column)))
+            .where(model.movieId.in_(movies))
+            .group_by(model.movieId)
+            for model, kind, id_column in CHILD_FEATURES
+        )
+    )
+    counts = db.session.execute(statement).all()
+    squares = np.full(len(movie_ids), FEATURE_WEIGHTS["director"] ** 2)
+    np.add.at(
+        squares,
+        np.searchsorted(movie_ids, np.array([movie_id for movie_id, _, _ in counts], dtype=np.int64)),
+        np.array([FEATURE_WEIGHTS[kind] ** 2 * count for _, kind, count in counts]),
+    )
+    return np.sqrt(squares)
+
+
+def load_features(user_id: int, exclude: Iterable[int] = (), sharing: Optional[Iterable[int]] = None) -> FeatureMatrix:
+    """Build the feature vectors of a user's movies, leaving out the `exclude` movies.
+
+    Without `sharing`, the whole watchlist is read in one statement. With it, only the movies
+    sharing a feature with the `sharing` movies are, along with the norms of their full
+    vectors: enough to score the `sharing` movies against every other, in two statements.
+    """
+    import numpy as np
+
+    exclude = list(exclude)
+    sharing = None if sharing is None else list(sharing)
+    statement = feature_statement(user_id, exclude, sharing)
+    features = db.session.execute(statement).all()
+
+    movie_ids = np.unique(np.array([movie_id for movie_id, _, _ in features], dtype=np.int64))
+    rows = np.searchsorted(movie_ids, np.array([movie_id for movie_id, _, _ in features], dtype=np.int64))
+    norms = None
+    if sharing is not None:
+        norms = load_norms(movie_ids, select(statement.cte("postings").c.movieId))
+    if not features:
+        return FeatureMatrix(movie_ids, rows, np.array([], dtype=np.int64), np.array([]), norms)
+
+    _, keys = np.unique(np.array([f"{kind}:{value}" for _, kind, value in features]), return_inverse=True)
+    keys = keys.ravel()
+    weights = np.array([FEATURE_WEIGHTS[kind] for _, kind, _ in features])
+    # A movie given the same tag twice still has it once
+    _, first = np.unique(rows * (int(keys.max()) + 1) + keys, return_index=True)
+    return FeatureMatrix(movie_ids, rows[first], keys[first], weights[first], norms)
+
+
+# ---------------
+# Neighbour index
+# ---------------
+
+
+def replace_neighbours(movie_ids: List[int], neighbours: List[dict]) -> int:
+    db.session.execute(delete(MovieNeighbour).where(MovieNeighbour.movieId.in_(movie_ids)))
+    if neighbours:
+        db.session.execute(insert(MovieNeighbour), neighbours)
+    return len(neighbours)
+
+
+def write_neighbours(matrix: FeatureMatrix, rows, k: int) -> int:
+    """Replace the neighbours of the given rows, a block at a time. Returns how many were written."""
+    return sum(
+        replace_neighbours([int(movie_id) for movie_id in matrix.movie_ids[block]], matrix.neighbours(block, k))
+        for block in matrix.blocks(rows)
+    )
+
+
+def merge_neighbours(matrix: FeatureMatrix, rows, k: int, movies, skip: Iterable[int] = ()) -> int:
+    """Merge the new scores of the given rows into the stored neighbours of the movies sharing their features.
+
+    A stored top `k` without any of the given movies stays right for the other movies, so the
+    given movies only have to be ranked into it: the lists are read and rewritten only for the
+    movies where one of them beats the stored `k`-th neighbour. `movies` selects the ids of the
+    matrix, and the `skip` movies are left out. Returns how many rows were written.
+    """
+    np = matrix.np
+    query, columns, scores = matrix.scores(rows)
+    sources, others = matrix.movie_ids[rows[query]], matrix.movie_ids[columns]
+    kept = ~np.isin(others, np.asarray(list(skip), dtype=np.int64))
+    sources, others, scores = sources[kept], others[kept], scores[kept]
+    if not len(others):
+        return 0
+
+    last = select(MovieNeighbour.movieId, MovieNeighbour.neighbourId, MovieNeighbour.score).where(
+        MovieNeighbour.rank == k, MovieNeighbour.movieId.in_(movies)
+    )
+    last = {movie_id: (-score, neighbour_id) for movie_id, neighbour_id, score in db.session.execute(last)}
+    entering = defaultdict(list)
+    for source, other, score in zip(sources.tolist(), others.tolist(), scores.tolist()):
+        if other not in last or (-score, source) < last[other]:
+            entering[other].append((source, score))
+
+    written = 0
+    movie_ids = sorted(entering)
+    for start in range(0, len(movie_ids), BLOCK_SIZE):
+        block = movie_ids[start : start + BLOCK_SIZE]
+        stored = select(MovieNeighbour.movieId, MovieNeighbour.neighbourId, MovieNeighbour.score)
+        for movie_id, neighbour_id, score in db.session.execute(stored.where(MovieNeighbour.movieId.in_(block))):
+            entering[movie_id].append((neighbour_id, score))
+        neighbours = [
+            {"movieId": movie_id, "rank": rank, "neighbourId": neighbour_id, "score": score}
+            for movie_id in block
+            for rank, (neighbour_id, score) in enumerate(
+                sorted(entering[movie_id], key=lambda neighbour: (-neighbour[1], neighbour[0]))[:k], start=1
+            )
+        ]
+        written += replace_neighbours(block, neighbours)
+    return written
+
+
+def update_neighbours(user_id: int, k: int, changed: Iterable[int] = (), removed: Iterable[int] = ()) -> int:
+    """Update the neighbour index after the features of the `changed` movies changed or the `removed` ones are deleted.
+
+    Only the changed movies and the movies that listed a changed or removed movie are
+    recomputed, from the posting lists of their features rather than the whole watchlist. The
+    other movies sharing a feature with a changed movie have its new score merged into their
+    stored lists. Call it before deleting the removed movies, whose rows it drops. The rows
+    change as part of the current transaction; committing is left to the caller. Returns how
+    many rows were written.
+    """
+    changed, removed = list(changed), list(removed)
+    if not changed and not removed:
+        return 0
+    listing = select(MovieNeighbour.movieId).where(MovieNeighbour.neighbourId.in_(changed + removed))
+    listing = set(db.session.execute(listing).scalars()) - set(removed)
+    if removed:
+        db.session.execute(
+            delete(MovieNeighbour).where(
+                or_(MovieNeighbour.movieId.in_(removed), MovieNeighbour.neighbourId.in_(removed))
+            )
+        )
+
+    recomputed = sorted((set(changed) | listing) - set(removed))
+    if not recomputed:
+        return 0
+    matrix = load_features(user_id, exclude=removed, sharing=recomputed)
+    written = write_neighbours(matrix, matrix.index_of(recomputed), k)
+    if changed:
+        movies = select(feature_statement(user_id, removed, recomputed).subquery().c.movieId)
+        written += merge_neighbours(matrix, matrix.index_of(changed), k, movies, skip=recomputed)
+    return written
+
+
+def rebuild_neighbours(k: int, user_id: Optional[int] = None) -> int:
+    """Recompute the neighbours of every movie of one user, or of every user. Returns how many were written."""
+    users = select(Movie.userId).distinct()
+    if user_id is not None:
+        users = users.where(Movie.userId == user_id)
+
+    written = 0
+    for owner in db.session.execute(users).scalars().all():
+        matrix = load_features(owner)
+        written += write_neighbours(matrix, matrix.np.arange(matrix.size), k)
+    # Rows of movies no user owns any more, or left behind by deletes outside the routes
+    orphans = delete(MovieNeighbour).where(MovieNeighbour.movieId.not_in(select(Movie.id)))
+    db.session.execute(orphans.execution_options(synchronize_session=False))
+    return written
+
+
+def similar_movies_statement(movie_id: int, limit: int):
+    """Select the neighbours of a movie in rank order: a range of the `movie_neighbour` primary key."""
+    return (
+        select(Movie.id, Movie.title, Movie.director, Movie.year, MovieNeighbour.score)
+        .join_from(MovieNeighbour, Movie, Movie.id == MovieNeighbour.neighbourId)
+        .where(MovieNeighbour.movieId == movie_id)
+        .order_by(MovieNeighbour.rank)
+        .limit(limit)
+    )
+
+
+def load_similar_movies(movie_id: int, limit: int) -> List:
+    return db.session.execute(similar_movies_statement(movie_id, limit)).all()
@@ -0,0 +1,232 @@
+import datetime
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, literal, or_, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+
+from webapp import db
+from webapp.models import Cast, Movie, Person, Tag, TagName, WatchlistStat
+from webapp.movie.queries import unique_lines
+
+# The counters of a user's statistics are `watchlist_stat` rows keyed by (kind, key):
+#
+#   movies    ""             every movie
+#   watched   "yes" / "no"   movies watched at least once, and the others
+#   rating    "0" to "5"     movies per rating, 0 being unrated
+#   decade    "1990"         movies per decade of release
+#   month     "2023-03"      movies last watched in the month; only the last watch of a movie is stored
+#   director, tag, actor     movies per director, tag and actor name; a movie counts once per name
+#
+# Write routes pass the keys a change adds and removes to `update_stats`, which adds the
+# difference to the counters; `rebuild_stats` recomputes them all from the movie tables.
+StatKey = Tuple[str, str]
+
+SUMMARY_KINDS = ("movies", "watched", "rating", "decade")
+TOP_KINDS = ("director", "tag", "actor")
+
+
+# --------------
+# Helper Classes
+# --------------
+
+
+@dataclass(frozen=True)
+class WatchlistStats:
+    """The statistics rendered by `stats.html`; the distributions are (label, count) pairs."""
+
+    movies: int
+    watched: int
+    ratings: Tuple[Tuple[str, int], ...]
+    decades: Tuple[Tuple[str, int], ...]
+    months: Tuple[Tuple[str, int], ...]
+    directors: Tuple[Tuple[str, int], ...]
+    tags: Tuple[Tuple[str, int], ...]
+    actors: Tuple[Tuple[str, int], ...]
+
+    @property
+    def unwatched(self) -> int:
+        return self.movies - self.watched
+
+
+# ------------
+# Stat updates
+# ------------
+
+
+def movie_stat_keys(movie) -> List[StatKey]:
+    """The keys a movie counts towards, its tags and cast aside."""
+    keys = [
+        ("movies", ""),
+        ("watched", "yes" if movie.last_seen else "no"),
+        ("rating", str(movie.rating or 0)),
+        ("decade", str(movie.year - movie.year % 10)),
+        ("director", movie.director),
+    ]
+    if movie.last_seen:
+        keys.append(("month", movie.last_seen.strftime("%Y-%m")))
+    return keys
+
+
+def child_stat_keys(cast: Iterable[str] = (), tags: Iterable[str] = (), series: Iterable[str] = ()) -> List[StatKey]:
+    """The keys of the children given to `insert_movie_children`, which skips the same empty and repeated lines.
+
+    Series are not part of the statistics.
+    """
+    return [("actor", name) for name in unique_lines(cast)] + [("tag", name) for name in unique_lines(tags)]
+
+
+def stored_child_stat_keys(movie_ids: Iterable[int]) -> List[StatKey]:
+    """The keys of the cast and tags stored for the given movies, selected in one statement.
+
+    Each name counts once per movie, even if a movie stores it more than once.
+    """
+    movie_ids = list(movie_ids)
+    statement = union_all(
+        select(Tag.movieId, literal("tag"), TagName.name).join_from(Tag, TagName).where(Tag.movieId.in_(movie_ids)),
+        select(Cast.movieId, literal("actor"), Person.name).join_from(Cast, Person).where(Cast.movieId.in_(movie_ids)),
+    )
+    return [(kind, name) for _, kind, name in set(db.session.execute(statement))]
+
+
+def update_stats(user_id: int, added: Iterable[StatKey] = (), removed: Iterable[StatKey] = ()) -> None:
+    """Add the difference between the `added` and `removed` keys to a user's counters, in one upsert.
+
+    The counters change as part of the current transaction; committing is left to the caller.
+    """
+    delta = Counter(added)
+    delta.subtract(removed)
+    rows = [
+        {"userId": user_id, "kind": kind, "key": key, "count": count} for (kind, key), count in delta.items() if count
+    ]
+    if not rows:
+        return
+
+    dialect_insert = postgresql.insert if db.engine.dialect.name == "postgresql" else sqlite.insert
+    statement = dialect_insert(WatchlistStat)
+    count = WatchlistStat.__table__.c["count"]
+    db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=["userId", "kind", "key"], set_={"count": count + statement.excluded["count"]}
+        ),
+        rows,
+    )
+
+
+# ----------
+# Stats page
+# ----------
+
+
+def month_keys(today: datetime.date, months: int) -> List[str]:
+    """The `months` months up to the one of `today`, oldest first."""
+    index = today.year * 12 + today.month - 1
+    return [f"{month // 12}-{month % 12 + 1:02d}" for month in range(index - months + 1, index + 1)]
+
+
+def load_stats(user_id: int, top: int = 10, months: int = 12) -> WatchlistStats:
+    """Read a user's statistics from the counters, with four statements whatever the size of the watchlist.
+
+    Directors, tags and actors keep their `top` most common names, and the watches cover the
+    last `months` months.
+    """
+    recent_months = month_keys(datetime.date.today(), months)
+    counters = {kind: {} for kind in SUMMARY_KINDS + ("month",)}
+    summary = select(WatchlistStat.kind, WatchlistStat.key, WatchlistStat.count).where(
+        WatchlistStat.userId == user_id,
+        WatchlistStat.count > 0,
+        or_(
+            WatchlistStat.kind.in_(SUMMARY_KINDS),
+            (WatchlistStat.kind == "month") & (WatchlistStat.key >= recent_months[0]),
+        ),
+    )
+    for kind, key, count in db.session.execute(summary):
+        counters[kind][key] = count
+
+    top_names = {}
+    for kind in TOP_KINDS:
+        statement = (
+            select(WatchlistStat.key, WatchlistStat.count)
+            .where(WatchlistStat.userId == user_id, WatchlistStat.kind == kind, WatchlistStat.count > 0)
+            .order_by(WatchlistStat.count.desc(), WatchlistStat.key)
+            .limit(top)
+        )
+        top_names[kind] = tuple((key, count) for key, count in db.session.execute(statement))
+
+    return WatchlistStats(
+        movies=counters["movies"].get("", 0),
+        watched=counters["watched"].get("yes", 0),
+        ratings=tuple(
+            (f"{rating} / 5" if rating else "Unrated", counters["rating"].get(str(rating), 0)) for rating in range(6)
+        ),
+        decades=tuple((f"{decade}s", count) for decade, count in sorted(counters["decade"].items())),
+        months=tuple((month, counters["month"].get(month, 0)) for month in recent_months),
+        directors=top_names["director"],
+        tags=top_names["tag"],
+        actors=top_names["actor"],
+    )
+
+
+# -------------
+# Stats rebuild
+# -------------
+
+
+def rebuild_stats(user_id: Optional[int] = None) -> int:
+    """Recompute the counters of one user, or of every user, from the movie tables. Returns how many were written.
+
+    The columns are read once and counted with NumPy: each (user, key) pair is encoded as one
+    integer, and `numpy.unique` counts the pairs of a kind in a single sort. Tags and actors are
+    read once per (user, movie, name), so a name stored twice on a movie still counts one movie.
+    """
+    import numpy as np
+
+    def columns(statement, count):
+        if user_id is not None:
+            statement = statement.where(Movie.userId == user_id)
+        rows = db.session.execute(statement).all()
+        return [np.array(column) for column in zip(*rows)] if rows else [np.array([])] * count
+
+    def counters(kind, users, keys):
+        if not len(keys):
+            return []
+        names, codes = np.unique(keys.astype(str), return_inverse=True)
+        pairs, counts = np.unique(users.astype(np.int64) * len(names) + codes.ravel(), return_counts=True)
+        owners, names = pairs // len(names), names[pairs % len(names)]
+        return [
+            {"userId": int(owner), "kind": kind, "key": str(name), "count": int(count)}
+            for owner, name, count in zip(owners, names, counts)
+        ]
+
+    users, years, ratings, directors, last_seen = columns(
+        select(Movie.userId, Movie.year, Movie.rating, Movie.director, Movie.last_seen), 5
+    )
+    watched = np.array([value is not None for value in last_seen], dtype=bool)
+    # Postgres returns aware datetimes, which NumPy does not take
+    seen = np.array([value.replace(tzinfo=None) for value in last_seen[watched]], dtype="datetime64[M]")
+    tag_users, _, tags = columns(
+        select(Movie.userId, Movie.id, TagName.name).distinct().join_from(Tag, Movie).join(TagName), 3
+    )
+    actor_users, _, actors = columns(
+        select(Movie.userId, Movie.id, Person.name).distinct().join_from(Cast, Movie).join(Person), 3
+    )
+
+    rows = [
+        *counters("movies", users, np.full(len(users), "")),
+        *counters("watched", users, np.where(watched, "yes", "no")),
+        *counters("rating", users, ratings),
+        *counters("decade", users, years - years % 10),
+        *counters("director", users, directors),
+        *counters("month", users[watched], seen.astype(str)),
+        *counters("tag", tag_users, tags),
+        *counters("actor", actor_users, actors),
+    ]
+
+    stale = delete(WatchlistStat)
+    if user_id is not None:
+        stale = stale.where(WatchlistStat.userId == user_id)
+    db.session.execute(stale)
+    if rows:
+        db.session.execute(insert(WatchlistStat), rows)
+    return len(rows)
@@ -0,0 +1,274 @@
+import csv
+import io
+import json
+import time
+from dataclasses import dataclass
+from itertools import groupby, islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from flask import current_app
+
+from webapp import db
+from webapp.models import Movie, Tag, Cast, Series, TagName, Person, SeriesName
+from webapp.movie.queries import bulk_insert_movie_children
+from webapp.movie.schemas import MovieImport
+from webapp.movie.search import reindex_movies
+
+
+# Column names used by Letterboxd and IMDb exports, mapped onto our own
+COLUMN_ALIASES = {
+    "name": "title",
+    "directors": "director",
+    "actors": "cast",
+    "genres": "tags",
+}
+LIST_SEPARATOR = "|"
+EXPORT_COLUMNS = [
+    "title",
+    "director",
+    "year",
+    "rating",
+    "last_seen",
+    "description",
+    "video_link",
+    "cast",
+    "tags",
+    "series",
+]
+EXPORT_MIMETYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+# --------------
+# Helper Classes
+# --------------
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return (self.imported + self.skipped) / self.seconds if self.seconds else 0.0
+
+
+# ----------------
+# Helper Functions
+# ----------------
+
+
+def detect_format(path: str) -> str:
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def read_watchlist_rows(path: str, file_format: Optional[str] = None) -> Iterator[Tuple[int, Dict]]:
+    """Yield `(line_number, row)` pairs from a CSV or JSONL file, one row at a time.
+
+    A JSONL line that does not decode is yielded as its `ValueError`, so that `import_watchlist`
+    skips it like any other invalid row instead of aborting the import.
+    """
+    file_format = file_format or detect_format(path)
+
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as error:
+                    yield line_number, error
+
+
+def split_list(value) -> List[str]:
+    """Children may be given as a JSON list or as a `|` separated string."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return value.split(LIST_SEPARATOR)
+    return [str(item) for item in value]
+
+
+def normalize_row(row) -> Dict:
+    if isinstance(row, ValueError):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError(f"expected an object, got {type(row).__name__}")
+    normalized = {}
+    for key, value in row.items():
+        if key is None:
+            continue
+        key = key.strip().lower()
+        normalized[COLUMN_ALIASES.get(key, key)] = value
+    return normalized
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# ------
+# Import
+# ------
+
+
+def import_watchlist(
+    rows: Iterable[Tuple[int, Dict]],
+    user_id: int,
+    batch_size: int = 500,
+    on_batch: Optional[Callable[[ImportResult], None]] = None,
+    on_skip: Optional[Callable[[int, ValueError], None]] = None,
+) -> ImportResult:
+    """Validate rows with `MovieImport` and save them in batches, one transaction per batch.
+
+    Only the current batch is held in memory: the session is cleared after every commit, so
+    importing a file costs the same memory whatever its size. Invalid rows are skipped and
+    reported to `on_skip`, or logged when no callback is given; so are lines that are not JSON
+    objects.
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+
+    for batch in batched(rows, batch_size):
+        movies = []
+        children = []
+        for line_number, row in batch:
+            try:
+                row = normalize_row(row)
+                movie_data = MovieImport(
+                    title=row.get("title"),
+                    director=row.get("director"),
+                    year=row.get("year"),
+                    rating=row.get("rating") or 0,
+                    last_seen=row.get("last_seen") or None,
+                    description=row.get("description") or "",
+                    video_link=row.get("video_link") or "",
+                )
+            except ValueError as error:
+                result.skipped += 1
+                if on_skip:
+                    on_skip(line_number, error)
+                else:
+                    current_app.logger.warning(f"Skipping line {line_number} of the watchlist import: {error}")
+                continue
+
+            movie = Movie(userId=user_id, **movie_data.dict(exclude={"rating", "last_seen"}))
+            movie.rating = movie_data.rating
+            movie.last_seen = movie_data.last_seen
+            movies.append(movie)
+            children.append((split_list(row.get("cast")), split_list(row.get("tags")), split_list(row.get("series"))))
+
+        if movies:
+            db.session.add_all(movies)
+            db.session.flush()
+            bulk_insert_movie_children(
+                (movie.id, cast, tags, series) for movie, (cast, tags, series) in zip(movies, children)
+            )
+            reindex_movies(movie.id for movie in movies)
+            db.session.commit()
+            db.session.expunge_all()
+            result.imported += len(movies)
+
+        result.seconds = time.perf_counter() - started
+        if on_batch:
+            on_batch(result)
+
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+# ------
+# Export
+# ------
+
+
+def _children_by_movie(model, column, user_id: int, chunk_size: int) -> Iterator[Tuple[int, List[str]]]:
+    """Stream `(movie_id, values)` pairs of one child table for a user's movies, in movie id order."""
+    rows = (
+        db.session.query(model.movieId, column)
+        .join(model.term)
+        .join(Movie, Movie.id == model.movieId)
+        .filter(Movie.userId == user_id)
+        .order_by(model.movieId, model.id)
+        .yield_per(chunk_size)
+    )
+    for movie_id, group in groupby(rows, key=lambda row: row[0]):
+        yield movie_id, [row[1] for row in group]
+
+
+def iter_watchlist_export(user_id: int, chunk_size: int = 1000) -> Iterator[Dict]:
+    """Yield a user's movies with their cast, tags and series, one record at a time.
+
+    The movies and each child table are read through server-side cursors ordered by movie id
+    and merged as they stream, so only `chunk_size` rows per cursor are held in memory.
+    """
+    movies = (
+        db.session.query(
+            Movie.id,
+            Movie.title,
+            Movie.director,
+            Movie.year,
+            Movie.rating,
+            Movie.last_seen,
+            Movie.description,
+            Movie.video_link,
+        )
+        .filter(Movie.userId == user_id)
+        .order_by(Movie.id)
+        .yield_per(chunk_size)
+    )
+    children = {
+        "cast": _children_by_movie(Cast, Person.name, user_id, chunk_size),
+        "tags": _children_by_movie(Tag, TagName.name, user_id, chunk_size),
+        "series": _children_by_movie(Series, SeriesName.name, user_id, chunk_size),
+    }
+    pending = {name: next(stream, None) for name, stream in children.items()}
+
+    for movie in movies:
+        record = dict(movie._mapping)
+        movie_id = record.pop("id")
+        record["last_seen"] = movie.last_seen.isoformat() if movie.last_seen else None
+
+        for name, stream in children.items():
+            while pending[name] is not None and pending[name][0] < movie_id:
+                pending[name] = next(stream, None)
+            if pending[name] is not None and pending[name][0] == movie_id:
+                record[name] = pending[name][1]
+                pending[name] = next(stream, None)
+            else:
+                record[name] = []
+
+        yield record
+
+
+def export_csv(records: Iterable[Dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+
+    for record in records:
+        for name in ("cast", "tags", "series"):
+            record[name] = LIST_SEPARATOR.join(record[name])
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_jsonl(records: Iterable[Dict]) -> Iterator[str]:
+    for record in records:
+        yield json.dumps(record) + "\n"
+
+
+EXPORT_WRITERS = {"csv": export_csv, "jsonl": export_jsonl}
@@ -0,0 +1,104 @@
+import re
+import threading
+import traceback
+from collections import Counter
+from contextlib import ContextDecorator
+from typing import List
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def statement_shape(statement: str) -> str:
+    """Reduce a statement to its shape, so statements differing only in their IN lists count as one."""
+    statement = re.sub(r"\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))*\s*\)", "(?)", statement)
+    return " ".join(statement.split())
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# ------------
+# Query budget
+# ------------
+
+
+class QueryBudget(ContextDecorator):
+    """Fail when the code it wraps runs more than `max_statements` SQL statements.
+
+    Used as a context manager or a decorator; only statements run by the current thread are
+    counted, so concurrent requests elsewhere in the process do not use up the budget.
+
+        with QueryBudget(3):
+            client.get("/movie/1")
+    """
+
+    def __init__(self, max_statements: int):
+        self.max_statements = max_statements
+        self.statements: List[str] = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread:
+            self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        self._thread = threading.get_ident()
+        event.listen(Engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(Engine, "before_cursor_execute", self._record)
+        if exc_type is None and len(self.statements) > self.max_statements:
+            listing = "\n".join(
+                f"  {number}. {statement_shape(statement)}" for number, statement in enumerate(self.statements, 1)
+            )
+            raise QueryBudgetExceeded(
+                f"{len(self.statements)} SQL statements run, the budget is {self.max_statements}:\n{listing}"
+            )
+        return False
+
+
+# ----------------
+# Repeated queries
+# ----------------
+
+
+def _count_statement_shapes(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or "statement_shapes" not in g:
+        return
+
+    shape = statement_shape(statement)
+    g.statement_shapes[shape] += 1
+    # Warn once per shape, when it first goes over the threshold
+    if g.statement_shapes[shape] == current_app.config["QUERY_REPEAT_THRESHOLD"] + 1:
+        current_app.logger.warning(
+            f"Possible N+1 query in {request.endpoint}: statement run more than"
+            f" {current_app.config['QUERY_REPEAT_THRESHOLD']} times in one request: {shape}\n"
+            + "".join(traceback.format_stack(limit=12)[:-1])
+        )
+
+
+class RepeatedQueryDetector:
+    """Warn, with the stack, when a statement shape runs more than `QUERY_REPEAT_THRESHOLD` times in a request.
+
+    Meant for development, where it points at queries issued from loops such as the dynamic
+    relationships of `Movie` iterated in a template.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if app.config["QUERY_REPEAT_THRESHOLD"] <= 0:
+            return
+
+        if not event.contains(Engine, "after_cursor_execute", _count_statement_shapes):
+            event.listen(Engine, "after_cursor_execute", _count_statement_shapes)
+        app.before_request(self._start_request)
+
+    def _start_request(self):
+        g.statement_shapes = Counter()